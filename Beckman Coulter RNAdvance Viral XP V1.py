@@ -30,6 +30,12 @@ metadata = {
 #USER DEFINED VALUES#
 #####################
 number_of_sample_columns = 12
+# CSV sample manifest (well,type,id with type sample, control or empty), see read_manifest;
+# when set only its occupied columns are processed and number_of_sample_columns is ignored
+sample_manifest = None
+# tip racks; 'opentrons_96_tiprack_300ul' (not filtered) takes 290 ul a trip after the air gap instead of 190 ul,
+# so large transfers need fewer trips, see TripPlan
+tip_rack_type = 'opentrons_96_filtertiprack_200ul'
 test_mode = False
 #####################
 #                   #
@@ -37,12 +43,36 @@ test_mode = False
 
 # import standard modules
 from collections import OrderedDict
+import csv
+from contextlib import contextmanager
+import math
 import time
 import numpy as np
 # import Opentrons modules
 from opentrons import labware, instruments, modules, robot, types
 
 
+def read_manifest(path):
+    """ Function returning the plate columns (0 to 11) holding a sample or a control in the sample manifest
+    at [path], a CSV file with a well,type,id header and a row per well, type being sample, control or empty.
+    Wells left out are empty; a column is processed if any of its wells is occupied """
+
+    columns = set()
+    with open(path, newline='') as manifest:
+        for row in csv.DictReader(manifest):
+            well = row['well'].strip().upper()
+            kind = row['type'].strip().lower()
+            if len(well) < 2 or well[0] not in 'ABCDEFGH' or not well[1:].isdigit() or not 1 <= int(well[1:]) <= 12:
+                raise Exception("Sample manifest {}: {} is not a well of the sample plate".format(path, well))
+            if kind not in ('sample', 'control', 'empty'):
+                raise Exception("Sample manifest {}: well {} has type {}, expected sample, control or empty".format(path, well, kind))
+            if kind != 'empty':
+                columns.add(int(well[1:]) - 1)
+    if not columns:
+        raise Exception("Sample manifest {} has no samples".format(path))
+    return sorted(columns)
+
+
 # magnetic module
 magdeck = modules.load('magdeck', '9')
 magdeck.disengage()
@@ -86,19 +116,37 @@ pcr_plate= labware.load(axy_plate, '1', 'fresh plate')
 sample_plate = labware.load(plate_name, '9', share=True)
 
 
-# instanciate tip rack in remaining slots
-tip_rack_1 = labware.load('opentrons_96_filtertiprack_200ul', '2')
-tip_rack_2 = labware.load('opentrons_96_filtertiprack_200ul','4')
-tip_rack_3 = labware.load('opentrons_96_filtertiprack_200ul','5')
-tip_rack_4 = labware.load('opentrons_96_filtertiprack_200ul', '7')
-tip_rack_5 = labware.load('opentrons_96_filtertiprack_200ul', '10')
-tip_rack_6 = labware.load('opentrons_96_filtertiprack_200ul', '11')
+# never ever remove the block below
+# unless you want the robot to pipette wells located beyond plate boundaries
+# crushing all your labware
+
+# also, when using a multi-channel pipette, make sure you are ALWAYS 
+# using well coordinates from first row (A1 to A12) of your 96-well plate
+# unless you want to spent countless hours re-calibrating your robot after
+# its arm collided on external walls
+
+if sample_manifest:
+    # only the columns the manifest fills, empty columns get no reagent, tips or mixing
+    sample_columns = read_manifest(sample_manifest)
+    robot.comment("Sample manifest {}: processing columns {}".format(
+        sample_manifest, ', '.join(str(c + 1) for c in sample_columns)))
+else:
+    if number_of_sample_columns > 12:
+        raise Exception("Please specify a valid number of sample columns.")
+    sample_columns = list(range(number_of_sample_columns))
+
 
-#these tips are mapped to the sample wells and are ONLY used for the wash steps
-tip_rack_ethanol_wash = labware.load('opentrons_96_filtertiprack_200ul', 3)
+# instanciate tip racks in remaining slots, as many as the run takes fresh tips from:
+# TIP_RACKS_NEEDED[n - 1] racks for n sample columns, the 'racks needed' of
+# python -m tools.tip_plan <this protocol> --table, to be run again after changing TIP_RULES
+TIP_RACK_SLOTS = ['2', '4', '5', '7', '10', '11']
+TIP_RACKS_NEEDED = [1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 2, 2]
 
+#these tips are mapped to the sample wells; tip_planner reuses each one for its own sample column only
+tip_rack_ethanol_wash = labware.load(tip_rack_type, 3)
 
-tips = [tip_rack_1, tip_rack_2, tip_rack_3, tip_rack_4, tip_rack_5, tip_rack_6] 
+
+tips = [labware.load(tip_rack_type, slot) for slot in TIP_RACK_SLOTS[:TIP_RACKS_NEEDED[len(sample_columns) - 1]]]
 
 
 # ## Instanciate pipette and set flow rate
@@ -111,41 +159,404 @@ m300.set_flow_rate(aspirate=150, dispense=150)
 
 NEW_TIP_MODE = 'never'
 
+# tip contamination rules, applied to every tip pick up by tip_planner
+# 'reagent': 'until_sample' returns a tip that has only touched one reagent to its rack and reuses it
+#            for that reagent until it contacts a sample; None drops it
+# 'sample': 'same_well' returns a tip that has touched a sample and reuses it for that sample column only,
+#           starting with the column's tip on tip_rack_ethanol_wash; None drops it
+# a reagent tip carried into a sample is not swapped, it becomes that column's tip; tips are only swapped
+# when the attached one would touch another reagent, sample column or eluate
+# 'eluate': 'same_well' returns a tip that has touched a column's eluate and reuses it for that eluate only;
+#           None drops it. Eluate tips come fresh from the tip racks, never from the column's sample tip
+TIP_RULES = {'reagent': 'until_sample',
+             'sample': 'same_well',
+             'eluate': None}
+
+# magnet settling times in seconds
+if test_mode:
+    BEAD_SETTLE_SECONDS = 5
+    WASH_SETTLE_SECONDS = 5
+else:
+    BEAD_SETTLE_SECONDS = 600
+    WASH_SETTLE_SECONDS = 120
+
+# incubation of each column after the beads and after the elution water go in, in seconds
+BINDING_SECONDS = 300
+ELUTION_SECONDS = 300
+
+# volume (ul) left in each trough well that the tips cannot reach
+TROUGH_DEAD_VOLUME = 100
+
+# trough aspirates follow the liquid level, this many mm under the surface left after the aspirate
+MENISCUS_FOLLOW_DEPTH = 3
+
+# estimated time to pick up a tip and park it over the plate, used by the run clock in simulation
+PREFETCH_TIP_SECONDS = 6
+
+# plunger start and stop per aspirate or dispense in seconds, as the repo's timing model charges it;
+# timed_mix plans its repetitions with it
+PLUNGER_OVERHEAD_SECONDS = 0.15
+
+# gantry speed profiles (mm/s, robot.head_speed axes; 'z' and 'a' are the left and right mount, m300 is on 'a'):
+# 'travel' for every move of an empty tip or of liquid held under an air gap, above the stock combined speed
+# of 400; 'liquid' slows only the mounts, for the tip's way down into the supernatant to its aspirate point
+# above a bead pellet and back up to the air gap (see TripPlan.remove), where a fast tip disturbs the pellet
+MOTION_PROFILES = {'travel': {'combined_speed': 600, 'x': 600, 'y': 400, 'z': 125, 'a': 125},
+                   'liquid': {'combined_speed': 600, 'x': 600, 'y': 400, 'z': 100, 'a': 100}}
+
 if test_mode:
     MIX_REPETITIONS = 2
-    MIX_REPETITIONS_WATER = 5
+    ELUTION_MIX_SECONDS = 5
 else:
     MIX_REPETITIONS = 10
-    MIX_REPETITIONS_WATER = 180
+    # about what the former 180 repetitions of 20 ul took
+    ELUTION_MIX_SECONDS = 90
+
+# how timed_mix moves the liquid for a reagent's 'mix_seconds': flow rates (ul/s) ramping from the first
+# to the second, the tip sweeping 'heights' (mm above the bottom, None: where m300.mix puts it) in 'stages'
+ELUTION_MIX_PROFILE = {'flow_rates': (200, 200), 'heights': None, 'stages': 1}
 
 reagents = OrderedDict()
 
+# 'add_then_mix': True dispenses the reagent into all columns from above with a single tip,
+# then mixes each column with a fresh tip (fewer trough round-trips; see add_reagent)
+# 'wells': trough columns the reagent may be loaded into, filled in order as far as needed (see ReagentLedger)
+# 'elutes': True for the reagent the RNA is eluted into; its mixes take eluate tips (see TIP_RULES)
 
 
 #  350 μl of silica-coated magnetic beads
-reagents['magnetic_beads'] = {'well': 'A12', 
+reagents['magnetic_beads'] = {'wells': ['A12', 'A11', 'A10'], 
                               'transfer_volume': 350, 
                               'mix_volume': 100, 
                               'mix_repetitions': MIX_REPETITIONS,
-                              'new_tip': NEW_TIP_MODE}
+                              'new_tip': NEW_TIP_MODE,
+                              'add_then_mix': False,
+                              'elutes': False}
 
 
 # 40 µl of nuclease-free water 
-reagents['nuclease_free_water'] = {'well': 'A5', 
+reagents['nuclease_free_water'] = {'wells': ['A5'], 
                                    'transfer_volume': 40, 
                                    'mix_volume': 20, 
-                                   'mix_repetitions': MIX_REPETITIONS_WATER,
-                                   'new_tip': NEW_TIP_MODE}
+                                   'mix_seconds': ELUTION_MIX_SECONDS,
+                                   'mix_profile': ELUTION_MIX_PROFILE,
+                                   'new_tip': NEW_TIP_MODE,
+                                   'add_then_mix': True,
+                                   'elutes': True}
 
 
 # reagents setup
 
 for reagent_name in reagents:
-    reagents[reagent_name]['setup'] = trough.wells(reagents[reagent_name]["well"])
+    reagents[reagent_name]['name'] = reagent_name
 
 
 # Define custom functions
 
+class RunClock:
+    """ Clock for loops and waits that must last a set time. On the robot it reads the real elapsed time;
+    in simulation nothing takes time, so it follows the simulator's estimate of the commands issued so far
+    where there is one (robot.estimated_time() of the repo's tools), else virtual time advanced by the
+    estimated duration of each action. A 'repeat until T minutes' loop then stops on time in all cases
+    and simulates in milliseconds """
+
+    def __init__(self):
+        self.simulating = robot.is_simulating()
+        self.estimated_time = getattr(robot, 'estimated_time', None) if self.simulating else None
+        self.virtual_time = 0.0
+
+    def now(self):
+        """ seconds on the run clock """
+        if not self.simulating:
+            return time.monotonic()
+        if self.estimated_time is not None:
+            return self.estimated_time()
+        return self.virtual_time
+
+    def advance(self, seconds):
+        """ account for an action estimated to take [seconds]; real time already passes on the robot,
+        and the simulator's estimate already counts the commands issued """
+        if self.simulating and self.estimated_time is None:
+            self.virtual_time += seconds
+
+
+run_clock = RunClock()
+
+
+class IncubationTimer:
+    """ Incubation of [seconds] counted per sample column: stamp() each column as its reagent goes in, and
+    wait() only until the column stamped last has incubated [seconds]. The columns before it incubate for
+    longer, as they did behind a plate-wide delay after the last column, but the time spent mixing after
+    the last addition counts towards the incubation instead of being waited again """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.stamps = {}
+
+    def stamp(self, s):
+        """ Function noting that the incubation of sample well [s] starts now """
+
+        self.stamps[s] = run_clock.now()
+
+    def wait(self):
+        """ Function delaying until every stamped column has incubated for [seconds] """
+
+        remaining = self.seconds
+        if self.stamps:
+            remaining -= run_clock.now() - max(self.stamps.values())
+        robot.comment("Incubation of {} column(s): {:.0f} of {} seconds left".format(
+            len(self.stamps), max(remaining, 0), self.seconds))
+        if remaining > 0:
+            m300.delay(seconds=remaining)
+            run_clock.advance(remaining)
+
+
+class PlateMap:
+    """ Index of the sample columns, built once per run instead of parsing str(well) in every loop.
+    [samples] are wells of row A: sample i is plate column columns[i] (from [columns], by default the first
+    columns in order) and belongs to trough group groups[i], [group_size] samples sharing a trough well.
+    Every labware passed in [mapped] gets the well in the same column for each sample, e.g. the sample's
+    own tip or its elution well """
+
+    def __init__(self, samples, group_size=4, columns=None, **mapped):
+        self.samples = samples
+        order = np.arange(len(samples))
+        self.columns = order if columns is None else np.array(columns)
+        self.groups = order // group_size
+        self.first_in_group = order % group_size == 0
+        self.index = {s: i for i, s in enumerate(samples)}
+        self.wells = {}
+        for name, plate in mapped.items():
+            row = plate.rows('A')
+            self.wells[name] = [row[int(c)] for c in self.columns]
+
+    def column(self, s):
+        """ plate column (0 to 11) of sample well [s] """
+        return int(self.columns[self.index[s]])
+
+    def group(self, s):
+        """ trough group of sample well [s] """
+        return int(self.groups[self.index[s]])
+
+    def starts_group(self, s):
+        """ True if sample well [s] is the first column served by its trough well """
+        return bool(self.first_in_group[self.index[s]])
+
+    def well(self, name, s):
+        """ the well of the [name] labware in the column of sample well [s] """
+        return self.wells[name][self.index[s]]
+
+
+class ReagentLedger:
+    """ Volume ledger of the [trough] wells. reserve() assigns the transfer of a reagent to each sample to the
+    first of the reagent's 'wells' that can still hold it on top of [dead_volume], so a run only loads the
+    wells and volumes it needs; report() tells the operator how much to load where. During the run draw()
+    debits every aspirate, stops the run before a well is drawn below its dead volume and follows the
+    liquid level down: the tip goes [follow_depth] mm under the surface left after the aspirate instead of
+    to the bottom of the well, never lower than [min_height] """
+
+    def __init__(self, trough, dead_volume, follow_depth, min_height=0.6):
+        self.trough = trough
+        self.dead_volume = dead_volume
+        self.follow_depth = follow_depth
+        self.min_height = min_height
+        self.loaded = OrderedDict()   # trough well -> volume to load, dead volume included
+        self.left = {}                # trough well -> volume left
+        self.names = {}               # trough well -> (well name, reagent name)
+        self.sources = {}             # (reagent name, sample well) -> trough well
+
+    def reserve(self, reagent, samples):
+        """ Function assigning a trough well to the [reagent] transfer of each of [samples] """
+
+        for s in samples:
+            for name in reagent['wells']:
+                well = self.trough.wells(name)
+                if self.names.setdefault(well, (name, reagent['name']))[1] != reagent['name']:
+                    raise Exception("Trough well {} is listed for two reagents".format(name))
+                volume = self.loaded.get(well, self.dead_volume) + reagent['transfer_volume']
+                if volume <= well.max_volume():
+                    break
+            else:
+                raise Exception("Not enough trough wells for {} to {} samples".format(reagent['name'], len(samples)))
+            self.loaded[well] = volume
+            self.left[well] = volume
+            self.sources[(reagent['name'], s)] = well
+
+    def source(self, reagent, s):
+        """ Function returning the trough well serving [reagent] to sample well [s] """
+
+        return self.sources[(reagent['name'], s)]
+
+    def height(self, well):
+        """ Function returning the liquid height (mm) left in trough [well]: the volume left over the cross
+        section of a well of the labware.create diameter, at most the well's depth """
+
+        radius = well.properties['diameter'] / 2
+        return min(well.properties['depth'], self.left[well] / (math.pi * radius ** 2))
+
+    def draw(self, well, volume):
+        """ Function debiting [volume] from trough [well] and returning where to aspirate it """
+
+        self.left[well] -= volume
+        if self.left[well] < self.dead_volume - 1e-6:
+            raise Exception("Trough well {} ({}) is drawn below its dead volume".format(*self.names[well]))
+        return well.bottom(max(self.min_height, self.height(well) - self.follow_depth))
+
+    def report(self):
+        """ Function telling the operator how much to load into each trough column """
+
+        for well, volume in self.loaded.items():
+            name, reagent_name = self.names[well]
+            robot.comment("Load {:.0f} ul of {} into each well of trough column {}".format(volume, reagent_name, name[1:]))
+
+
+class TipPlanner:
+    """ Picks up, returns and drops the tips of [pipette] following [rules] (see TIP_RULES).
+    Each step declares what the tip is about to touch with get_tip(reagent=...), get_tip(sample=...) or
+    get_tip(eluate=...).
+    The attached tip is kept if the rules allow it: a tip is only swapped when it would touch another reagent,
+    sample column or eluate, and a tip that has only touched reagent enters a sample without a swap, it is then
+    that sample column's tip. Otherwise it is returned to its rack if it may be reused later, or dropped, and an
+    allowed tip is picked up: one parked for the same reagent or sample column, else the next tip from the
+    pipette's tip racks.
+    With rules['sample'] == 'same_well' the 'tips' mapped by [plate_map] start parked as clean tips of their
+    sample columns; a column's clean tip also serves a reagent about to be carried into that column, declared
+    with get_tip(reagent=..., into=well).
+    A column's eluate is never touched by its sample tip """
+
+    def __init__(self, pipette, rules, plate_map):
+        self.pipette = pipette
+        self.rules = rules
+        self.plate_map = plate_map
+        self.reagent = None     # reagent touched by the attached tip
+        self.sample = None      # ('sample', column) or ('eluate', column) touched by the attached tip
+        self.parked = {}        # ('reagent', name), ('clean' or 'sample' or 'eluate', column) -> tip well
+        if rules['sample'] == 'same_well' and 'tips' in plate_map.wells:
+            for column, tip in zip(plate_map.columns, plate_map.wells['tips']):
+                self.parked[('clean', int(column))] = tip
+
+    def get_tip(self, reagent=None, sample=None, eluate=None, into=None):
+        """ Function making sure the attached tip may touch [reagent] (a reagent name), [sample] (a sample well)
+        or the [eluate] in a sample well. [into] is the sample well a [reagent] tip is about to enter """
+
+        if eluate is not None:
+            key = ('eluate', self.plate_map.column(eluate))
+        elif sample is not None:
+            key = ('sample', self.plate_map.column(sample))
+        else:
+            key = ('reagent', reagent)
+
+        if self.pipette.tip_attached:
+            if self.sample is not None:
+                if key == self.sample:
+                    return
+            elif key[0] == 'reagent':
+                if self.reagent in (None, reagent):
+                    self.reagent = reagent
+                    return
+            else:
+                # a tip that has only touched reagent may enter a sample, it then belongs to that sample
+                # instead of the tip parked for it
+                self.parked.pop(key, None)
+                self.sample = key
+                return
+
+        tip = self.parked.pop(key, None)
+        well = sample if sample is not None else into
+        if tip is None and eluate is None and well is not None:
+            # the column's clean tip, for its sample or for a reagent about to enter it
+            tip = self.parked.pop(('clean', self.plate_map.column(well)), None)
+        self.release()
+        self.pipette.pick_up_tip(tip)
+        self.reagent = reagent
+        self.sample = key if key[0] != 'reagent' else None
+
+    def release(self):
+        """ Function returning the attached tip to its rack if the rules let it be reused, otherwise dropping it """
+
+        if not self.pipette.tip_attached:
+            return
+        if self.sample is not None:
+            key, reusable = self.sample, self.rules.get(self.sample[0]) == 'same_well'
+        else:
+            key, reusable = ('reagent', self.reagent), self.rules['reagent'] == 'until_sample'
+
+        if reusable and key[1] is not None:
+            self.parked[key] = self.pipette.current_tip()
+            self.pipette.return_tip()
+        else:
+            self.pipette.drop_tip()
+        self.reagent = None
+        self.sample = None
+
+
+class MotionProfiles:
+    """ Gantry speed profiles applied through robot.head_speed. A step declares the profile it needs with
+    motion(name), as a decorator or a with-block, and the previous profile is restored after it """
+
+    def __init__(self, profiles, default):
+        self.profiles = profiles
+        self.current = None
+        self.use(default)
+
+    def use(self, name):
+        """ Function setting the head speeds of profile [name] """
+        if name != self.current:
+            robot.head_speed(**self.profiles[name])
+            self.current = name
+
+    @contextmanager
+    def __call__(self, name):
+        previous = self.current
+        self.use(name)
+        try:
+            yield
+        finally:
+            self.use(previous)
+
+
+motion = MotionProfiles(MOTION_PROFILES, 'travel')
+
+
+def settle_beads(seconds, tasks=()):
+    """ Function to engage the magdeck and let the beads settle for [seconds] while running [tasks],
+    a list of (function, estimated seconds) pairs that must not touch the sample plate. The steps only pass
+    prefetch_tip: the trough reagents left at a settle need no resuspending and the next liquid may not be
+    held in the tip that then removes the supernatant, so a tip pick up is their only plate-independent work.
+    The seconds the tasks took out of the settle time, the time they save the run, go to the run log.
+    Only returns once the magnet has been on for [seconds], so the next supernatant aspirate
+    always sees settled beads """
+
+    robot.comment("Activating magdeck for {} seconds".format(seconds))
+    magdeck.engage(height=12)
+    engaged_at = run_clock.now()
+
+    for task, estimated_seconds in tasks:
+        task()
+        run_clock.advance(estimated_seconds)
+    if tasks:
+        robot.comment("Settle tasks took {:.0f} of the {} seconds".format(run_clock.now() - engaged_at, seconds))
+
+    remaining = seconds - (run_clock.now() - engaged_at)
+    if remaining > 0:
+        m300.delay(seconds=remaining)
+        run_clock.advance(remaining)
+
+
+def prefetch_tip(over, eluate=False):
+    """ Returns a settle task that gets the tip [tip_planner] allows for the [over] sample well (or its eluate)
+    and parks it above the well, ready for the first aspirate """
+
+    def task():
+        if eluate:
+            tip_planner.get_tip(eluate=over)
+        else:
+            tip_planner.get_tip(sample=over)
+        m300.move_to(over.top(20), strategy='arc')
+
+    return (task, PREFETCH_TIP_SECONDS)
+
+
 def mix_wells(mix_locations, mix_reps):
     """ Function to mix [mix_locations] thoroughly by aspirating/rejecting liquid at different heights in a well,
     performed [mix_reps] times """
@@ -169,6 +580,33 @@ def mix_wells(mix_locations, mix_reps):
         m300.move_to(well.top(20), strategy='arc')
     m300.set_flow_rate(aspirate=150, dispense=150)
 
+
+def timed_mix(well, seconds, volume, flow_rates=(150, 150), heights=None, stages=1):
+    """ Function to mix [well] with [volume] ul strokes for about [seconds] instead of a set number of
+    repetitions. The time is split into [stages] of equal length: the flow rate (aspirate and dispense, ul/s)
+    ramps linearly from flow_rates[0] to flow_rates[1] over them and the height above the bottom sweeps from
+    heights[0] to heights[1] (mm; None mixes where m300.mix puts the tip in [well]). Each stage gets the
+    repetitions of its plunger time that fit its share, at least one, so a mix never runs over by more than
+    its moves. Reports and returns the seconds the mix took by the run clock """
+
+    started = run_clock.now()
+    strokes = 0
+    for stage in range(stages):
+        fraction = stage / (stages - 1) if stages > 1 else 0.0
+        rate = flow_rates[0] + (flow_rates[1] - flow_rates[0]) * fraction
+        location = well if heights is None else well.bottom(heights[0] + (heights[1] - heights[0]) * fraction)
+        repetition = 2 * (volume / rate + PLUNGER_OVERHEAD_SECONDS)
+        reps = max(1, int(seconds / stages / repetition))
+        m300.set_flow_rate(aspirate=rate, dispense=rate)
+        m300.mix(reps, volume, location)
+        run_clock.advance(reps * repetition)
+        strokes += reps
+
+    took = run_clock.now() - started
+    robot.comment("Mixed column {} for {:.0f} of {} seconds: {} repetitions of {} ul".format(
+        plate_map.column(well) + 1, took, seconds, strokes, volume))
+    return took
+
 def resuspend(well_to_mix):
     """ Function to resuspend contents of [well_to_mix] by pipetting liquid up and down while gradually descending into the well """
 
@@ -182,7 +620,6 @@ def resuspend(well_to_mix):
         # then aspirate and reject
 
     for position in np.arange(1.2,0.4, -0.2):
-        print(position)
         m300.aspirate(volume=150, location=well_to_mix.top(-5), rate=1.0)
         m300.mix(5, 50, location=well_to_mix.bottom(position))
         m300.dispense(volume=150, location=well_to_mix.top(-5), rate=1.0)
@@ -202,7 +639,6 @@ def resuspendLITE(well_to_mix):
         # then aspirate and reject
 
     for position in np.arange(0.8,0.4, -0.2):
-        print(position)
         m300.aspirate(volume=150, location=well_to_mix.top(-5), rate=1.0)
         m300.mix(5, 50, location=well_to_mix.bottom(position))
         m300.dispense(volume=150, location=well_to_mix.top(-5), rate=1.0)
@@ -210,55 +646,180 @@ def resuspendLITE(well_to_mix):
     m300.move_to(well_to_mix.top(20), strategy='arc')
         
 
-def transfer_and_mix(reagent, samples):
-    """ Custom function to transfer [reagent] from correct source wells to [samples] & mix """
-    
+def tip_capacity():
+    """ Function returning the volume [m300] can hold with a tip from [tips] """
+
+    return min(m300.max_volume, tips[0].wells('A1').max_volume())
+
+
+class TripPlan:
+    """ Moves transfers too large for one tip in the fewest trips of even volume. Besides its share of the
+    liquid a trip holds the [air_gap] and [disposal] ul of spare liquid, so at most [capacity] - air_gap -
+    disposal ul; m300.transfer on its own fills the tip and halves the rest instead (650 ul with 200 ul tips:
+    190 + 190 + 135 + 135 ul), aspirating the last trips short. add() names a transfer of the run for report() """
+
+    def __init__(self, capacity, air_gap=10, disposal=0):
+        self.capacity = capacity
+        self.air_gap = air_gap
+        self.disposal = disposal
+        self.transfers = OrderedDict()     # name -> volume, for report()
+
+    def trips(self, volume):
+        """ Function returning the volumes of the trips moving [volume] ul """
+
+        room = self.capacity - self.air_gap - self.disposal
+        if room <= 0:
+            raise Exception("A {} ul air gap and {} ul disposal volume leave no room in {} ul tips".format(self.air_gap, self.disposal, self.capacity))
+        count = max(1, int(math.ceil(round(volume / room, 6))))
+        return [volume / count] * count
+
+    def add(self, name, volume):
+        self.transfers[name] = volume
+
+    def report(self):
+        """ Function telling the operator the trips of each transfer added """
+
+        for name, volume in self.transfers.items():
+            trips = self.trips(volume)
+            robot.comment("{}: {} ul in {} trip{} of {:.1f} ul ({} ul tips, {} ul air gap)".format(
+                name, volume, len(trips), 's' if len(trips) > 1 else '', trips[0], self.capacity, self.air_gap))
+
+    def transfer(self, volume, source, dest, **kwargs):
+        """ Function transferring [volume] from [source] to [dest] in trips(); [kwargs] (new_tip, blow_out, ...)
+        go to the m300.transfer of every trip """
+
+        kwargs.setdefault('new_tip', 'never')
+        for trip in self.trips(volume):
+            m300.transfer(trip, source, dest, air_gap=self.air_gap, **kwargs)
+
+    def remove(self, volume, well, height, dest, location, blow_out=False):
+        """ Function moving [volume] from [height] mm above the bottom of [well], over a bead pellet, to [location]
+        in [dest] in trips(), as transfer() would. Only the way down to the aspirate and back up to the air gap
+        runs at the 'liquid' motion profile; the moves to and from [dest] keep the current one """
+
+        for trip in self.trips(volume):
+            m300.move_to(well.top())
+            with motion('liquid'):
+                m300.aspirate(trip, well.bottom(height))
+                m300.air_gap(self.air_gap)
+            m300.dispense(self.air_gap, dest.top(5))
+            m300.dispense(trip, location)
+            if blow_out:
+                m300.blow_out()
+
+
+def add_reagent(reagent, samples, sourcewells, prepare_source=None, timer=None):
+    """ Custom function to dispense [reagent] contact-free from above (top(-10)) into all [samples] with one tip.
+    [sourcewells] gives the source well of each sample; consecutive samples sharing a source are served
+    by one aspirate, as many as fit in the tip with the 10ul air gap. [prepare_source](sourcewell, first sample)
+    is called before each aspirate, e.g. to resuspend beads. The tip never touches sample liquid, so
+    [tip_planner] may reuse it for the same reagent. [timer] (an IncubationTimer) is stamped for each sample
+    as the reagent goes in """
+
+    per_aspirate = max(1, int((tip_capacity() - 10) // reagent['transfer_volume']))
+
+    groups = []
+    for s, sourcewell in zip(samples, sourcewells):
+        if groups and groups[-1][0] is sourcewell and len(groups[-1][1]) < per_aspirate:
+            groups[-1][1].append(s)
+        else:
+            groups.append((sourcewell, [s]))
+
+    for sourcewell, group in groups:
+        tip_planner.get_tip(reagent=reagent['name'])
+        if prepare_source is not None:
+            prepare_source(sourcewell, group[0])
+
+        aspirate_location = reagent_ledger.draw(sourcewell, reagent['transfer_volume']*len(group))
+        if len(group) == 1:
+            #Air gap of 10ul to help avoid dripping
+            trip_plan.transfer(reagent['transfer_volume'], aspirate_location, group[0].top(-10))
+            if timer is not None:
+                timer.stamp(group[0])
+        else:
+            m300.aspirate(reagent['transfer_volume']*len(group), aspirate_location)
+            m300.air_gap(10)
+            for s in group:
+                m300.dispense(reagent['transfer_volume'] + (10 if s is group[0] else 0), s.top(-10))
+                if timer is not None:
+                    timer.stamp(s)
+        m300.blow_out(group[-1].top(-10))
+
+
+def transfer_and_mix(reagent, samples, timer=None):
+    """ Custom function to transfer [reagent] from correct source wells to [samples] & mix.
+    With reagent['add_then_mix'] the reagent is first added to all samples with one tip (add_reagent),
+    then each sample is mixed. Tips are chosen by [tip_planner]; [timer] is stamped as each sample gets the reagent.
+    A reagent with 'mix_seconds' is mixed for that long per sample with its 'mix_profile' (timed_mix) """
+
+    if reagent['add_then_mix']:
+        add_reagent(reagent, samples, [reagent_ledger.source(reagent, s) for s in samples], timer=timer)
+
     for s in samples:
 
-        if not m300.tip_attached:
-            m300.pick_up_tip()
-            
-        #Air gap of 10ul to help avoid dripping
-        m300.transfer(reagent['transfer_volume'], reagent['setup'].bottom(0.6), s.top(-10), new_tip=reagent['new_tip'], air_gap=10)
+        if not reagent['add_then_mix']:
+            tip_planner.get_tip(reagent=reagent['name'], into=s)
+            sourcewell = reagent_ledger.source(reagent, s)
+            aspirate_location = reagent_ledger.draw(sourcewell, reagent['transfer_volume'])
+            #Air gap of 10ul to help avoid dripping
+            trip_plan.transfer(reagent['transfer_volume'], aspirate_location, s.top(-10), new_tip=reagent['new_tip'])
+            if timer is not None:
+                timer.stamp(s)
+        if reagent['elutes']:
+            tip_planner.get_tip(eluate=s)
+        else:
+            tip_planner.get_tip(sample=s)
         m300.set_flow_rate(aspirate=200, dispense=200)
         aspirate_volume = 200-reagent['mix_volume']
         m300.aspirate(volume=aspirate_volume, location=s.top(10), rate=1.0)
-        m300.mix(reagent['mix_repetitions'], reagent['mix_volume'], s)
+        if 'mix_seconds' in reagent:
+            timed_mix(s, reagent['mix_seconds'], reagent['mix_volume'], **reagent['mix_profile'])
+        else:
+            m300.mix(reagent['mix_repetitions'], reagent['mix_volume'], s)
         m300.dispense(volume=aspirate_volume, location=s.top(10), rate=1.0)
         m300.blow_out()
         m300.set_flow_rate(aspirate=150, dispense=150)
-        m300.drop_tip()
 
-def transfer_and_mixBeads(reagent, samples):
+# trough wells whose beads have had the thorough resuspend
+resuspended_bead_wells = set()
+
+def resuspend_beads(sourcewell, s):
+    """ Function to resuspend the beads in [sourcewell] before they are transferred to [s];
+    resuspends thoroughly on the first draw from each trough well the ledger serves beads from,
+    lightly on the draws after it """
+
+    if sourcewell not in resuspended_bead_wells:
+        resuspended_bead_wells.add(sourcewell)
+        resuspend(sourcewell)
+    else:
+        resuspendLITE(sourcewell)
+
+def transfer_and_mixBeads(reagent, samples, timer=None):
     """ Custom function to transfer [Beads] from correct source wells to [samples] & mix 
-    (where [Beads] = [reagent])"""
+    (where [Beads] = [reagent]); reagent['add_then_mix'] and [timer] as in transfer_and_mix"""
     
+    if reagent['add_then_mix']:
+        add_reagent(reagent, samples, [reagent_ledger.source(reagent, s) for s in samples], prepare_source=resuspend_beads, timer=timer)
+
     for s in samples:
 
-        well_code = str(s).split(" ")[-1][:-1]
-        if well_code in ['A1','A2','A3','A4']:
-            sourcewell = trough.wells('A12')
-        elif well_code in ['A5','A6','A7','A8']:
-            sourcewell = trough.wells('A11')
-        elif well_code in ['A9','A10','A11','A12']:
-            sourcewell = trough.wells('A10')
+        sourcewell = reagent_ledger.source(reagent, s)
 
-        if not m300.tip_attached:
-            m300.pick_up_tip()
+        if not reagent['add_then_mix']:
+            tip_planner.get_tip(reagent=reagent['name'], into=s)
+            #Resuspends the beads before each transfer
+            resuspend_beads(sourcewell, s)
+            aspirate_location = reagent_ledger.draw(sourcewell, reagent['transfer_volume'])
 
-        #Resuspends the beads before each transfer; resuspends more thoroughly every 4 transfers.
-        if well_code in ['A1', 'A5', 'A9']:
-            resuspend(sourcewell)
-        else:
-            resuspendLITE(sourcewell)
-
-        #Air gap of 10ul to help avoid dripping
-        m300.transfer(reagent['transfer_volume'], sourcewell.bottom(0.6), s.top(-10), new_tip=reagent['new_tip'], air_gap=10)
+            #Air gap of 10ul to help avoid dripping
+            trip_plan.transfer(reagent['transfer_volume'], aspirate_location, s.top(-10), new_tip=reagent['new_tip'])
+            if timer is not None:
+                timer.stamp(s)
+        tip_planner.get_tip(sample=s)
         m300.set_flow_rate(aspirate=200, dispense=200)
         m300.mix(reagent['mix_repetitions'], reagent['mix_volume'], s)
         m300.blow_out()
         m300.set_flow_rate(aspirate=150, dispense=150)
-        m300.drop_tip()
 
 
         
@@ -266,18 +827,20 @@ def trash_supernatant(volume, height, samples):
     """ function to remove [volume in ul] of supernatant from [samples], pipetting [height] units from the bottom of the well"""
     
     for s in samples:
-        m300.pick_up_tip()
-        if volume <=190:
+        tip_planner.get_tip(sample=s)
+        # a single trip takes 10 ul of air ahead of the supernatant, pushed out after the blow out
+        leading_air = len(trip_plan.trips(volume)) == 1
+        if leading_air:
             m300.aspirate(volume=10, location=s.top(10), rate=1.0)
-        m300.transfer(volume, s.bottom(height), m300.trash_container.top(5), new_tip='never', air_gap=10, blow_out = True)
+        trip_plan.remove(volume, s, height, m300.trash_container, m300.trash_container.top(5), blow_out = True)
         # extra blowout:
         m300.delay(seconds = 1)
-        m300.dispense(10)
+        if leading_air:
+            m300.dispense(10)
         m300.delay(seconds = 1)
         # transfer function tends to eject a small volume of air after all liquid is trashed
         # which forms bubbles and may lead to cross contaminations (does not happen with all liquids
         # Keep eyes peeled at this stage)
-        m300.drop_tip()
                 
         
 def text_in_a_box(line,border_char="#"):
@@ -290,6 +853,12 @@ def text_in_a_box(line,border_char="#"):
     return(new_text)
 
 
+def start_step(name):
+    """ function announcing step [name] in the run log; tools.timeline splits a run into steps at these comments """
+
+    robot.comment("Step: {}".format(name))
+
+
 
 # IMPORTANT REMARKS
 
@@ -297,39 +866,43 @@ def text_in_a_box(line,border_char="#"):
 # Consequently the robot is still a danger to itself 
 # and has pronounced taste for self-destruction
 
-# never ever remove the block below
-# unless you want the robot to pipette wells located beyond plate boundaries
-# crushing all your labware
 
-# also, when using a multi-channel pipette, make sure you are ALWAYS 
-# using well coordinates from first row (A1 to A12) of your 96-well plate
-# unless you want to spent countless hours re-calibrating your robot after
-# its arm collided on external walls
+samples = [sample_plate.rows('A')[c] for c in sample_columns]
 
-if number_of_sample_columns > 12:
-    raise Exception("Please specify a valid number of sample columns.")
-    
+# sample columns and their own tip, ethanol and elution wells
+plate_map = PlateMap(samples, columns=sample_columns, tips=tip_rack_ethanol_wash, ethanol=ethanol_plate, elution=pcr_plate)
+
+tip_planner = TipPlanner(m300, TIP_RULES, plate_map)
+
+# trough wells and volumes for this number of samples
+reagent_ledger = ReagentLedger(trough, TROUGH_DEAD_VOLUME, MENISCUS_FOLLOW_DEPTH)
+for reagent_name in reagents:
+    reagent_ledger.reserve(reagents[reagent_name], samples)
+reagent_ledger.report()
 
-samples = sample_plate.rows('A')[0:number_of_sample_columns]
+# transfers larger than a tip, in even trips
+trip_plan = TripPlan(tip_capacity())
+trip_plan.add("magnetic beads", reagents['magnetic_beads']['transfer_volume'])
+trip_plan.add("supernatant", 650)
+trip_plan.add("ethanol wash", 400)
+trip_plan.add("ethanol supernatant", 400)
+trip_plan.report()
 
 # home
 robot.home()
 
 
-# Add 350 µl of silica-coated magnetic beads
-transfer_and_mixBeads(reagents['magnetic_beads'], samples)
+start_step("beads")
 
-m300.delay(seconds=300)
+# Add 350 µl of silica-coated magnetic beads, each column binds for 5 min from its addition
+bead_binding = IncubationTimer(BINDING_SECONDS)
+transfer_and_mixBeads(reagents['magnetic_beads'], samples, timer=bead_binding)
+bead_binding.wait()
 
 
 # Settle the magnetic beads on a magnetic stand and discard the supernatant
-robot.comment("Activating magdeck for 90 seconds")
-magdeck.engage(height=12)
-
-if test_mode:
-    m300.delay(seconds=5)
-else:
-    m300.delay(seconds=600)
+# the first tip for trash_supernatant is picked up while the beads settle
+settle_beads(BEAD_SETTLE_SECONDS, [prefetch_tip(samples[0])])
 
 
 # trash supernatant
@@ -349,19 +922,17 @@ robot.comment(text_in_a_box("Ethanol wash steps. Uses specific tips. Loops 2x"))
 reps_ = 2
 for _ in range(reps_):
     
+    start_step("ethanol wash {}".format(_ + 1))
     magdeck.disengage()
     
     for well in samples:
         
-        #maps tips to sample well - uses specific tip box
-        well_code = str(well).split(" ")[-1][:-1]
-        
-        #if not m300.tip_attached:
-        m300.pick_up_tip(tip_rack_ethanol_wash[well_code])
+        #maps tips to sample well - the ethanol well of the column belongs to the sample
+        tip_planner.get_tip(sample=well)
 
-        m300.transfer(400, 
-                      ethanol_plate.wells(well_code).bottom(2), 
-                      well.top(-10), new_tip='never', air_gap = 10)
+        trip_plan.transfer(400, 
+                      plate_map.well('ethanol', well).bottom(2), 
+                      well.top(-10))
         
         m300.set_flow_rate(aspirate=200, dispense=250)
         m300.aspirate(100, well.top(20))
@@ -369,30 +940,20 @@ for _ in range(reps_):
         m300.dispense(100, well.top(-20))
         m300.set_flow_rate(aspirate=150, dispense=150)
 
-        m300.return_tip()
-
 
-    robot.comment("Activating magdeck for 120 seconds")
-    magdeck.engage(height=12)
-    
-    if test_mode:
-        m300.delay(seconds=5)
-    else:
-        m300.delay(seconds=120)
+    settle_beads(WASH_SETTLE_SECONDS, [prefetch_tip(samples[0])])
 
     #trash_supernatant(volume=400, height=2, samples=samples, pipette = 'ethanol')
     for well in samples:
         
         #uses same tips
-        well_code = str(well).split(" ")[-1][:-1]
-        
-        m300.pick_up_tip(tip_rack_ethanol_wash[well_code])
+        tip_planner.get_tip(sample=well)
         # trashes supernatant from the bottom of the well (0.2mm) if last repetition
         # ensures maximal ethanol removal before drying stage
         if _ == (reps_-1):
-            m300.transfer(400, well.bottom(0.2), m300.trash_container.top(10), new_tip='never' , air_gap = 10, blow_out = True)
+            trip_plan.remove(400, well, 0.2, m300.trash_container, m300.trash_container.top(10), blow_out = True)
         else:
-            m300.transfer(400, well.bottom(0.6), m300.trash_container.top(10), new_tip='never' , air_gap = 10, blow_out = True)
+            trip_plan.remove(400, well, 0.6, m300.trash_container, m300.trash_container.top(10), blow_out = True)
 
         # to remove bubbles before returning tips to box:
         m300.set_flow_rate(aspirate=20, dispense=150)
@@ -404,12 +965,12 @@ for _ in range(reps_):
         # transfer function tends to eject a small volume of air after all liquid is trashed
         # which forms bubbles and may lead to cross contaminations (does not happen with all liquids
         # Keep eyes peeled at this stage)#
-        
-        m300.return_tip()
 
 magdeck.disengage()
 
 
+start_step("drying")
+
 # Bead drying stage
 if test_mode:
     m300.delay(seconds=5)
@@ -418,18 +979,15 @@ else:
 
 
 
-# Add 40 µl of nuclease-free water to elute RNA, mix, incubate for 5 mins
-transfer_and_mix(reagents['nuclease_free_water'], samples)
-m300.delay(seconds=300)
+start_step("elution")
 
-#turn on Magdeck to remove beads
-robot.comment("Activating magdeck for 120 seconds")
-magdeck.engage(height=12)
+# Add 40 µl of nuclease-free water to elute RNA, mix, incubate for 5 mins from each column's addition
+elution = IncubationTimer(ELUTION_SECONDS)
+transfer_and_mix(reagents['nuclease_free_water'], samples, timer=elution)
+elution.wait()
 
-if test_mode:
-    m300.delay(seconds=5)
-else:
-    m300.delay(seconds=120)
+#turn on Magdeck to remove beads
+settle_beads(WASH_SETTLE_SECONDS, [prefetch_tip(samples[0], eluate=True)])
 
 #transfer 40ul of eluted sample to PCR plate
 # pcr plate mapped to samples.
@@ -438,11 +996,11 @@ else:
 
 for well in samples:
         
-        if not m300.tip_attached:
-            m300.pick_up_tip()
+        tip_planner.get_tip(eluate=well)
 
-        well_code = str(well).split(" ")[-1][:-1]
         m300.set_flow_rate(aspirate=30, dispense=30)
-        m300.transfer(40, well.bottom(0.3), pcr_plate.wells(well_code).bottom(0.5), new_tip='always', air_gap=10, blow_out = True)
+        elution_well = plate_map.well('elution', well)
+        trip_plan.remove(40, well, 0.3, elution_well, elution_well.bottom(0.5), blow_out = True)
         
+tip_planner.release()
 magdeck.disengage()
\ No newline at end of file
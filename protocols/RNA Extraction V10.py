@@ -159,6 +159,42 @@ for reagent_name in reagents:
 
 # Define custom functions
 
+class PlateMap:
+    """ Index of the sample columns, built once per run instead of parsing str(well) in every loop.
+    [samples] are wells of row A: sample i is plate column columns[i] (from [columns], by default the first
+    columns in order) and belongs to trough group groups[i], [group_size] samples sharing a trough well.
+    Every labware passed in [mapped] gets the well in the same column for each sample, e.g. the sample's
+    own tip or its elution well """
+
+    def __init__(self, samples, group_size=4, columns=None, **mapped):
+        self.samples = samples
+        order = np.arange(len(samples))
+        self.columns = order if columns is None else np.array(columns)
+        self.groups = order // group_size
+        self.first_in_group = order % group_size == 0
+        self.index = {s: i for i, s in enumerate(samples)}
+        self.wells = {}
+        for name, plate in mapped.items():
+            row = plate.rows('A')
+            self.wells[name] = [row[int(c)] for c in self.columns]
+
+    def column(self, s):
+        """ plate column (0 to 11) of sample well [s] """
+        return int(self.columns[self.index[s]])
+
+    def group(self, s):
+        """ trough group of sample well [s] """
+        return int(self.groups[self.index[s]])
+
+    def starts_group(self, s):
+        """ True if sample well [s] is the first column served by its trough well """
+        return bool(self.first_in_group[self.index[s]])
+
+    def well(self, name, s):
+        """ the well of the [name] labware in the column of sample well [s] """
+        return self.wells[name][self.index[s]]
+
+
 def mix_wells(mix_locations, mix_reps):
     """ Function to mix [mix_locations] thoroughly by aspirating/rejecting liquid at different heights in a well,
     performed [mix_reps] times """
@@ -248,13 +284,7 @@ def transfer_and_mixIPA320(reagent, samples):
     
     for s in samples:
 
-        well_code = str(s).split(" ")[-1][:-1]
-        if well_code in ['A1','A2','A3','A4']:
-            sourcewell = trough.wells('A12')
-        elif well_code in ['A5','A6','A7','A8']:
-            sourcewell = trough.wells('A11')
-        elif well_code in ['A9','A10','A11','A12']:
-            sourcewell = trough.wells('A10')
+        sourcewell = trough.wells('A12', 'A11', 'A10')[plate_map.group(s)]
 
         if not m300.tip_attached:
             m300.pick_up_tip()
@@ -272,15 +302,13 @@ def transfer_and_mixBEADS(reagent, samples):
     
     for s in samples:
 
-        well_code = str(s).split(" ")[-1][:-1]
-
         sourcewell = reagent['setup']
 
         if not m300.tip_attached:
             m300.pick_up_tip()
 
         #Resuspends the beads before each transfer; resuspends more thoroughly every 4 transfers.
-        if well_code in ['A5', 'A9']:
+        if plate_map.starts_group(s) and plate_map.group(s) > 0:
             resuspend(sourcewell)
         else:
             resuspendLITE(sourcewell)
@@ -366,6 +394,9 @@ if number_of_sample_columns > 12:
 
 samples = sample_plate.rows('A')[0:number_of_sample_columns]
 
+# sample columns and their own tip, ethanol and elution wells
+plate_map = PlateMap(samples, tips=tip_rack_ethanol_wash, ethanol=ethanol_plate, elution=pcr_plate)
+
 # home
 robot.home()
 
@@ -405,17 +436,11 @@ magdeck.disengage()
 # IPA wash (400 ul)
 for well in samples:
 
-    #gets the well code of for the sample.
-    well_code = str(well).split(" ")[-1][:-1]
-    if well_code in ['A1','A2','A3','A4']:
-        sourcewell = trough.wells('A8')
-    elif well_code in ['A5','A6','A7','A8']:
-        sourcewell = trough.wells('A7')
-    elif well_code in ['A9','A10','A11','A12']:
-        sourcewell = trough.wells('A6')
+    #gets the trough well serving the sample.
+    sourcewell = trough.wells('A8', 'A7', 'A6')[plate_map.group(well)]
 
     #picks up the tip in the sample positon on the ethanol_wash tip rack.
-    m300.pick_up_tip(tip_rack_ethanol_wash[well_code])
+    m300.pick_up_tip(plate_map.well('tips', well))
 
     m300.transfer(reagents['isopropanol_400']['transfer_volume'], sourcewell.bottom(0.6), well.top(-10), new_tip='never', air_gap = 10)
 
@@ -441,8 +466,7 @@ else:
 for well in samples:
 
     #uses the same tips to discard the supernatant.
-    well_code = str(well).split(" ")[-1][:-1]
-    m300.pick_up_tip(tip_rack_ethanol_wash[well_code])
+    m300.pick_up_tip(plate_map.well('tips', well))
     m300.transfer(200, well.bottom(0.6), m300.trash_container.top(5), new_tip='never', blow_out = True, air_gap=10)
     m300.dispense(40)
     m300.delay(seconds = 2)
@@ -468,13 +492,11 @@ for _ in range(reps_):
     for well in samples:
         
         #maps tips to sample well - uses specific tip box
-        well_code = str(well).split(" ")[-1][:-1]
-        
         #if not m300.tip_attached:
-        m300.pick_up_tip(tip_rack_ethanol_wash[well_code])
+        m300.pick_up_tip(plate_map.well('tips', well))
 
         m300.transfer(200, 
-                      ethanol_plate.wells(well_code).bottom(2), 
+                      plate_map.well('ethanol', well).bottom(2), 
                       well.top(-10), new_tip='never', air_gap = 10)
         
         m300.set_flow_rate(aspirate=200, dispense=250)
@@ -498,9 +520,7 @@ for _ in range(reps_):
     for well in samples:
         
         #uses same tips
-        well_code = str(well).split(" ")[-1][:-1]
-        
-        m300.pick_up_tip(tip_rack_ethanol_wash[well_code])
+        m300.pick_up_tip(plate_map.well('tips', well))
         # trashes supernatant from the bottom of the well (0.2mm) if last repetition
         # ensures maximal ethanol removal before drying stage
         if _ == (reps_-1):
@@ -557,8 +577,7 @@ for well in samples:
         if not m300.tip_attached:
             m300.pick_up_tip()
 
-        well_code = str(well).split(" ")[-1][:-1]
         m300.set_flow_rate(aspirate=30, dispense=30)
-        m300.transfer(40, well.bottom(0.3), pcr_plate.wells(well_code).bottom(0.5), new_tip='always', air_gap=10, blow_out = True)
+        m300.transfer(40, well.bottom(0.3), plate_map.well('elution', well).bottom(0.5), new_tip='always', air_gap=10, blow_out = True)
         
 magdeck.disengage()
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+The simulation cache must answer an unchanged run from disk, miss on any
+change to what decides the run, and stay under its size.
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from tools import cache
+from tools.timing import CostModel
+from tools.tip_plan import count_tips
+
+ROOT = Path(__file__).resolve().parent.parent
+PROTOCOL = ROOT / 'RNA Extraction (BOMB) V10.py'
+PARAMS = {'number_of_sample_columns': 1, 'test_mode': True}
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('SIM_CACHE_DIR', str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+
+def test_unchanged_run_is_read_from_the_cache(cache_dir, monkeypatch):
+    calls = []
+    simulate = cache._simulate
+
+    def counting(*args, **kwargs):
+        calls.append(args)
+        return simulate(*args, **kwargs)
+
+    monkeypatch.setattr(cache, '_simulate', counting)
+    first = cache.lookup(PROTOCOL, PARAMS)
+    second = cache.lookup(PROTOCOL, PARAMS)
+    assert len(calls) == 1
+    assert len(list(cache_dir.iterdir())) == 1
+    assert second['tips'] == count_tips(first['run'].commands)
+    assert [c.name for c in second['run'].commands] == \
+        [c.name for c in first['run'].commands]
+    cache.lookup(PROTOCOL, dict(PARAMS, number_of_sample_columns=2))
+    assert len(calls) == 2
+
+
+def test_key_follows_what_decides_the_run(tmp_path):
+    protocol = tmp_path / PROTOCOL.name
+    shutil.copy(str(PROTOCOL), str(protocol))
+    manifest = tmp_path / 'plate.csv'
+    manifest.write_text('well,type,id\nA1,sample,S1\n')
+    params = dict(PARAMS, sample_manifest=str(manifest))
+
+    base = cache.key(protocol, params)
+    assert cache.key(protocol, dict(params)) == base
+    assert cache.key(protocol, dict(params, test_mode=False)) != base
+    assert cache.key(protocol, params, CostModel(xy_speed=300.0)) != base
+    assert cache.key(protocol, params, extra_tip_racks=True) != base
+    manifest.write_text('well,type,id\nA2,sample,S1\n')
+    assert cache.key(protocol, params) != base
+    manifest.write_text('well,type,id\nA1,sample,S1\n')
+    protocol.write_bytes(protocol.read_bytes() + b'\r\n')
+    assert cache.key(protocol, params) != base
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    store = cache.Cache(tmp_path, max_bytes=10 ** 6)
+    for i, digest in enumerate(('old', 'used', 'new')):
+        store.put(digest, {'payload': bytes(400 * 1000)})
+        os.utime(str(store._path(digest)), (i, i))
+    assert store.get('used') is not None    # marks it used
+    store.max_bytes = 900 * 1000
+    store.evict()
+    assert sorted(path.stem for path in store.entries()) == ['new', 'used']
@@ -0,0 +1,48 @@
+"""
+A command log written and mapped back must hold the commands it was made
+from, and the per-step totals must match the timeline.
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+
+from tools.command_log import CommandTable
+from tools.runner import simulate
+from tools.timeline import label
+
+ROOT = Path(__file__).resolve().parent.parent
+PROTOCOL = ROOT / 'RNA Extraction (BOMB) V10.py'
+
+
+def test_round_trip(tmp_path):
+    run = simulate(str(PROTOCOL), {'number_of_sample_columns': 2,
+                                   'test_mode': True})
+    path = tmp_path / 'run.cmdlog'
+    CommandTable.from_commands(run.commands).save(str(path))
+    table = CommandTable.load(str(path))
+
+    assert len(table) == len(run.commands)
+    for row, command in enumerate(run.commands):
+        assert table.text('name', row) == command.name
+        assert table.text('well', row) == command.well
+        assert table.columns['duration'][row] == \
+            pytest.approx(command.duration)
+
+    expected = OrderedDict()
+    for command, step, _, _ in label(run.commands):
+        seconds, count = expected.get((step,), (0.0, 0))
+        expected[(step,)] = (seconds + command.duration, count + 1)
+    totals = table.totals('step')
+    assert list(totals) == list(expected)
+    for key, (seconds, count) in expected.items():
+        assert totals[key][0] == pytest.approx(seconds)
+        assert totals[key][1] == count
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / 'run.cmdlog'
+    path.write_bytes(b'not a command log at all')
+    with pytest.raises(ValueError):
+        CommandTable.load(str(path))
@@ -0,0 +1,53 @@
+"""
+A Station B run stopped after any journalled unit and resumed from its
+journal must do every unit once, fill every well as one uninterrupted run
+would and pick up no spent tip.
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from tools import journal
+from tools.runner import simulate
+
+ROOT = Path(__file__).resolve().parent.parent
+PROTOCOL = ROOT / 'RNA Extraction (BOMB) V10.py'
+PARAMS = {'number_of_sample_columns': 2, 'test_mode': True}
+
+
+@pytest.fixture(scope='module')
+def full(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('journal'))
+    path = os.path.join(directory, 'journal.jsonl')
+    run = simulate(str(PROTOCOL), dict(PARAMS, journal_file=path))
+    return run, journal.units(path), directory
+
+
+def test_units_are_journalled_once(full):
+    _, full_units, _ = full
+    assert full_units
+    assert len(full_units) == len(set(full_units))
+
+
+def test_resume_matches_uninterrupted_run(full):
+    run, full_units, directory = full
+    for stop in journal.first_of_each_kind(full_units):
+        row = journal.rehearse(str(PROTOCOL), PARAMS, stop, run, full_units,
+                               directory)
+        assert row['check'] == 'ok', (stop, row['stop after'])
+        assert row['resume'] < row['restart']
+
+
+def test_stop_past_the_last_unit_is_refused(full):
+    run, full_units, directory = full
+    with pytest.raises(ValueError):
+        journal.rehearse(str(PROTOCOL), PARAMS, len(full_units) + 1, run,
+                         full_units, directory)
+
+
+def test_protocol_without_journal_is_refused():
+    with pytest.raises(SystemExit):
+        journal.main([str(ROOT / 'Beckman Coulter RNAdvance Viral XP V1.py'),
+                      '--columns', '1', '--test-mode'])
@@ -0,0 +1,57 @@
+"""
+With a sample manifest the Station B protocols must touch only the plate
+columns it occupies, and a manifest naming no sample well is refused.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from tools import manifest
+from tools.runner import simulate
+
+ROOT = Path(__file__).resolve().parent.parent
+PROTOCOLS = (
+    'RNA Extraction (BOMB) V10.py',
+    'Beckman Coulter RNAdvance Viral XP V1.py',
+)
+PLATES = ('fischerbrand_96_wellplate_2000ul', 'fresh plate')
+
+
+@pytest.fixture
+def plate(tmp_path):
+    path = tmp_path / 'plate.csv'
+    path.write_text('well,type,id\nB2,sample,S1\nH5,control,NTC\n'
+                    'A7,empty,\n')
+    return path
+
+
+def test_read(plate):
+    entries = manifest.read(str(plate))
+    assert list(entries) == ['B2', 'H5']
+    assert manifest.columns(entries) == [2, 5]
+
+
+@pytest.mark.parametrize('text', [
+    'well,type,id\nI1,sample,S1\n',
+    'well,type,id\nA13,sample,S1\n',
+    'well,type,id\nA1,blank,S1\n',
+    'well,type,id\nA1,sample,S1\nA1,control,NTC\n',
+    'well,type,id\nA1,empty,\n',
+])
+def test_invalid_manifest_is_refused(tmp_path, text):
+    path = tmp_path / 'plate.csv'
+    path.write_text(text)
+    with pytest.raises(ValueError):
+        manifest.read(str(path))
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_only_occupied_columns_are_processed(protocol, plate):
+    run = simulate(str(ROOT / protocol),
+                   {'sample_manifest': str(plate), 'test_mode': True})
+    touched = {(c.labware, c.well) for c in run.commands
+               if c.name in ('aspirate', 'dispense')
+               and c.labware in PLATES}
+    assert touched == {(labware, well) for labware in PLATES
+                       for well in ('A2', 'A5')}
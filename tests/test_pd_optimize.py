@@ -0,0 +1,83 @@
+"""
+The optimised Protocol Designer file must deliver what the original does,
+within the tips' capacity, and load as the file it was written from.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from tools.pd_optimize import Protocol, delivered, first_fit, optimize, write
+
+ROOT = Path(__file__).resolve().parent.parent
+STATION_C = ROOT / 'protocols' / 'Station_C_46_v6_5_col.json'
+
+
+def dispenses_per_aspirate(commands):
+    """ (pipette, aspirate volume, volumes dispensed from it) per aspirate """
+    loads = []
+    for command in commands:
+        params = command.get('params', {})
+        if command['command'] == 'aspirate':
+            loads.append((params['pipette'], params['volume'], []))
+        elif command['command'] == 'dispense':
+            loads[-1][2].append(params['volume'])
+    return loads
+
+
+@pytest.mark.parametrize('disposal', [None, 0, 2])
+def test_every_destination_gets_the_same_volume(disposal):
+    protocol = Protocol.load(STATION_C)
+    optimized, counts = optimize(protocol, disposal)
+    assert counts['merged tip cycles']
+    assert delivered(protocol, optimized) == \
+        delivered(protocol, protocol.data['commands'])
+
+
+@pytest.mark.parametrize('disposal', [None, 0, 2])
+def test_no_aspirate_exceeds_the_tip(disposal):
+    protocol = Protocol.load(STATION_C)
+    optimized, _ = optimize(protocol, disposal)
+    for pipette, volume, _ in dispenses_per_aspirate(optimized):
+        assert volume <= protocol.capacity(pipette)
+
+
+def test_multi_dispenses_keep_a_disposal_volume():
+    protocol = Protocol.load(STATION_C)
+    optimized, _ = optimize(protocol, 2)
+    for pipette, volume, dispensed in dispenses_per_aspirate(optimized):
+        if len(dispensed) > 1:
+            assert volume == sum(dispensed) + 2
+
+
+def test_first_fit_leaves_room_for_the_disposal_volume():
+    assert first_fit([4, 4, 4], 10, 1) == [[0, 1], [2]]
+    assert first_fit([5, 5, 5], 10, 1) == [[0], [1], [2]]
+    assert first_fit([4, 4, 4], 10, 0) == [[0], [1], [2]]
+    with pytest.raises(ValueError):
+        first_fit([12], 10, 1)
+
+
+def test_no_multi_dispense_without_a_disposal_volume():
+    protocol = Protocol.load(STATION_C)
+    optimized, counts = optimize(protocol, 0)
+    assert counts['aspirates saved'] == 0
+    assert all(len(dispensed) == 1 for _, _, dispensed
+               in dispenses_per_aspirate(optimized))
+
+
+def test_written_file_loads_as_the_original(tmp_path):
+    protocol = Protocol.load(STATION_C)
+    optimized, _ = optimize(protocol)
+    path = tmp_path / 'optimised.json'
+    write(protocol, optimized, path)
+    data = json.loads(path.read_text(encoding='utf-8'))
+    original = json.loads(STATION_C.read_text(encoding='utf-8'))
+    assert list(data) == list(original)
+    assert {key: value for key, value in data.items() if key != 'commands'} \
+        == {key: value for key, value in original.items()
+            if key != 'commands'}
+    assert data['commands'] == json.loads(json.dumps(optimized))
+    for command in data['commands']:
+        assert set(command) == {'command', 'params'}
@@ -0,0 +1,39 @@
+"""
+The peephole pass must leave the liquid handling of a run alone, and time
+cut from work that runs for a set time must not count as saved.
+"""
+
+from pathlib import Path
+
+import pytest
+
+from tools.estimate_runtime import estimate
+from tools.peephole import optimize
+from tools.runner import simulate
+
+ROOT = Path(__file__).resolve().parent.parent
+PROTOCOLS = ('RNA Extraction (BOMB) V10.py',
+             'Beckman Coulter RNAdvance Viral XP V1.py')
+LIQUID = ('aspirate', 'dispense', 'mix', 'blow_out')
+
+
+def liquid_handling(commands):
+    return [(c.name, c.pipette, c.volume, c.flow_rate)
+            for c in commands if c.name in LIQUID and c.volume != 0]
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_optimised_stream_handles_the_same_liquid(protocol):
+    run = simulate(ROOT / protocol, {'number_of_sample_columns': 3})
+    optimized, counts = optimize(run.commands)
+    assert len(optimized) < len(run.commands)
+    assert liquid_handling(optimized) == liquid_handling(run.commands)
+
+
+def test_time_bound_work_keeps_its_length():
+    protocol = ROOT / PROTOCOLS[0]
+    plain, = estimate(protocol, [2], test_mode=True)
+    optimized, = estimate(protocol, [2], test_mode=True, optimized=True)
+    assert optimized['blow_air'] == pytest.approx(plain['blow_air'])
+    assert optimized['magdeck settling'] >= plain['magdeck settling']
+    assert optimized['total'] <= plain['total']
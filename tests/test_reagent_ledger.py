@@ -0,0 +1,53 @@
+"""
+The trough aspirates of the Station B protocols, as ReagentLedger places
+them, must stay under the liquid left in the well.
+"""
+
+import math
+import re
+from pathlib import Path
+
+import pytest
+
+from tools.runner import simulate
+
+ROOT = Path(__file__).resolve().parent.parent
+PROTOCOLS = ('RNA Extraction (BOMB) V10.py',
+             'Beckman Coulter RNAdvance Viral XP V1.py')
+LOAD = re.compile(r'Load (\d+) ul of .* into each well of trough column (\d+)')
+# aspirates of air at the top of the trough, not drawn from the ledger:
+# the resuspend strokes and the air gaps of transfers
+AIR_FUNCTIONS = ('resuspend', 'resuspendLITE')
+AIR_GAP = 'air_gap'
+
+
+@pytest.mark.parametrize('columns', [1, 5, 12])
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_trough_aspirates_stay_under_the_liquid(protocol, columns):
+    run = simulate(ROOT / protocol, {'number_of_sample_columns': columns})
+    trough = next(labware for labware in run.labware
+                  if labware.label == 'trough')
+    depth = trough.definition['depth']
+    area = math.pi * (trough.definition['diameter'] / 2) ** 2
+    bottom = trough.z_top - depth
+
+    left = {}
+    height = None
+    draws = 0
+    for command in run.commands:
+        if command.name == 'comment' and LOAD.match(command.text):
+            volume, column = LOAD.match(command.text).groups()
+            left['A' + column] = float(volume)
+        elif command.name == 'move_to':
+            height = command.point[2] - bottom
+        elif (command.name == 'aspirate' and command.labware == 'trough'
+              and command.function not in AIR_FUNCTIONS
+              and AIR_GAP not in command.context.split('/')):
+            left[command.well] -= command.volume
+            level = min(depth, left[command.well] / area)
+            assert height < level, (
+                '{} ul aspirated from trough {} at {:.1f} mm, the liquid '
+                'left is {:.1f} mm high'.format(command.volume, command.well,
+                                                height, level))
+            draws += 1
+    assert draws
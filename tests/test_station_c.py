@@ -0,0 +1,88 @@
+"""
+The Station C protocols tools.station_c writes must give the PCR well of
+every sample and control its master mix and sample, and keep the sample
+transfers of the multichannel out of the control wells.
+"""
+
+from collections import Counter
+
+import pytest
+
+from tools.manifest import read as read_manifest
+from tools.pd_optimize import Protocol
+from tools.station_c import _pcr_well, generate
+
+MANIFEST = '''well,type,id
+A1,sample,S1
+B1,sample,S2
+C1,sample,S3
+A2,sample,S4
+B2,sample,S5
+G2,control,PTC
+H2,control,NTC
+A3,sample,S6
+'''
+
+
+def sample_wells(protocol, commands, samples):
+    """ (labware, well) entered by a multichannel channel from its first
+    aspirate from the [samples] block on """
+    wells = set()
+    started = False
+    for command in commands:
+        params = command.get('params', {})
+        if command['command'] not in ('aspirate', 'dispense') or \
+                'multi' not in protocol.pipettes[params['pipette']]['name']:
+            continue
+        started = started or params['labware'] == samples
+        if started:
+            for well in protocol.channels(params['pipette'],
+                                          params['labware'], params['well']):
+                wells.add((params['labware'], well))
+    return wells
+
+
+def check(data, plan, mastermix_volume=15, sample_volume=5):
+    protocol = Protocol(data)
+    pcr = next(name for name, spec in data['labware'].items()
+               if 'appliedbiosystems' in spec['definitionId'])
+    # what each PCR well keeps: dispensed minus aspirated by the mixing
+    kept = Counter()
+    for command in data['commands']:
+        params = command.get('params', {})
+        if command['command'] in ('aspirate', 'dispense') and \
+                params['labware'] == pcr:
+            sign = 1 if command['command'] == 'dispense' else -1
+            for well in protocol.channels(params['pipette'], pcr,
+                                          params['well']):
+                kept[well] += sign * params['volume']
+    for _, _, first in plan.blocks:
+        for well in list(plan.samples) + list(plan.controls.values()):
+            assert kept[_pcr_well(plan, first, well)] == pytest.approx(
+                mastermix_volume + sample_volume), well
+
+    controls = {(pcr, _pcr_well(plan, first, well))
+                for _, _, first in plan.blocks
+                for well in plan.controls.values()}
+    samples = next(name for name, spec in data['labware'].items()
+                   if 'aluminumblock' in spec['definitionId'])
+    assert not controls & sample_wells(protocol, data['commands'], samples)
+
+
+@pytest.mark.parametrize('samples,controls', [
+    (46, None),
+    (22, {'PTC': 'A4', 'NTC': 'B4'}),
+    (10, {'PTC': 'C1', 'NTC': 'H2'}),
+])
+def test_samples_and_controls_fill_the_plate(samples, controls):
+    data, plan = generate(samples, controls=controls)
+    assert len(plan.samples) == samples
+    check(data, plan)
+
+
+def test_manifest_plate(tmp_path):
+    path = tmp_path / 'plate.csv'
+    path.write_text(MANIFEST)
+    data, plan = generate(None, manifest=read_manifest(path))
+    assert plan.singles == ['A2', 'B2', 'A3']
+    check(data, plan)
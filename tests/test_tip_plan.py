@@ -0,0 +1,48 @@
+"""
+The Station B protocols load the tip racks the tip planner reports they
+need, and only swap tips when the tip would touch something else.
+"""
+
+import ast
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+from tools.runner import simulate
+from tools.timeline import label
+from tools.tip_plan import plan
+
+ROOT = Path(__file__).resolve().parent.parent
+PROTOCOLS = ('RNA Extraction (BOMB) V10.py',
+             'Beckman Coulter RNAdvance Viral XP V1.py')
+
+
+def racks_table(protocol):
+    tree = ast.parse((ROOT / protocol).read_text())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) \
+                and node.targets[0].id == 'TIP_RACKS_NEEDED':
+            return ast.literal_eval(node.value)
+    raise AssertionError('{} has no TIP_RACKS_NEEDED'.format(protocol))
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_racks_loaded_are_the_racks_needed(protocol):
+    rows = plan(ROOT / protocol)
+    assert racks_table(protocol) == [row['racks needed'] for row in rows]
+    for row in rows:
+        # the racks needed and the mapped rack, no extra rack swapped in
+        assert row['racks loaded'] == row['racks needed'] + 1
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_reagent_tip_enters_the_sample_without_a_swap(protocol):
+    # a step adds reagent and mixes, or removes the supernatant, with one
+    # tip a column; at most one more tip brings a reagent to the first column
+    columns = 6
+    run = simulate(ROOT / protocol, {'number_of_sample_columns': columns})
+    picks = Counter(step for command, step, _, _ in label(run.commands)
+                    if command.name == 'pick_up_tip')
+    for step, count in picks.items():
+        assert count <= 2 * columns + 1, (step, count)
@@ -0,0 +1,7 @@
+"""
+Offline tooling for the OpenCell OT-2 protocols.
+
+Protocol files are executed against recording stand-ins for the opentrons
+API so that run time, tips and other resources can be estimated without a
+robot or a full opentrons install.
+"""
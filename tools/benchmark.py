@@ -0,0 +1,158 @@
+"""
+Benchmark the simulation of every protocol in the repo.
+
+    python -m tools.benchmark > bench.csv
+    python -m tools.benchmark --baseline bench.csv
+
+Each protocol is simulated for 1-12 sample columns with test_mode off and
+on, as far as it has those parameters; a protocol without them is run once.
+Protocol Designer JSON files are not simulated but their commands are
+replayed, as in tools.pd_optimize.
+Fresh tip racks are loaded instead of running out, as in tools.tip_plan.
+A row records the simulator wall time (best of --repeat runs), its peak
+traced memory, the command count, the tips consumed and the predicted robot
+time. The CSV rows come out in a fixed order so two commits can be diffed,
+and --baseline prints how far each figure moved against an earlier CSV.
+"""
+
+import argparse
+import csv
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from itertools import product
+from pathlib import Path
+
+from .pd_optimize import Protocol, estimate, tips_used
+from .runner import parameters, simulate
+from .tip_plan import count_tips
+
+ROOT = Path(__file__).resolve().parent.parent
+EXAMPLES = Path('protocols', '_example_dummy_scripts')
+PROTOCOLS = (
+    'RNA Extraction (BOMB) V10.py',
+    'Beckman Coulter RNAdvance Viral XP V1.py',
+    str(EXAMPLES / 'nucleic_acid_extraction.ot2.py'),
+    str(EXAMPLES / 'cell_culture_assay.ot2.py'),
+    str(EXAMPLES / 'rna_extraction.py'),
+    str(EXAMPLES / 'qPCR_assay_prep'),
+    str(Path('protocols', 'Station_C_46_v6_5_col.json')),
+)
+
+KEY_COLUMNS = ('protocol', 'columns', 'test_mode')
+
+
+def sweep(protocol, columns=range(1, 13)):
+    """ The parameter sets to benchmark [protocol] with """
+    if protocol.endswith('.json'):
+        return [{}]
+    names = parameters(ROOT / protocol)
+    axes = OrderedDict()
+    if 'number_of_sample_columns' in names:
+        axes['number_of_sample_columns'] = list(columns)
+    if 'test_mode' in names:
+        axes['test_mode'] = [False, True]
+    return [dict(zip(axes, values)) for values in product(*axes.values())]
+
+
+def _replay_json(path, params):
+    protocol = Protocol.load(path)
+    commands = protocol.data['commands']
+    return len(commands), tips_used(commands), estimate(protocol, commands)
+
+
+def _simulate(path, params):
+    run = simulate(path, params, extra_tip_racks=True)
+    return (len(run.commands), count_tips(run.commands)['new tips'],
+            run.duration)
+
+
+def measure(protocol, params, repeat=3):
+    """ One benchmark row for [protocol] run with [params] """
+    path = ROOT / protocol
+    run = _replay_json if protocol.endswith('.json') else _simulate
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        commands, tips, duration = run(path, params)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # traced separately, tracemalloc slows the run it watches
+    tracemalloc.start()
+    try:
+        run(path, params)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return OrderedDict((
+        ('protocol', protocol),
+        ('columns', params.get('number_of_sample_columns', '')),
+        ('test_mode', params.get('test_mode', '')),
+        ('wall seconds', round(best, 4)),
+        ('peak KiB', round(peak / 1024, 1)),
+        ('commands', commands),
+        ('tips', tips),
+        ('robot seconds', round(duration, 1)),
+    ))
+
+
+def benchmark(protocols=PROTOCOLS, columns=range(1, 13), repeat=3):
+    rows = []
+    for protocol in protocols:
+        for params in sweep(protocol, columns):
+            rows.append(measure(protocol, params, repeat))
+    return rows
+
+
+def compare(rows, baseline_rows, out=sys.stdout):
+    """ Print the relative change of every figure against [baseline_rows] """
+    def key(row):
+        return tuple(str(row[k]) for k in KEY_COLUMNS)
+
+    baseline = {key(row): row for row in baseline_rows}
+    figures = [k for k in rows[0] if k not in KEY_COLUMNS]
+    writer = csv.writer(out)
+    writer.writerow(list(KEY_COLUMNS) + figures)
+    for row in rows:
+        old = baseline.get(key(row))
+        if old is None:
+            writer.writerow(list(key(row)) + ['new'] * len(figures))
+            continue
+        changes = []
+        for figure in figures:
+            before, after = float(old[figure]), float(row[figure])
+            if before == after:
+                changes.append('=')
+            elif before == 0:
+                changes.append('{:+g}'.format(after))
+            else:
+                changes.append('{:+.1%}'.format(after / before - 1))
+        writer.writerow(list(key(row)) + changes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocols', nargs='*', default=list(PROTOCOLS),
+                        help='protocol files relative to the repo root')
+    parser.add_argument('--columns', type=int, nargs='+',
+                        default=list(range(1, 13)))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per row; the fastest one is kept')
+    parser.add_argument('--baseline', type=argparse.FileType('r'),
+                        help='CSV from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    rows = benchmark(args.protocols, args.columns, args.repeat)
+    if args.baseline:
+        compare(rows, list(csv.DictReader(args.baseline)))
+        return
+    writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
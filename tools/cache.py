@@ -0,0 +1,196 @@
+"""
+On-disk cache of simulated runs, so unchanged configurations are not run
+again.
+
+    python -m tools.cache            # entries and size, after eviction
+    python -m tools.cache --clear
+
+A run is stored under the hash of what decides it: the protocol source, the
+injected parameters (with the contents of any file they name, such as a
+sample manifest), the cost model and the simulate() options, and the source
+of every module that builds an entry as the simulator version. Editing a
+protocol, the stand-ins or the tip counting therefore misses the cache
+instead of returning a stale run. An entry holds the Run (command log,
+labware, output, time estimate) and its tip counts.
+
+The analysis tools call simulate() from here. tools.benchmark, which times
+the simulator itself, and tools.journal, whose runs write the journal file
+they are about, keep calling tools.runner. The cache lives in
+SIM_CACHE_DIR (default ~/.cache/opentrons-sim; 'off' disables it) and is
+kept under SIM_CACHE_MB megabytes (default 512) by evicting the least
+recently used entries.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from .runner import Run, simulate as _simulate
+from .timing import CostModel
+
+# the modules an entry is built by: the stand-ins a simulated run depends
+# on, tip_plan.py for its tip counts and this module for its layout
+SIMULATOR_MODULES = ('runner.py', 'legacy_api.py', 'protocol_api.py',
+                     'commands.py', 'deck.py', 'timing.py', 'tip_plan.py',
+                     'cache.py')
+DEFAULT_DIRECTORY = Path('~', '.cache', 'opentrons-sim').expanduser()
+DEFAULT_MEGABYTES = 512
+SUFFIX = '.pickle'
+
+
+def simulator_version() -> str:
+    """ Hash of the SIMULATOR_MODULES sources """
+    digest = hashlib.sha256()
+    here = Path(__file__).resolve().parent
+    for name in SIMULATOR_MODULES:
+        digest.update(name.encode())
+        digest.update((here / name).read_bytes())
+    return digest.hexdigest()
+
+
+def _file_digest(value) -> Optional[str]:
+    if not isinstance(value, str) or not os.path.isfile(value):
+        return None
+    return hashlib.sha256(Path(value).read_bytes()).hexdigest()
+
+
+def key(protocol, params, model=None, **options) -> str:
+    """ Cache key of simulate([protocol], [params], [model], **[options]) """
+    parts = {
+        'simulator': simulator_version(),
+        'protocol': hashlib.sha256(Path(protocol).read_bytes()).hexdigest(),
+        'params': {name: [repr(value), _file_digest(value)]
+                   for name, value in (params or {}).items()},
+        'model': (model or CostModel()).to_dict(),
+        'options': options,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()) \
+        .hexdigest()
+
+
+class Cache:
+    """ Runs stored as one pickle per key in [directory]; reading an entry
+    marks it used, and storing one evicts the least recently used entries
+    above [max_bytes] """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_environment(cls) -> Optional['Cache']:
+        """ The cache SIM_CACHE_DIR and SIM_CACHE_MB describe, None if off """
+        directory = os.environ.get('SIM_CACHE_DIR', '')
+        if directory.lower() == 'off':
+            return None
+        megabytes = float(os.environ.get('SIM_CACHE_MB', DEFAULT_MEGABYTES))
+        return cls(Path(directory) if directory else DEFAULT_DIRECTORY,
+                   int(megabytes * 2 ** 20))
+
+    def _path(self, digest) -> Path:
+        return self.directory / (digest + SUFFIX)
+
+    def entries(self):
+        if not self.directory.is_dir():
+            return []
+        return list(self.directory.glob('*' + SUFFIX))
+
+    def get(self, digest) -> Optional[dict]:
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path)
+        return entry
+
+    def put(self, digest, entry: dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # written aside and renamed, so parallel sweeps never read half
+        # an entry
+        handle, temporary = tempfile.mkstemp(dir=str(self.directory))
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, str(self._path(digest)))
+        self.evict()
+
+    def evict(self):
+        """ Remove the least recently used entries above max_bytes """
+        stats = []
+        for path in self.entries():
+            try:
+                stats.append((path.stat(), path))
+            except OSError:
+                continue
+        total = sum(stat.st_size for stat, _ in stats)
+        for stat, path in sorted(stats, key=lambda item: item[0].st_mtime):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            total -= stat.st_size
+
+    def clear(self):
+        for path in self.entries():
+            path.unlink()
+
+
+def lookup(protocol, params: Optional[Dict[str, object]] = None,
+           model: Optional[CostModel] = None, extra_tip_racks: bool = False,
+           allow_failure: bool = False) -> dict:
+    """ The cache entry of the run, simulated and stored on a miss:
+    {'run': Run, 'tips': tip counts} """
+    cache = Cache.from_environment()
+    options = dict(extra_tip_racks=extra_tip_racks,
+                   allow_failure=allow_failure)
+    digest = key(protocol, params, model, **options) if cache else None
+    entry = cache.get(digest) if cache else None
+    if entry is None:
+        # imported here as tools.tip_plan simulates through this module
+        from .tip_plan import count_tips
+        run = _simulate(protocol, params, model, **options)
+        entry = {'run': run, 'tips': count_tips(run.commands)}
+        if cache:
+            cache.put(digest, entry)
+    return entry
+
+
+def simulate(protocol, params: Optional[Dict[str, object]] = None,
+             model: Optional[CostModel] = None, extra_tip_racks: bool = False,
+             allow_failure: bool = False) -> Run:
+    """ tools.runner.simulate, answered from the cache when it can be """
+    return lookup(protocol, params, model, extra_tip_racks,
+                  allow_failure)['run']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clear', action='store_true',
+                        help='remove every entry')
+    args = parser.parse_args(argv)
+
+    cache = Cache.from_environment()
+    if cache is None:
+        sys.stdout.write('the cache is off (SIM_CACHE_DIR=off)\n')
+        return
+    if args.clear:
+        cache.clear()
+    cache.evict()
+    entries = cache.entries()
+    size = sum(path.stat().st_size for path in entries)
+    sys.stdout.write('{}: {} entries, {:.1f} of {:.0f} MB\n'.format(
+        cache.directory, len(entries), size / 2 ** 20,
+        cache.max_bytes / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
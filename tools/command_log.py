@@ -0,0 +1,218 @@
+"""
+Columnar command log of a simulated run, saved as a compact binary file
+that is read back memory-mapped.
+
+    python -m tools.command_log "RNA Extraction (BOMB) V10.py" --columns 12 \\
+        -o bomb.cmdlog
+    python -m tools.command_log --read bomb.cmdlog
+
+The run is held as one typed array per field instead of one Command object
+per row: command type, pipette, labware, well, step, category and issuing
+function as indices into a table of their distinct strings, and volume,
+flow rate, repetitions, z (height of the target point, NaN without one),
+start and duration as numbers. The step is the protocol's start_step()
+and the category the one tools.estimate_runtime charges the time to.
+
+The file is a JSON header (row count, column types and offsets, string
+tables) followed by the raw little-endian arrays, each 8-byte aligned, so
+CommandTable.load maps it and views the arrays in place without reading or
+unpacking the log. --read prints the seconds and commands per step and
+category from a mapped file.
+"""
+
+import argparse
+import json
+import math
+import mmap
+import sys
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+from .cache import simulate
+from .timeline import label
+from .timing import format_seconds
+
+MAGIC = b'OTCMDLOG'
+VERSION = 1
+ALIGN = 8
+
+# column -> array typecode, 'S' for strings stored as 'I' indices
+COLUMNS = OrderedDict((
+    ('name', 'S'),
+    ('pipette', 'S'),
+    ('labware', 'S'),
+    ('well', 'S'),
+    ('step', 'S'),
+    ('category', 'S'),
+    ('function', 'S'),
+    ('volume', 'd'),
+    ('flow_rate', 'd'),
+    ('repetitions', 'i'),
+    ('z', 'd'),
+    ('start', 'd'),
+    ('duration', 'd'),
+))
+INDEX_TYPE = 'I'
+
+
+def _storage(typecode) -> str:
+    return INDEX_TYPE if typecode == 'S' else typecode
+
+
+class CommandTable:
+    """ Commands as [columns], a sequence per column name; string columns
+    hold indices into [strings][column] """
+
+    def __init__(self, length: int, columns: Dict[str, Sequence],
+                 strings: Dict[str, List[str]], source=None):
+        self.length = length
+        self.columns = columns
+        self.strings = strings
+        self._source = source   # the mapped file the columns view
+
+    @classmethod
+    def from_commands(cls, commands) -> 'CommandTable':
+        """ The table of a recorded, timed command stream """
+        columns = OrderedDict((name, array(_storage(typecode)))
+                              for name, typecode in COLUMNS.items())
+        strings = {name: [] for name, typecode in COLUMNS.items()
+                   if typecode == 'S'}
+        indices = {name: {} for name in strings}
+
+        def index(name, text):
+            known = indices[name]
+            if text not in known:
+                known[text] = len(strings[name])
+                strings[name].append(text)
+            return known[text]
+
+        length = 0
+        for command, step, _, category in label(commands):
+            values = dict(
+                name=command.name, pipette=command.pipette,
+                labware=command.labware, well=command.well, step=step,
+                category=category, function=command.function,
+                volume=command.volume, flow_rate=command.flow_rate,
+                repetitions=command.repetitions,
+                z=command.point[2] if command.point else math.nan,
+                start=command.start, duration=command.duration)
+            for name, column in columns.items():
+                value = values[name]
+                column.append(index(name, value) if name in strings
+                              else value)
+            length += 1
+        return cls(length, columns, strings)
+
+    def __len__(self):
+        return self.length
+
+    def text(self, name, row) -> str:
+        """ The string in column [name] of [row] """
+        return self.strings[name][self.columns[name][row]]
+
+    def save(self, path):
+        """ Write the table to [path] """
+        header = {'version': VERSION, 'rows': self.length, 'columns': []}
+        offset = 0
+        for name, typecode in COLUMNS.items():
+            entry = {'name': name, 'type': _storage(typecode),
+                     'offset': offset}
+            if typecode == 'S':
+                entry['strings'] = self.strings[name]
+            header['columns'].append(entry)
+            size = self.length * array(_storage(typecode)).itemsize
+            offset += -(-size // ALIGN) * ALIGN
+        encoded = json.dumps(header).encode()
+        start = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGN) * ALIGN
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(encoded).to_bytes(8, 'little'))
+            f.write(encoded)
+            f.write(b'\0' * (start - f.tell()))
+            for entry in header['columns']:
+                column = self.columns[entry['name']]
+                if not isinstance(column, array):
+                    column = array(entry['type'], column)
+                if sys.byteorder != 'little':
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                f.write(b'\0' * (start + entry['offset'] - f.tell()))
+                f.write(column.tobytes())
+
+    @classmethod
+    def load(cls, path) -> 'CommandTable':
+        """ Map the file at [path]; the columns are views into the mapping """
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(MAGIC)] != MAGIC:
+            raise ValueError('{} is not a command log'.format(path))
+        size = int.from_bytes(mapped[len(MAGIC):len(MAGIC) + 8], 'little')
+        header_end = len(MAGIC) + 8 + size
+        header = json.loads(mapped[len(MAGIC) + 8:header_end].decode())
+        if header['version'] != VERSION:
+            raise ValueError('{} has command log version {}, expected {}'
+                             .format(path, header['version'], VERSION))
+        if sys.byteorder != 'little':
+            raise ValueError('command logs are little-endian')
+        start = -(-header_end // ALIGN) * ALIGN
+        view = memoryview(mapped)
+        columns = OrderedDict()
+        strings = {}
+        for entry in header['columns']:
+            itemsize = array(entry['type']).itemsize
+            begin = start + entry['offset']
+            columns[entry['name']] = view[
+                begin:begin + header['rows'] * itemsize].cast(entry['type'])
+            if 'strings' in entry:
+                strings[entry['name']] = entry['strings']
+        return cls(header['rows'], columns, strings, mapped)
+
+    def totals(self, *keys) -> OrderedDict:
+        """ (seconds, commands) per combination of the string columns [keys] """
+        totals = OrderedDict()
+        codes = [self.columns[key] for key in keys]
+        duration = self.columns['duration']
+        for row in range(self.length):
+            group = tuple(self.strings[key][column[row]]
+                          for key, column in zip(keys, codes))
+            seconds, count = totals.get(group, (0.0, 0))
+            totals[group] = (seconds + duration[row], count + 1)
+        return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol', nargs='?')
+    parser.add_argument('--columns', type=int, default=12)
+    parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('-o', '--output', help='command log file to write')
+    parser.add_argument('--read', help='command log file to summarise')
+    args = parser.parse_args(argv)
+    if bool(args.protocol) == bool(args.read):
+        parser.error('give a protocol to log or --read a command log')
+
+    out = sys.stdout
+    if args.protocol:
+        if not args.output:
+            parser.error('-o is needed to write a command log')
+        run = simulate(args.protocol, {'number_of_sample_columns':
+                                       args.columns,
+                                       'test_mode': args.test_mode})
+        table = CommandTable.from_commands(run.commands)
+        table.save(args.output)
+        out.write('{} commands written to {}\n'.format(len(table),
+                                                        args.output))
+        return
+
+    table = CommandTable.load(args.read)
+    for (step, category), (seconds, count) in table.totals(
+            'step', 'category').items():
+        out.write('{:<16} {:<18} {:>6} {:>9}\n'.format(
+            step, category, count, format_seconds(seconds)))
+    out.write('{:<35} {:>6} {:>9}\n'.format(
+        'total', len(table), format_seconds(sum(table.columns['duration']))))
+
+
+if __name__ == '__main__':
+    main()
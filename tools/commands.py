@@ -0,0 +1,70 @@
+"""
+Command records produced by the protocol stand-ins.
+"""
+
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass
+class Command:
+    """ One robot action issued by a protocol """
+
+    name: str
+    pipette: str = ''
+    labware: str = ''
+    slot: str = ''
+    well: str = ''
+    volume: float = 0.0
+    flow_rate: float = 0.0
+    dispense_flow_rate: float = 0.0   # mix only
+    repetitions: int = 1              # aspirate/dispense cycles of a mix
+    point: Optional[Tuple[float, float, float]] = None
+    above_top: Optional[float] = None   # move target height over the well top
+    strategy: str = ''
+    seconds: float = 0.0
+    temperature: Optional[float] = None   # tempdeck target, None when off
+    speeds: Optional[Dict[str, float]] = None   # head_speed axis limits
+    text: str = ''
+    function: str = ''   # protocol function that issued the command
+    context: str = ''    # enclosing compound commands, e.g. 'transfer/air_gap'
+    start: float = 0.0
+    duration: float = 0.0
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration
+
+
+class Recorder:
+    """ Collects the commands issued while a protocol file runs """
+
+    def __init__(self, protocol_file: str = '<protocol>'):
+        self.protocol_file = protocol_file
+        self.commands: List[Command] = []
+        self._context: List[str] = []
+
+    def record(self, name: str, **fields) -> Command:
+        command = Command(name, function=self._caller(),
+                          context='/'.join(self._context), **fields)
+        self.commands.append(command)
+        return command
+
+    @contextmanager
+    def compound(self, name: str):
+        """ Tag every command recorded inside the block with [name] """
+        self._context.append(name)
+        try:
+            yield
+        finally:
+            self._context.pop()
+
+    def _caller(self) -> str:
+        frame = sys._getframe(2)
+        while frame is not None:
+            if frame.f_code.co_filename == self.protocol_file:
+                return frame.f_code.co_name
+            frame = frame.f_back
+        return ''
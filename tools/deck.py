@@ -0,0 +1,291 @@
+"""
+Deck geometry shared by the protocol stand-ins.
+
+Coordinates are in mm in the robot frame: slot 1 is the origin, x grows
+to the right and y towards the back of the deck. They only need to be good
+enough to turn moves into travel times.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+SLOT_PITCH = (132.5, 90.5)
+ROW_NAMES = 'ABCDEFGH'
+
+# footprint offsets of well A1 from the front-left corner of a slot
+A1_OFFSET = (14.38, 74.24)
+
+# name -> geometry. 'height' is the z of the well tops above the slot,
+# 'tip_volume' marks tip racks (None when the legacy rack has no volume)
+LABWARE_DEFINITIONS: Dict[str, dict] = {
+    'opentrons_96_filtertiprack_200ul': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=5.23, depth=59.3,
+        volume=200, height=64.49, tip_volume=200),
+    'opentrons_96_tiprack_300ul': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=5.23, depth=59.3,
+        volume=300, height=64.49, tip_volume=300),
+    'opentrons_96_filtertiprack_20ul': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=3.27, depth=39.2,
+        volume=20, height=39.85, tip_volume=20),
+    'opentrons_96_filtertiprack_10ul': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=3.27, depth=39.2,
+        volume=10, height=39.85, tip_volume=10),
+    'opentrons-tiprack-300ul': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=6.4, depth=60,
+        volume=300, height=64.49, tip_volume=300),
+    'tiprack-200ul': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=3.5, depth=60,
+        volume=200, height=64.49, tip_volume=None),
+    'trough-12row': dict(
+        grid=(12, 1), spacing=(9, 0), diameter=8.33, depth=38,
+        volume=22000, height=40),
+    '96-flat': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=6.4, depth=10.5,
+        volume=400, height=10.5),
+    '96-PCR-flat': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=5.5, depth=9.8,
+        volume=300, height=9.8),
+    'corning_96_wellplate_360ul_flat': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=6.86, depth=10.67,
+        volume=360, height=14.22),
+    '96-deep-well': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=8.2, depth=33.5,
+        volume=2000, height=33.5),
+    'nest_96_wellplate_100ul_pcr_full_skirt': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=5.34, depth=14.78,
+        volume=100, height=15.7),
+    'opentrons_96_aluminumblock_nest_wellplate_100ul': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=5.34, depth=14.78,
+        volume=100, height=18.16),
+    'nest_96_wellplate_2ml_deep': dict(
+        grid=(12, 8), spacing=(9, 9), diameter=8.2, depth=38,
+        volume=2000, height=41),
+    'fixed-trash': dict(
+        grid=(1, 1), spacing=(0, 0), diameter=80, depth=77,
+        volume=1100000, height=82, trash=True),
+}
+
+# height of the labware seat above the deck for each module type
+MODULE_HEIGHTS = {
+    'magdeck': 32.0,
+    'tempdeck': 9.0,
+}
+
+
+def slot_origin(slot) -> Tuple[float, float]:
+    """ Front-left corner of deck [slot] (1-12) """
+    index = int(slot) - 1
+    if not 0 <= index < 12:
+        raise ValueError('Unknown deck slot: {}'.format(slot))
+    return (index % 3) * SLOT_PITCH[0], (index // 3) * SLOT_PITCH[1]
+
+
+class Location:
+    """ A point relative to the top or bottom of a well """
+
+    __slots__ = ('well', 'reference', 'offset')
+
+    def __init__(self, well: 'Well', reference: str, offset: float):
+        self.well = well
+        self.reference = reference
+        self.offset = offset
+
+    @property
+    def point(self) -> Tuple[float, float, float]:
+        well = self.well
+        z = well.z_top if self.reference == 'top' else well.z_bottom
+        return well.x, well.y, z + self.offset
+
+    def __repr__(self):
+        return '<Location {}.{}({:g})>'.format(
+            self.well, self.reference, self.offset)
+
+
+class Well:
+    """ A single well (or tip slot) of a piece of labware """
+
+    __slots__ = ('labware', 'name', 'column', 'row', 'x', 'y',
+                 'depth', 'diameter', 'volume')
+
+    def __init__(self, labware, name, column, row, x, y):
+        self.labware = labware
+        self.name = name
+        self.column = column
+        self.row = row
+        self.x = x
+        self.y = y
+        self.depth = labware.definition['depth']
+        self.diameter = labware.definition['diameter']
+        self.volume = labware.definition['volume']
+
+    @property
+    def properties(self) -> dict:
+        return {'depth': self.depth, 'diameter': self.diameter,
+                'total-liquid-volume': self.volume}
+
+    @property
+    def z_top(self) -> float:
+        return self.labware.z_top
+
+    @property
+    def z_bottom(self) -> float:
+        return self.labware.z_top - self.depth
+
+    def top(self, z=0, **kwargs) -> Location:
+        return Location(self, 'top', z)
+
+    def bottom(self, z=0, **kwargs) -> Location:
+        return Location(self, 'bottom', z)
+
+    def max_volume(self):
+        return self.volume
+
+    def __str__(self):
+        return '<Well {}>'.format(self.name)
+
+    __repr__ = __str__
+
+
+class WellSeries(list):
+    """ A row or column of wells; locations refer to its first well """
+
+    def top(self, z=0, **kwargs) -> Location:
+        return self[0].top(z)
+
+    def bottom(self, z=0, **kwargs) -> Location:
+        return self[0].bottom(z)
+
+    def max_volume(self):
+        return self[0].max_volume()
+
+    def __str__(self):
+        return '<WellSeries: {}>'.format(''.join(str(w) for w in self))
+
+    __repr__ = __str__
+
+
+class Labware:
+    """ A loaded piece of labware with its wells laid out on the deck """
+
+    def __init__(self, name: str, definition: dict, slot, label=None,
+                 z_offset: float = 0.0):
+        self.name = name
+        self.definition = definition
+        self.slot = str(slot)
+        self.label = label or name
+        self.z_top = z_offset + definition['height']
+
+        columns, rows = definition['grid']
+        spacing_x, spacing_y = definition['spacing']
+        origin_x, origin_y = slot_origin(slot)
+        self._wells: List[Well] = []
+        self._by_name: Dict[str, Well] = {}
+        for column in range(columns):
+            for row in range(rows):
+                well_name = '{}{}'.format(ROW_NAMES[row], column + 1)
+                well = Well(self, well_name, column, row,
+                            origin_x + A1_OFFSET[0] + column * spacing_x,
+                            origin_y + A1_OFFSET[1] - row * spacing_y)
+                self._wells.append(well)
+                self._by_name[well_name] = well
+
+    @property
+    def parent(self) -> str:
+        return '<Slot {}>'.format(self.slot)
+
+    @property
+    def is_tiprack(self) -> bool:
+        return 'tip_volume' in self.definition
+
+    @property
+    def is_trash(self) -> bool:
+        return self.definition.get('trash', False)
+
+    @property
+    def n_rows(self) -> int:
+        return self.definition['grid'][1]
+
+    @property
+    def n_columns(self) -> int:
+        return self.definition['grid'][0]
+
+    def well(self, key) -> Well:
+        if isinstance(key, str):
+            try:
+                return self._by_name[key]
+            except KeyError:
+                raise KeyError('{} has no well {}'.format(self.name, key))
+        return self._wells[key]
+
+    def wells(self, *args, **kwargs):
+        """ All wells, a single well by name/index, or a series of wells """
+        if not args:
+            return WellSeries(self._wells)
+        if len(args) == 1 and not isinstance(args[0], (list, tuple)):
+            return self.well(args[0])
+        keys = args[0] if len(args) == 1 else args
+        return WellSeries(self.well(k) for k in keys)
+
+    def row(self, index) -> WellSeries:
+        if isinstance(index, str):
+            index = ROW_NAMES.index(index)
+        return WellSeries(w for w in self._wells if w.row == index)
+
+    def column(self, index) -> WellSeries:
+        if isinstance(index, str):
+            index = int(index) - 1
+        return WellSeries(w for w in self._wells if w.column == index)
+
+    def rows(self, *args, **kwargs):
+        if not args:
+            return [self.row(i) for i in range(self.n_rows)]
+        if len(args) == 1:
+            return self.row(args[0])
+        return [self.row(i) for i in args]
+
+    def cols(self, *args, length=None, **kwargs):
+        if not args:
+            return [self.column(i) for i in range(self.n_columns)]
+        if length is not None:
+            first = args[0] if isinstance(args[0], int) else int(args[0]) - 1
+            return [self.column(first + i) for i in range(length)]
+        if len(args) == 1:
+            return self.column(args[0])
+        return [self.column(i) for i in args]
+
+    columns = cols
+
+    def top(self, z=0, **kwargs) -> Location:
+        return self._wells[0].top(z)
+
+    def bottom(self, z=0, **kwargs) -> Location:
+        return self._wells[0].bottom(z)
+
+    def max_volume(self):
+        return self._wells[0].max_volume()
+
+    def __getitem__(self, key) -> Well:
+        return self.well(key)
+
+    def __iter__(self):
+        return iter(self._wells)
+
+    def __len__(self):
+        return len(self._wells)
+
+    def __str__(self):
+        return '<Container {}>'.format(self.label)
+
+    __repr__ = __str__
+
+
+def first_well(location) -> Optional[Well]:
+    """ The well a location, well, series or labware refers to """
+    if isinstance(location, Location):
+        return location.well
+    if isinstance(location, Well):
+        return location
+    if isinstance(location, (WellSeries, list, tuple)):
+        return first_well(location[0])
+    if isinstance(location, Labware):
+        return location.well(0)
+    return None
@@ -0,0 +1,137 @@
+"""
+Estimate the wall-clock time of a protocol for a range of column counts.
+
+    python -m tools.estimate_runtime "RNA Extraction (BOMB) V10.py"
+    python -m tools.estimate_runtime "Beckman Coulter RNAdvance Viral XP V1.py" \\
+        --columns 6 12 --model my_robot.json --csv
+
+Each run is simulated against the stand-in API and its command stream is
+replayed through the cost model; the time is broken down per category.
+"""
+
+import argparse
+import csv
+import sys
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, Iterator, Tuple
+
+from .peephole import optimize, time_bound_cut
+from .cache import simulate
+from .timing import CostModel, format_seconds, replay
+
+CATEGORIES = ('tip handling', 'mixing', 'delay', 'magdeck settling',
+              'blow_air', 'liquid handling', 'robot')
+
+TIP_COMMANDS = ('pick_up_tip', 'drop_tip', 'return_tip')
+MIX_FUNCTIONS = ('mix_wells', 'resuspend', 'resuspendLITE')
+
+
+def label_categories(commands: Iterable) -> Iterator[Tuple[object, str]]:
+    """ Pair each of [commands] with the category its time counts towards """
+    # delays count as settling from engaging the magnet until the first
+    # liquid is handled after it
+    settling = False
+    for command in commands:
+        name = command.name
+        if name == 'magdeck_engage':
+            settling = True
+        elif name in ('aspirate', 'dispense', 'mix', 'blow_out',
+                      'magdeck_disengage'):
+            settling = False
+
+        if name in TIP_COMMANDS or any(c in command.context
+                                       for c in TIP_COMMANDS):
+            category = 'tip handling'
+        elif command.function == 'blow_air':
+            category = 'blow_air'
+        elif name == 'delay':
+            category = 'magdeck settling' if settling else 'delay'
+        elif 'mix' in command.context.split('/') \
+                or command.function in MIX_FUNCTIONS:
+            category = 'mixing'
+        elif name in ('home', 'magdeck_engage', 'magdeck_disengage', 'pause') \
+                or name.startswith('tempdeck_'):
+            category = 'robot'
+        else:
+            category = 'liquid handling'
+        yield command, category
+
+
+def categorize(commands: Iterable) -> Dict[str, float]:
+    """ Sum the durations of timed [commands] per category """
+    totals = OrderedDict((category, 0.0) for category in CATEGORIES)
+    for command, category in label_categories(commands):
+        totals[category] += command.duration
+    return totals
+
+
+def estimate(protocol, columns=range(1, 13), test_mode=False, model=None,
+             optimized=False):
+    """ Rows of per-category seconds for each column count; [optimized]
+    times the stream after the tools.peephole pass, with what it cut from
+    time-bound work added back, as the robot would spend it anyway """
+    model = model or CostModel()
+    rows = []
+    for n in columns:
+        run = simulate(protocol, {'number_of_sample_columns': n,
+                                  'test_mode': test_mode}, model)
+        commands, duration = run.commands, run.duration
+        cut = Counter()
+        if optimized:
+            commands, _ = optimize(commands)
+            duration = replay(commands, model)
+            cut = time_bound_cut(run.commands, commands)
+            duration += sum(cut.values())
+        row = OrderedDict(columns=n)
+        row.update(categorize(commands))
+        for category, seconds in cut.items():
+            row[category] += seconds
+        row['total'] = duration
+        row['commands'] = len(commands)
+        rows.append(row)
+    return rows
+
+
+def print_table(rows, out=sys.stdout):
+    headers = list(rows[0])
+    widths = [max(len(h), 8) for h in headers]
+    out.write('  '.join(h.rjust(w) for h, w in zip(headers, widths)) + '\n')
+    for row in rows:
+        cells = []
+        for key, width in zip(headers, widths):
+            value = row[key]
+            if key not in ('columns', 'commands'):
+                value = format_seconds(value)
+            cells.append(str(value).rjust(width))
+        out.write('  '.join(cells) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol')
+    parser.add_argument('--columns', type=int, nargs='+',
+                        default=list(range(1, 13)))
+    parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('--model', help='JSON file overriding cost model '
+                        'fields')
+    parser.add_argument('--optimize', action='store_true',
+                        help='time the stream after removing redundant '
+                        'commands (see tools.peephole); an estimate only, '
+                        'runs still execute what the protocol issues')
+    parser.add_argument('--csv', action='store_true',
+                        help='write seconds as CSV instead of a table')
+    args = parser.parse_args(argv)
+
+    model = CostModel.from_json(args.model) if args.model else CostModel()
+    rows = estimate(args.protocol, args.columns, args.test_mode, model,
+                    args.optimize)
+    if args.csv:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Rehearse stopping and resuming a Station B run with its step journal.
+
+    python -m tools.journal "RNA Extraction (BOMB) V10.py" --columns 12 \\
+        --stop-after 40 120
+
+The BOMB protocol journals every column and one-off action it finishes to
+journal_file (see StepJournal in the protocol); the Beckman protocol keeps
+no journal and cannot be resumed. This stops a simulated run
+once N units are journalled, as a crash would, resumes it from the journal
+and checks the two parts against one uninterrupted run:
+
+- every unit is done once, in the same order
+- every plate well gets the same volume
+- the resumed part picks up no tip the stopped part used, except the ones
+  it returned to their rack for reuse
+
+Without --stop-after the run is stopped after the first unit of each kind
+of work in turn. For each stop it prints the time the resumed part takes and
+the new tips it picks up, against running again from the start.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from collections import defaultdict
+from typing import Dict, List
+
+from .runner import parameters, simulate
+from .timing import format_seconds
+from .tip_plan import count_tips
+
+# labware whose volumes are not compared
+UNTRACKED = ('trash', 'trough')
+
+
+def units(path) -> List[str]:
+    """ The units journalled in [path], in order """
+    with open(path) as journal:
+        return [entry['unit'] for entry in map(json.loads, journal)
+                if 'unit' in entry]
+
+
+def volumes(commands) -> Dict[tuple, float]:
+    """ ul dispensed into each plate well """
+    dispensed = defaultdict(float)
+    for command in commands:
+        if command.name == 'dispense' and command.labware not in UNTRACKED:
+            dispensed[command.labware, command.well] += command.volume
+    return dispensed
+
+
+def reused_tips(stopped, resumed) -> List[tuple]:
+    """ Tips the [resumed] part picks up although the [stopped] part used
+    them and did not return them to their rack """
+    last = {}
+    for command in stopped:
+        if command.name == 'pick_up_tip':
+            tip = (command.slot, command.well)
+            last[tip] = command.name
+            attached = tip
+        elif command.name in ('drop_tip', 'return_tip'):
+            last[attached] = command.name
+    return sorted({(c.slot, c.well) for c in resumed
+                   if c.name == 'pick_up_tip'
+                   and last.get((c.slot, c.well), 'return_tip')
+                   != 'return_tip'})
+
+
+def rehearse(protocol, params, stop_after, full, full_units, directory):
+    """ Stop a run of [protocol] after [stop_after] units, resume it and
+    check it against the uninterrupted [full] run; returns a report row """
+    path = os.path.join(directory, 'journal_{}.jsonl'.format(stop_after))
+    stopped = simulate(protocol, dict(params, journal_file=path,
+                                      stop_after_units=stop_after),
+                       allow_failure=True)
+    if not stopped.error:
+        raise ValueError('The run has fewer than {} units'.format(stop_after))
+    last = units(path)[-1]
+    resumed = simulate(protocol, dict(params, journal_file=path, resume=True))
+
+    problems = []
+    if units(path) != full_units:
+        problems.append('units differ from the uninterrupted run')
+    both = volumes(stopped.commands)
+    for key, volume in volumes(resumed.commands).items():
+        both[key] += volume
+    expected = volumes(full.commands)
+    wrong = [key for key in set(both) | set(expected)
+             if abs(both.get(key, 0) - expected.get(key, 0)) > 1e-6]
+    if wrong:
+        problems.append('volumes differ in {} wells, e.g. {} {}'.format(
+            len(wrong), *sorted(wrong)[0]))
+    reused = reused_tips(stopped.commands, resumed.commands)
+    if reused:
+        problems.append('reuses {} spent tips, e.g. slot {} {}'.format(
+            len(reused), *reused[0]))
+    return {
+        'stop after': last,
+        'stopped at': stopped.duration,
+        'resume': resumed.duration,
+        'resume new tips': count_tips(resumed.commands)['new tips'],
+        'restart': full.duration,
+        'restart new tips': count_tips(full.commands)['new tips'],
+        'check': '; '.join(problems) or 'ok',
+    }
+
+
+def first_of_each_kind(full_units) -> List[int]:
+    """ Stop points after the first unit of each step and kind of work """
+    stops = []
+    seen = set()
+    for index, unit in enumerate(full_units):
+        kind = unit.rsplit('/', 1)[0] if unit.count('/') > 1 else unit
+        if kind not in seen:
+            seen.add(kind)
+            stops.append(index + 1)
+    return stops
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol')
+    parser.add_argument('--columns', type=int, default=12)
+    parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('--stop-after', type=int, nargs='+',
+                        help='journalled units before each stop')
+    args = parser.parse_args(argv)
+
+    if 'journal_file' not in parameters(args.protocol):
+        parser.error('{} keeps no step journal, only the BOMB protocol '
+                     'does'.format(args.protocol))
+    params = {'number_of_sample_columns': args.columns,
+              'test_mode': args.test_mode}
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'journal.jsonl')
+        full = simulate(args.protocol, dict(params, journal_file=path))
+        full_units = units(path)
+        stops = args.stop_after or first_of_each_kind(full_units)
+        if not all(1 <= stop < len(full_units) for stop in stops):
+            parser.error('--stop-after must be between 1 and {}'.format(
+                len(full_units) - 1))
+        out = sys.stdout
+        out.write('{} units journalled, uninterrupted run {}\n'.format(
+            len(full_units), format_seconds(full.duration)))
+        for stop_after in stops:
+            row = rehearse(args.protocol, params, stop_after, full,
+                           full_units, directory)
+            failed = failed or row['check'] != 'ok'
+            out.write('{:>4} {:<28} stopped at {}, resume {} and {} new tips '
+                      'instead of {} and {}: {}\n'.format(
+                          stop_after, row['stop after'],
+                          format_seconds(row['stopped at']),
+                          format_seconds(row['resume']),
+                          row['resume new tips'],
+                          format_seconds(row['restart']),
+                          row['restart new tips'], row['check']))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
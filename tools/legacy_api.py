@@ -0,0 +1,780 @@
+"""
+Recording stand-in for the legacy (v1) opentrons protocol API.
+
+Protocol files that do ``from opentrons import labware, instruments,
+modules, robot, types`` run against a :class:`LegacySession` unchanged.
+Liquid handling follows the v1 semantics closely enough (implicit moves,
+transfer splitting, air gaps, tip iteration) that the recorded command
+stream can be replayed through a cost model. The magnetic and temperature
+modules, ``robot.pause`` and the light and introspection calls of the
+notebook-exported protocols are covered too.
+
+One call is not in the v1 API: ``robot.estimated_time()`` gives the time
+the cost model puts on the commands issued so far, so a protocol's clock
+can follow the simulated run.
+"""
+
+import threading
+import types as _types
+from collections import namedtuple
+
+from .commands import Recorder
+from .timing import CostModel, Replay
+from .deck import (LABWARE_DEFINITIONS, MODULE_HEIGHTS, Labware, Location,
+                   Well, WellSeries, first_well)
+
+# model -> (max volume, min volume, channels, aspirate, dispense flow rate)
+PIPETTE_MODELS = {
+    'P10_Single': (10, 1, 1, 5, 10),
+    'P10_Multi': (10, 1, 8, 5, 10),
+    'P50_Single': (50, 5, 1, 25, 50),
+    'P50_Multi': (50, 5, 8, 25, 50),
+    'P300_Single': (300, 30, 1, 150, 300),
+    'P300_Multi': (300, 30, 8, 150, 300),
+    'P1000_Single': (1000, 100, 1, 500, 1000),
+    'P20_Single_GEN2': (20, 1, 1, 3.78, 3.78),
+    'P20_Multi_GEN2': (20, 1, 8, 7.6, 7.6),
+    'P300_Single_GEN2': (300, 20, 1, 46.43, 46.43),
+    'P300_Multi_GEN2': (300, 20, 8, 94, 94),
+    'P1000_Single_GEN2': (1000, 100, 1, 137.35, 137.35),
+}
+
+TRASH_SLOT = '12'
+
+
+class NoTipAttachedError(RuntimeError):
+    pass
+
+
+def _location_of(location, clearance):
+    """ Resolve a v1 location argument to a (well, Location) pair """
+    if location is None:
+        return None, None
+    if isinstance(location, Location):
+        return location.well, location
+    well = first_well(location)
+    if well is None:
+        raise TypeError('Not a location: {!r}'.format(location))
+    return well, well.bottom(min(well.depth, clearance))
+
+
+class Pipette:
+    """ v1 pipette recording its actions instead of moving """
+
+    def __init__(self, session, model, mount, trash_container=None,
+                 tip_racks=(), aspirate_flow_rate=None,
+                 dispense_flow_rate=None, min_volume=None, max_volume=None):
+        max_vol, min_vol, channels, aspirate, dispense = PIPETTE_MODELS[model]
+        self._session = session
+        self._recorder = session.recorder
+        self.name = '{} ({})'.format(model, mount)
+        self.model = model
+        self.mount = mount
+        self.channels = channels
+        self.max_volume = max_volume or max_vol
+        self.min_volume = min_volume or min_vol
+        self.tip_racks = list(tip_racks)
+        self.trash_container = trash_container or session.fixed_trash
+        self.flow_rate = {
+            'aspirate': aspirate_flow_rate or aspirate,
+            'dispense': dispense_flow_rate or dispense,
+            'blow_out': dispense_flow_rate or dispense,
+        }
+        self.current_volume = 0
+        self.previous_placeable = None
+        self._working_volume = self.max_volume
+        self._tip = None
+        self._blown_out = False
+        self._starting_tip = None
+        self._tip_iter = self._iter_tips()
+
+    def __str__(self):
+        return '<{}>'.format(self.name)
+
+    __repr__ = __str__
+
+    # -- state ---------------------------------------------------------------
+
+    @property
+    def tip_attached(self):
+        return self._tip is not None
+
+    has_tip = tip_attached
+
+    def current_tip(self):
+        return self._tip
+
+    def _iter_tips(self):
+        index = 0
+        started = self._starting_tip is None
+        while index < len(self.tip_racks):
+            rack = self.tip_racks[index]
+            wells = rack.rows('A') if self.channels > 1 else rack.wells()
+            for well in wells:
+                started = started or well is self._starting_tip
+                if started:
+                    yield well
+            index += 1
+            if index == len(self.tip_racks) and self._session.extra_tip_racks:
+                # the operator swaps a fresh rack into the slot of the last one
+                self.tip_racks.append(Labware(
+                    rack.name, rack.definition, rack.slot,
+                    '{} (extra {})'.format(rack.label, index), rack.z_top
+                    - rack.definition['height']))
+
+    def reset_tip_tracking(self):
+        self._tip_iter = self._iter_tips()
+
+    def start_at_tip(self, tip):
+        """ Take tips from [tip] on, in rack order """
+        self._starting_tip = first_well(tip)
+        self.reset_tip_tracking()
+
+    def _expected_working_volume(self):
+        if not self.tip_attached and self.tip_racks:
+            tip_volume = self.tip_racks[0].definition.get('tip_volume')
+            if tip_volume:
+                return min(tip_volume, self._working_volume)
+        return self._working_volume
+
+    def _record(self, name, **fields):
+        return self._recorder.record(name, pipette=self.name, **fields)
+
+    # -- settings ------------------------------------------------------------
+
+    def set_flow_rate(self, aspirate=None, dispense=None, blow_out=None):
+        for key, value in (('aspirate', aspirate), ('dispense', dispense),
+                           ('blow_out', blow_out)):
+            if value is not None:
+                self.flow_rate[key] = value
+        self._record('set_flow_rate', text='aspirate {aspirate}, dispense '
+                     '{dispense}, blow_out {blow_out}'.format(**self.flow_rate))
+        return self
+
+    # -- motion --------------------------------------------------------------
+
+    def move_to(self, location, strategy=None):
+        if not location:
+            return self
+        well, loc = _location_of(location, 0)
+        if isinstance(location, (Well, WellSeries, Labware)):
+            loc = well.top()
+        if strategy is None:
+            strategy = 'direct' if well is self.previous_placeable else 'arc'
+        self.previous_placeable = well
+        point = loc.point
+        self._record('move_to', labware=well.labware.label, well=well.name,
+                     point=point, above_top=point[2] - well.z_top,
+                     strategy=strategy)
+        return self
+
+    def _move_home(self):
+        self.previous_placeable = None
+        self._record('home_z')
+
+    # -- liquid handling -----------------------------------------------------
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        if not self.tip_attached:
+            raise NoTipAttachedError(
+                'Aspirate commands not allowed if there is not tip attached '
+                'to the pipette')
+        if not isinstance(volume, (int, float)):
+            if volume is not None and location is None:
+                location = volume
+            volume = self._working_volume - self.current_volume
+        if volume == 0:
+            return self
+        if self.current_volume + volume > self._working_volume:
+            raise RuntimeWarning(
+                'Pipette with working volume of {0} cannot hold volume {1}'
+                .format(self._working_volume, self.current_volume + volume))
+
+        with self._recorder.compound('aspirate'):
+            well = self._move_to_aspirate(location)
+        self._record('aspirate', volume=volume,
+                     flow_rate=self.flow_rate['aspirate'] * rate,
+                     labware=well.labware.label if well else '',
+                     well=well.name if well else '')
+        self.current_volume += volume
+        return self
+
+    def _move_to_aspirate(self, location):
+        """ Moves ahead of an aspirate at [location]; returns the well """
+        well, loc = _location_of(location, 1.0)
+        if well is not None and well is not self.previous_placeable:
+            self.move_to(well.top())
+        if self.current_volume == 0 and self._blown_out:
+            # plunger is reset above the liquid
+            if well is not None:
+                self.move_to(well.top())
+            self._blown_out = False
+        if loc is not None:
+            self.move_to(loc, strategy='direct')
+        return well or self.previous_placeable
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        if not isinstance(volume, (int, float)):
+            if volume is not None and location is None:
+                location = volume
+            volume = self.current_volume
+        volume = min(self.current_volume, volume)
+        if volume == 0:
+            return self
+
+        well, loc = _location_of(location, 0.5)
+        if loc is not None:
+            with self._recorder.compound('dispense'):
+                self.move_to(loc)
+        well = well or self.previous_placeable
+        self._record('dispense', volume=volume,
+                     flow_rate=self.flow_rate['dispense'] * rate,
+                     labware=well.labware.label if well else '',
+                     well=well.name if well else '')
+        self.current_volume -= volume
+        return self
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        if not isinstance(volume, (int, float)):
+            if volume is not None and location is None:
+                location = volume
+            volume = self._working_volume - self.current_volume
+        if location is None and self.previous_placeable is not None:
+            location = self.previous_placeable
+        if not self.tip_attached:
+            raise NoTipAttachedError(
+                'Aspirate commands not allowed if there is not tip attached '
+                'to the pipette')
+        if volume == 0:
+            return self
+        if self.current_volume + volume > self._working_volume:
+            raise RuntimeWarning(
+                'Pipette with working volume of {0} cannot hold volume {1}'
+                .format(self._working_volume, self.current_volume + volume))
+
+        # one macro command for all cycles: the robot runs each of them, but
+        # the record and its replay cost do not grow with the repetitions
+        with self._recorder.compound('mix'):
+            well = self._move_to_aspirate(location)
+            self._record('mix', volume=volume,
+                         repetitions=max(int(repetitions), 1),
+                         flow_rate=self.flow_rate['aspirate'] * rate,
+                         dispense_flow_rate=self.flow_rate['dispense'] * rate,
+                         labware=well.labware.label if well else '',
+                         well=well.name if well else '')
+        return self
+
+    def blow_out(self, location=None):
+        with self._recorder.compound('blow_out'):
+            self.move_to(location)
+        well = self.previous_placeable
+        self._record('blow_out', flow_rate=self.flow_rate['blow_out'],
+                     labware=well.labware.label if well else '',
+                     well=well.name if well else '')
+        self.current_volume = 0
+        self._blown_out = True
+        return self
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0,
+                  speed=60.0):
+        well = first_well(location) if location else self.previous_placeable
+        with self._recorder.compound('touch_tip'):
+            if well is not None:
+                self.move_to(well.top(v_offset))
+            self._record('touch_tip', seconds=2 * well.diameter * radius /
+                         speed if well else 0.0)
+        return self
+
+    def air_gap(self, volume=None, height=None):
+        if height is None:
+            height = 5
+        if volume != 0:
+            with self._recorder.compound('air_gap'):
+                self.move_to(self.previous_placeable.top(height))
+                self.aspirate(volume)
+        return self
+
+    def delay(self, seconds=0, minutes=0):
+        total = minutes * 60 + seconds
+        self._record('delay', seconds=total,
+                     text='Delaying for {:g} seconds'.format(total))
+        return self
+
+    def home(self):
+        self._move_home()
+        return self
+
+    # -- tips ----------------------------------------------------------------
+
+    def get_next_tip(self):
+        try:
+            return next(self._tip_iter)
+        except StopIteration:
+            raise RuntimeWarning('{} has run out of tips'.format(self.name))
+
+    def pick_up_tip(self, location=None, presses=None, increment=None):
+        well = first_well(location) if location else self.get_next_tip()
+        with self._recorder.compound('pick_up_tip'):
+            self.move_to(well.top())
+            self._record('pick_up_tip', labware=well.labware.label,
+                         slot=well.labware.slot, well=well.name)
+            self._move_home()
+        self._tip = well
+        self.current_volume = 0
+        self._blown_out = False
+        tip_volume = well.labware.definition.get('tip_volume')
+        self._working_volume = float(min(self.max_volume, tip_volume)
+                                     if tip_volume else self.max_volume)
+        return self
+
+    def drop_tip(self, location=None, home_after=True, _name='drop_tip'):
+        if location is None:
+            location = self.trash_container
+        well = first_well(location)
+        with self._recorder.compound(_name):
+            if well is not None:
+                offset = -10 if well.labware.is_tiprack else 0
+                self.move_to(well.top(offset))
+            self._record(_name, labware=well.labware.label if well else '',
+                         slot=well.labware.slot if well else '',
+                         well=well.name if well else '')
+            if home_after:
+                self._move_home()
+        self._tip = None
+        self.current_volume = 0
+        self._working_volume = self.max_volume
+        return self
+
+    def return_tip(self, home_after=True):
+        if not self.tip_attached:
+            return self
+        return self.drop_tip(self._tip, home_after=home_after,
+                             _name='return_tip')
+
+    # -- complex liquid handling ---------------------------------------------
+
+    def transfer(self, volume, source, dest, **kwargs):
+        kwargs['mode'] = kwargs.get('mode', 'transfer')
+        touch_tip = kwargs.get('touch_tip', False)
+        if touch_tip is True:
+            touch_tip = -1
+        kwargs['touch_tip'] = touch_tip
+
+        tip_options = {'once': 1, 'never': 0, 'always': float('inf')}
+        tip_option = kwargs.get('new_tip', 'once')
+        tips = tip_options.get(tip_option)
+        if tips is None:
+            raise ValueError('Unknown "new_tip" option: {}'.format(tip_option))
+
+        if 'air_gap' in kwargs:
+            expected = self._expected_working_volume()
+            if kwargs['air_gap'] < 0 or kwargs['air_gap'] >= expected:
+                raise ValueError(
+                    "air_gap must be between 0uL and the pipette's expected "
+                    "working volume, {}uL".format(expected))
+
+        plan = self._create_transfer_plan(volume, source, dest, **kwargs)
+        with self._recorder.compound(kwargs['mode']):
+            self._run_transfer_plan(tips, plan, **kwargs)
+        return self
+
+    def distribute(self, volume, source, dest, **kwargs):
+        """ One aspirate per batch of dispenses, plus a disposal volume
+        blown out in the trash """
+        kwargs['mode'] = 'distribute'
+        kwargs['mix_after'] = (0, 0)
+        kwargs.setdefault('disposal_vol', self.min_volume)
+        return self.transfer(volume, source, dest, **kwargs)
+
+    def _create_transfer_plan(self, volume, source, dest, **kwargs):
+        sources, targets = _source_target_lists(
+            _as_list(source, self.channels), _as_list(dest, self.channels))
+        volumes = _volume_list(volume, len(targets))
+        plan = [{'aspirate': {'location': s, 'volume': v},
+                 'dispense': {'location': t, 'volume': v}}
+                for s, t, v in zip(sources, targets, volumes)]
+
+        max_vol = self._expected_working_volume() - kwargs.get('air_gap', 0)
+        if kwargs.get('divide', True) and kwargs.get('carryover', True):
+            plan = _expand_for_carryover(max_vol, plan)
+        if kwargs['mode'] == 'distribute':
+            plan = _compress_for_distribute(
+                max_vol - kwargs['disposal_vol'], kwargs['disposal_vol'], plan)
+        return plan
+
+    def _run_transfer_plan(self, tips, plan, **kwargs):
+        air_gap = kwargs.get('air_gap', 0)
+        touch_tip = kwargs.get('touch_tip', False)
+        rate = kwargs.get('rate', 1)
+
+        for i, step in enumerate(plan):
+            aspirate = step.get('aspirate')
+            dispense = step.get('dispense')
+
+            if aspirate:
+                if self.tip_racks and tips > 0 and not self.tip_attached:
+                    self.pick_up_tip()
+                mix_before = kwargs.get('mix', kwargs.get('mix_before'))
+                if self.current_volume == 0:
+                    self._mix_during_transfer(mix_before, aspirate['location'])
+                self.aspirate(aspirate['volume'], aspirate['location'],
+                              rate=rate)
+                if air_gap:
+                    self.air_gap(air_gap)
+                if touch_tip or touch_tip == 0 and touch_tip is not False:
+                    self.touch_tip(v_offset=touch_tip)
+
+            if dispense:
+                well = first_well(dispense['location'])
+                if air_gap:
+                    self.dispense(air_gap, well.top(5), rate=rate)
+                self.dispense(dispense['volume'], dispense['location'],
+                              rate=rate)
+                self._mix_during_transfer(kwargs.get('mix_after'), well)
+                if step is plan[-1] or plan[i + 1].get('aspirate'):
+                    if touch_tip or touch_tip == 0 and touch_tip is not False:
+                        self.touch_tip(v_offset=touch_tip)
+                    self._blowout_during_transfer(kwargs.get('blow_out'))
+                    tips = self._drop_tip_during_transfer(
+                        tips, i, len(plan), kwargs.get('trash', True))
+                else:
+                    if air_gap:
+                        self.air_gap(air_gap)
+
+    def _mix_during_transfer(self, mix, location):
+        if self.current_volume == 0 and isinstance(mix, (tuple, list)):
+            if len(mix) == 2 and 0 not in mix:
+                self.mix(mix[0], mix[1], location)
+
+    def _blowout_during_transfer(self, blow_out):
+        if self.current_volume > 0 or blow_out:
+            if isinstance(blow_out, (Location, Well, WellSeries, Labware)):
+                self.blow_out(blow_out)
+            elif self.current_volume == 0:
+                self.blow_out()
+            else:
+                self.blow_out(self.trash_container)
+
+    def _drop_tip_during_transfer(self, tips, i, total, trash):
+        if tips > 1 or (i + 1 == total and tips > 0):
+            if trash and self.trash_container:
+                self.drop_tip()
+            else:
+                self.return_tip()
+            tips -= 1
+        return tips
+
+
+def _as_list(target, channels):
+    if isinstance(target, WellSeries) and channels > 1:
+        return [target]
+    if isinstance(target, (list, tuple)):
+        return list(target)
+    return [target]
+
+
+def _source_target_lists(sources, targets):
+    if len(sources) < len(targets):
+        if len(targets) % len(sources):
+            raise ValueError('Source and destination lists must be divisible')
+        factor = len(targets) // len(sources)
+        sources = [s for s in sources for _ in range(factor)]
+    elif len(sources) > len(targets):
+        if len(sources) % len(targets):
+            raise ValueError('Source and destination lists must be divisible')
+        factor = len(sources) // len(targets)
+        targets = [t for t in targets for _ in range(factor)]
+    return sources, targets
+
+
+def _volume_list(volume, total):
+    if isinstance(volume, tuple):
+        low, high = volume[0], volume[-1]
+        if total == 1:
+            return [low]
+        return [low + (high - low) * i / (total - 1) for i in range(total)]
+    volumes = list(volume) if isinstance(volume, list) else [volume]
+    if (len(volumes) < total and len(volumes) != 1) or len(volumes) > total:
+        raise RuntimeError('{0} volumes do not match with {1} transfers'
+                           .format(len(volumes), total))
+    return volumes * total if len(volumes) < total else volumes
+
+
+def _expand_for_carryover(max_vol, plan):
+    """ Divide volumes larger than [max_vol] into separate transfers, as v1 """
+    max_vol = float(max_vol)
+    expanded = []
+    for step in plan:
+        source = step['aspirate']['location']
+        target = step['dispense']['location']
+        volume = float(step['aspirate']['volume'])
+        while volume > max_vol * 2:
+            expanded.append({'aspirate': {'location': source, 'volume': max_vol},
+                             'dispense': {'location': target, 'volume': max_vol}})
+            volume -= max_vol
+        if volume > max_vol:
+            volume /= 2
+            expanded.append({'aspirate': {'location': source, 'volume': volume},
+                             'dispense': {'location': target, 'volume': volume}})
+        expanded.append({'aspirate': {'location': source, 'volume': volume},
+                         'dispense': {'location': target, 'volume': volume}})
+    return expanded
+
+
+def _compress_for_distribute(max_vol, disposal_vol, plan):
+    """ Merge the aspirates of a plan from one source, as v1 """
+    source = plan[0]['aspirate']['location']
+    compressed = []
+    volume = 0
+    dispenses = []
+
+    def flush():
+        if dispenses:
+            compressed.append({'aspirate': {'location': source,
+                                            'volume': volume + disposal_vol}})
+            compressed.extend({'dispense': d} for d in dispenses)
+
+    for step in plan:
+        if volume + step['aspirate']['volume'] > max_vol:
+            flush()
+            volume, dispenses = 0, []
+        volume += step['aspirate']['volume']
+        dispenses.append(step['dispense'])
+    flush()
+    return compressed
+
+
+class MagDeck:
+    def __init__(self, session, slot):
+        self._recorder = session.recorder
+        self.slot = str(slot)
+        self.status = 'disengaged'
+
+    def engage(self, height=None, **kwargs):
+        self.status = 'engaged'
+        self._recorder.record('magdeck_engage', seconds=height or 0,
+                              text='Engaging magnetic module')
+
+    def disengage(self):
+        self.status = 'disengaged'
+        self._recorder.record('magdeck_disengage',
+                              text='Disengaging magnetic module')
+
+    def __str__(self):
+        return '<Module magdeck>'
+
+
+class TempDeck:
+    """ Temperature module; the replay times how long it takes to ramp """
+
+    def __init__(self, session, slot):
+        self._recorder = session.recorder
+        self.slot = str(slot)
+        self.target = None
+
+    @property
+    def status(self):
+        return 'idle' if self.target is None else 'holding at target'
+
+    @property
+    def temperature(self):
+        return self.target
+
+    def set_temperature(self, celsius):
+        # v1 returns at once; wait_for_temp() blocks until it is reached
+        self.target = celsius
+        self._recorder.record('tempdeck_set', slot=self.slot,
+                              temperature=celsius,
+                              text='Setting temperature to {} C'.format(
+                                  celsius))
+
+    def wait_for_temp(self):
+        self._recorder.record('tempdeck_wait', slot=self.slot,
+                              temperature=self.target,
+                              text='Waiting for {} C'.format(self.target))
+
+    def deactivate(self):
+        self.target = None
+        self._recorder.record('tempdeck_deactivate', slot=self.slot,
+                              text='Deactivating temperature module')
+
+    def __str__(self):
+        return '<Module tempdeck>'
+
+
+MODULES = {'magdeck': MagDeck, 'tempdeck': TempDeck}
+
+
+class _Labware:
+    """ The ``opentrons.labware`` namespace """
+
+    def __init__(self, session):
+        self._session = session
+        self._custom = {}
+
+    def list(self):
+        return list(LABWARE_DEFINITIONS) + list(self._custom)
+
+    def create(self, name, grid, spacing, diameter, depth, volume=0):
+        self._custom[name] = dict(grid=tuple(grid), spacing=tuple(spacing),
+                                  diameter=diameter, depth=depth,
+                                  volume=volume, height=depth)
+        return self._custom[name]
+
+    def load(self, name, slot, label=None, share=False, version=None):
+        definition = self._custom.get(name) or LABWARE_DEFINITIONS.get(name)
+        if definition is None:
+            raise ValueError('Unknown labware: {}'.format(name))
+        module = self._session.modules_by_slot.get(str(slot))
+        z_offset = MODULE_HEIGHTS[module] if module and share else 0.0
+        loaded = Labware(name, definition, slot, label, z_offset)
+        self._session.loaded_labware.append(loaded)
+        return loaded
+
+
+class _Instruments:
+    """ The ``opentrons.instruments`` namespace """
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, model):
+        if model not in PIPETTE_MODELS:
+            raise AttributeError(model)
+
+        def factory(mount, **kwargs):
+            pipette = Pipette(self._session, model, mount, **kwargs)
+            self._session.pipettes.append(pipette)
+            return pipette
+        return factory
+
+
+class _Modules:
+    """ The ``opentrons.modules`` namespace """
+
+    def __init__(self, session):
+        self._session = session
+
+    def load(self, name, slot):
+        if name not in MODULES:
+            raise ValueError('Unknown module: {}'.format(name))
+        self._session.modules_by_slot[str(slot)] = name
+        return MODULES[name](self._session, slot)
+
+
+class _Robot:
+    """ The ``opentrons.robot`` singleton """
+
+    def __init__(self, session):
+        self._session = session
+        self._recorder = session.recorder
+        self.fixed_trash = session.fixed_trash
+        self._lights = {'button': True, 'rails': False}
+        # protocols wait on the pause flag with robot._driver.run_flag.wait()
+        run_flag = threading.Event()
+        run_flag.set()
+        self._driver = _types.SimpleNamespace(run_flag=run_flag)
+
+    def home(self, *args, **kwargs):
+        self._recorder.record('home')
+
+    def estimated_time(self):
+        """ Seconds the commands issued so far take under the cost model """
+        session = self._session
+        commands = self._recorder.commands
+        session.replay.feed(commands[session.replayed:])
+        session.replayed = len(commands)
+        return session.replay.clock
+
+    def comment(self, msg):
+        self._recorder.record('comment', text=str(msg))
+
+    def head_speed(self, combined_speed=None, x=None, y=None, z=None, a=None,
+                   b=None, c=None):
+        speeds = {'combined_speed': combined_speed, 'x': x, 'y': y, 'z': z,
+                  'a': a}
+        self._recorder.record('head_speed', speeds={
+            axis: speed for axis, speed in speeds.items() if speed is not None})
+
+    def pause(self, msg=None):
+        self._recorder.record('pause', text=str(msg or ''))
+
+    def resume(self):
+        pass
+
+    def is_simulating(self):
+        return True
+
+    def identify(self, seconds):
+        self._recorder.record('delay', seconds=seconds, text='Identifying')
+
+    def get_instruments(self):
+        return [(pipette.mount, pipette) for pipette in self._session.pipettes]
+
+    def get_attached_pipettes(self):
+        return {pipette.mount: {'model': pipette.model, 'name': pipette.name}
+                for pipette in self._session.pipettes}
+
+    def get_containers(self):
+        return list(self._session.loaded_labware)
+
+    # the lights do not change the run
+    def get_lights(self):
+        return {'button': self._lights['button'],
+                'rails': self._lights['rails']}
+
+    def set_lights(self, button=None, rails=None):
+        if button is not None:
+            self._lights['button'] = button
+        if rails is not None:
+            self._lights['rails'] = rails
+
+    def get_rail_lights_on(self):
+        return self._lights['rails']
+
+    def turn_on_rail_lights(self):
+        self.set_lights(rails=True)
+
+    def turn_off_rail_lights(self):
+        self.set_lights(rails=False)
+
+    def turn_on_button_light(self):
+        self.set_lights(button=True)
+
+    def turn_off_button_light(self):
+        self.set_lights(button=False)
+
+
+class LegacySession:
+    """ One protocol run against the v1 stand-in """
+
+    def __init__(self, recorder: Recorder, extra_tip_racks=False,
+                 model: CostModel = None):
+        self.recorder = recorder
+        # replay of the commands so far, for robot.estimated_time()
+        self.replay = Replay(model or CostModel())
+        self.replayed = 0
+        # load another rack instead of running out of tips, to count racks
+        self.extra_tip_racks = extra_tip_racks
+        self.loaded_labware = []
+        self.pipettes = []
+        self.modules_by_slot = {}
+        self.fixed_trash = Labware('fixed-trash',
+                                   LABWARE_DEFINITIONS['fixed-trash'],
+                                   TRASH_SLOT, 'trash')
+        self.labware = _Labware(self)
+        self.instruments = _Instruments(self)
+        self.modules = _Modules(self)
+        self.robot = _Robot(self)
+
+    def as_module(self):
+        """ An ``opentrons`` module object exposing this session """
+        module = _types.ModuleType('opentrons')
+        module.labware = self.labware
+        module.instruments = self.instruments
+        module.modules = self.modules
+        module.robot = self.robot
+        module.types = _types.SimpleNamespace(
+            Point=namedtuple('Point', 'x y z'),
+            Location=namedtuple('Location', 'point labware'))
+        return module
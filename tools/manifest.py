@@ -0,0 +1,128 @@
+"""
+Sample manifests: which wells of the sample plate hold a sample, a control
+or nothing.
+
+    python -m tools.manifest "RNA Extraction (BOMB) V10.py" plate.csv
+
+A manifest is a CSV file with a header and one row per well; wells left out
+are empty:
+
+    well,type,id
+    A1,sample,S0001
+    B1,sample,S0002
+    H6,control,NTC
+
+The Station B protocols take one as their sample_manifest parameter and
+only process the columns it occupies, and tools.station_c --manifest plans
+Station C from one. The command line simulates a Station B protocol with
+the manifest and with full columns up to the last occupied one, which is
+what the run costs without a manifest, and reports the time and tips the
+manifest saves.
+"""
+
+import argparse
+import csv
+import sys
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple
+
+from .deck import ROW_NAMES
+from .cache import simulate
+from .timing import CostModel, format_seconds
+
+TYPES = ('sample', 'control', 'empty')
+PLATE_COLUMNS = 12
+
+
+class Entry(NamedTuple):
+    """ One well of a manifest """
+
+    well: str
+    type: str
+    id: str
+
+
+def read(path) -> Dict[str, Entry]:
+    """ The occupied wells of the manifest at [path], in plate order """
+    entries = {}
+    with open(path, newline='') as manifest:
+        for line, row in enumerate(csv.DictReader(manifest), 2):
+            well = (row.get('well') or '').strip().upper()
+            kind = (row.get('type') or '').strip().lower()
+            if len(well) < 2 or well[0] not in ROW_NAMES \
+                    or not well[1:].isdigit() \
+                    or not 1 <= int(well[1:]) <= PLATE_COLUMNS:
+                raise ValueError('{} line {}: {!r} is not a well of the '
+                                 'sample plate'.format(path, line, well))
+            if kind not in TYPES:
+                raise ValueError('{} line {}: type {!r}, expected one of {}'
+                                 .format(path, line, kind, ', '.join(TYPES)))
+            if well in entries:
+                raise ValueError('{} line {}: {} is listed twice'.format(
+                    path, line, well))
+            entries[well] = Entry(well, kind, (row.get('id') or '').strip())
+    occupied = OrderedDict(
+        (well, entries[well])
+        for column in range(1, PLATE_COLUMNS + 1) for row in ROW_NAMES
+        for well in ['{}{}'.format(row, column)]
+        if well in entries and entries[well].type != 'empty')
+    if not occupied:
+        raise ValueError('{} has no samples'.format(path))
+    return occupied
+
+
+def columns(manifest) -> List[int]:
+    """ The plate columns (1 to 12) holding a sample or control """
+    return sorted({int(well[1:]) for well in manifest})
+
+
+def tips(commands) -> int:
+    """ Tips a recorded run takes from its racks, eight per multichannel
+    pick up; returned tips picked up again are not counted twice """
+    seen = set()
+    for command in commands:
+        if command.name == 'pick_up_tip':
+            seen.add((command.slot, command.labware, command.well,
+                      8 if 'multi' in command.pipette.lower() else 1))
+    return sum(tip[-1] for tip in seen)
+
+
+def savings(seconds, tip_count, full_seconds, full_tips) -> str:
+    """ One line comparing a manifest run with the full column run """
+    return ('with the manifest {} and {} tips, full columns {} and {} tips: '
+            'saves {} and {} tips'.format(
+                format_seconds(seconds), tip_count, format_seconds(
+                    full_seconds), full_tips,
+                format_seconds(full_seconds - seconds),
+                full_tips - tip_count))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol')
+    parser.add_argument('manifest')
+    parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('--model', help='JSON file of cost model overrides')
+    args = parser.parse_args(argv)
+
+    try:
+        used = columns(read(args.manifest))
+    except ValueError as error:
+        parser.error(str(error))
+    model = CostModel.from_json(args.model) if args.model else None
+    run = simulate(args.protocol, {'sample_manifest': args.manifest,
+                                   'test_mode': args.test_mode}, model,
+                   extra_tip_racks=True)
+    full = simulate(args.protocol, {'number_of_sample_columns': used[-1],
+                                    'test_mode': args.test_mode}, model,
+                    extra_tip_racks=True)
+
+    out = sys.stdout
+    out.write('processing columns {} instead of 1 to {}\n'.format(
+        ', '.join(map(str, used)), used[-1]))
+    out.write(savings(run.duration, tips(run.commands), full.duration,
+                      tips(full.commands)) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,522 @@
+"""
+Optimise the commands of a Protocol Designer JSON protocol.
+
+    python -m tools.pd_optimize protocols/Station_C_46_v6_5_col.json
+    python -m tools.pd_optimize protocols/Station_C_46_v6_5_col.json \\
+        -o station_c.json --disposal-volume 2
+
+Protocol Designer writes one tip per destination when a step changes tips
+per destination, and one aspirate per dispense. Consecutive tip cycles of a
+pipette that all take the same source well to destinations holding nothing
+but that liquid (or to the trash) cannot cross-contaminate, so they are
+merged onto the first cycle's tip and their dispenses packed into
+multi-dispense aspirates within the tip capacity. The dispense volumes are
+kept as Protocol Designer split them. Every multi-dispense aspirate takes
+an extra disposal volume that is blown out in the trash, so the last
+dispense is as accurate as the first: by default the pipette's minimum
+volume (1 ul for the p10 and p20), as Protocol Designer does, or
+--disposal-volume. A disposal volume of 0 turns multi-dispensing off, the
+merged tip cycles then keep one aspirate per dispense.
+Blowouts with nothing aspirated since the tip was last emptied, and
+blowouts in the trash just before the tip is dropped there, are removed.
+
+Liquids come from the designer's ingredient locations; wells of a
+serialised ingredient (the samples) each count as their own liquid.
+The rest of the file is written out unchanged, so opening the result in
+Protocol Designer regenerates the original commands from its steps; load
+it in the Opentrons app instead. The report compares the time predicted
+by tools.timing and the tips used before and after.
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter, OrderedDict, defaultdict
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .commands import Command
+from .deck import MODULE_HEIGHTS, slot_origin
+from .timing import CostModel, format_seconds, replay
+
+RULES = ('merged tip cycles', 'aspirates saved', 'blowouts removed')
+
+# Protocol Designer module types -> tools.deck module names
+MODULE_TYPES = {
+    'temperatureModuleType': 'tempdeck',
+    'magneticModuleType': 'magdeck',
+}
+
+LIQUID_COMMANDS = ('aspirate', 'dispense', 'blowout')
+
+# minimum volume of each pipette model, the default disposal volume
+MIN_VOLUMES = {'p10': 1.0, 'p20': 1.0, 'p50': 5.0, 'p300': 30.0,
+               'p1000': 100.0}
+MIN_VOLUMES_GEN2 = {'p300': 20.0}
+
+
+class Protocol:
+    """ The deck, pipettes and liquids of a loaded Protocol Designer file """
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.definitions = data['labwareDefinitions']
+        self.labware = data['labware']
+        self.pipettes = data['pipettes']
+        self.modules = data.get('modules', {})
+
+    @classmethod
+    def load(cls, path) -> 'Protocol':
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f, object_pairs_hook=OrderedDict))
+
+    def definition(self, labware: str) -> dict:
+        return self.definitions[self.labware[labware]['definitionId']]
+
+    def is_trash(self, labware: str) -> bool:
+        metadata = self.definition(labware)['metadata']
+        return metadata.get('displayCategory') == 'trash'
+
+    def capacity(self, pipette: str) -> float:
+        """ Most the pipette can hold with the tips assigned to it """
+        name = self.pipettes[pipette]['name']
+        volume = float(name.split('_')[0][1:])
+        assignments = self.data['designerApplication']['data'].get(
+            'pipetteTiprackAssignments', {})
+        tiprack = self.definitions.get(assignments.get(pipette))
+        if tiprack is not None:
+            volume = min(volume, tiprack['wells']['A1']['totalLiquidVolume'])
+        return volume
+
+    def min_volume(self, pipette: str) -> float:
+        """ Smallest volume the pipette can move accurately """
+        name = self.pipettes[pipette]['name']
+        model = name.split('_')[0]
+        if name.endswith('_gen2') and model in MIN_VOLUMES_GEN2:
+            return MIN_VOLUMES_GEN2[model]
+        return MIN_VOLUMES[model]
+
+    def channels(self, pipette: str, labware: str, well: str) -> List[str]:
+        """ Wells entered by the channels of [pipette] at [well] """
+        if 'multi' not in self.pipettes[pipette]['name']:
+            return [well]
+        for column in self.definition(labware)['ordering']:
+            if well in column:
+                return column[column.index(well):][:8]
+        return [well]
+
+    def position(self, labware: str, well: str, offset: float = None):
+        """ Robot coordinates of [well], [offset] mm above its bottom or at
+        its top when no offset is given """
+        slot = self.labware[labware]['slot']
+        base = 0.0
+        if slot in self.modules:
+            module_type = slot.split(':')[-1]
+            base = MODULE_HEIGHTS.get(MODULE_TYPES.get(module_type), 0.0)
+            slot = self.modules[slot]['slot']
+        x, y = slot_origin(slot)
+        geometry = self.definition(labware)['wells'][well]
+        if offset is None:
+            offset = geometry['depth']
+        return (x + geometry['x'], y + geometry['y'],
+                base + geometry['z'] + offset)
+
+    def initial_liquids(self) -> Dict[Tuple[str, str], frozenset]:
+        """ (labware, well) -> liquids in it before the run """
+        data = self.data['designerApplication']['data']
+        serialised = {liquid for liquid, ingredient
+                      in data.get('ingredients', {}).items()
+                      if ingredient.get('serialize')}
+        liquids = {}
+        for labware, wells in data.get('ingredLocations', {}).items():
+            for well, contents in wells.items():
+                liquids[labware, well] = frozenset(
+                    '{}:{}'.format(liquid, well) if liquid in serialised
+                    else liquid for liquid in contents)
+        return liquids
+
+
+def _pipette_label(protocol, pipette) -> str:
+    spec = protocol.pipettes[pipette]
+    return '{} ({})'.format(spec['name'], spec['mount'])
+
+
+def to_commands(protocol: Protocol, commands) -> List[Command]:
+    """ [commands] as tools.commands records, with the moves between them,
+    for tools.timing.replay """
+    out = []
+    at = {}   # pipette -> (labware, well) it is in
+    for command in commands:
+        name, params = command['command'], command.get('params', {})
+        pipette = params.get('pipette')
+        if name in LIQUID_COMMANDS + ('pickUpTip', 'dropTip', 'touchTip'):
+            label = _pipette_label(protocol, pipette)
+            target = (params['labware'], params['well'])
+            offset = params.get('offsetFromBottomMm')
+            if name in ('pickUpTip', 'dropTip'):
+                offset = None
+            out.append(Command(
+                'move_to', label,
+                labware=protocol.labware[target[0]]['displayName'],
+                well=target[1], point=protocol.position(*target, offset),
+                strategy='direct' if at.get(pipette) == target else 'arc'))
+            at[pipette] = target
+            if name in ('aspirate', 'dispense'):
+                out.append(Command(name, label, volume=params['volume'],
+                                   flow_rate=params['flowRate']))
+            elif name == 'blowout':
+                out.append(Command('blow_out', label))
+            elif name == 'pickUpTip':
+                out.append(Command('pick_up_tip', label))
+            elif name == 'dropTip':
+                out.append(Command('drop_tip', label))
+        elif name == 'temperatureModule/setTargetTemperature':
+            out.append(Command('tempdeck_set', slot=params['module'],
+                               temperature=params['temperature']))
+        elif name == 'temperatureModule/awaitTemperature':
+            out.append(Command('tempdeck_wait', slot=params['module']))
+        elif name == 'temperatureModule/deactivate':
+            out.append(Command('tempdeck_deactivate', slot=params['module']))
+        elif name in ('magneticModule/engageMagnet',
+                      'magneticModule/disengageMagnet'):
+            out.append(Command('magdeck_engage'
+                               if name == 'magneticModule/engageMagnet'
+                               else 'magdeck_disengage'))
+        elif name == 'delay':
+            wait = params.get('wait')
+            out.append(Command('pause') if wait is True
+                       else Command('delay', seconds=float(wait)))
+        else:
+            out.append(Command(name))
+    return out
+
+
+def tips_used(commands) -> int:
+    return sum(1 for command in commands if command['command'] == 'pickUpTip')
+
+
+def estimate(protocol: Protocol, commands, model=None) -> float:
+    return replay(to_commands(protocol, commands), model or CostModel())
+
+
+class _Liquids:
+    """ Tracks which liquids each well and tip channel has touched """
+
+    def __init__(self, protocol: Protocol):
+        self.protocol = protocol
+        self.wells = defaultdict(frozenset, protocol.initial_liquids())
+        self.tips = {}
+
+    def apply(self, command):
+        name, params = command['command'], command.get('params', {})
+        pipette = params.get('pipette')
+        if name == 'pickUpTip':
+            self.tips[pipette] = defaultdict(frozenset)
+        if name not in ('aspirate', 'dispense'):
+            return
+        labware = params['labware']
+        tip = self.tips.setdefault(pipette, defaultdict(frozenset))
+        trash = self.protocol.is_trash(labware)
+        wells = self.protocol.channels(pipette, labware, params['well'])
+        for channel, well in enumerate(wells):
+            if name == 'dispense' and not trash:
+                self.wells[labware, well] |= tip[channel]
+            if name == 'aspirate' or not trash:
+                tip[channel] |= self.wells[labware, well]
+
+    def holds_only(self, pipette, labware, well, liquids) -> bool:
+        """ Whether [well] has nothing but [liquids] under every channel """
+        if self.protocol.is_trash(labware):
+            return True
+        return all(self.wells[labware, w] <= liquids
+                   for w in self.protocol.channels(pipette, labware, well))
+
+    def source(self, pipette, labware, well) -> frozenset:
+        return frozenset().union(*(
+            self.wells[labware, w]
+            for w in self.protocol.channels(pipette, labware, well)))
+
+
+def _split(commands) -> List[List[dict]]:
+    """ [commands] as blocks: whole tip cycles of one pipette, and single
+    commands outside them """
+    blocks = []
+    cycle = None
+    for command in commands:
+        pipette = command.get('params', {}).get('pipette')
+        if cycle is not None:
+            cycle.append(command)
+            if pipette != cycle[0]['params']['pipette']:
+                # something else ran while the tip was on, leave it be
+                blocks.extend([c] for c in cycle)
+                cycle = None
+            elif command['command'] == 'dropTip':
+                blocks.append(cycle)
+                cycle = None
+        elif command['command'] == 'pickUpTip':
+            cycle = [command]
+        else:
+            blocks.append([command])
+    if cycle is not None:
+        blocks.extend([c] for c in cycle)
+    return blocks
+
+
+def _transfers(cycle):
+    """ The (aspirate, dispense, blowout or None) transfers of a tip cycle
+    that only moves liquid from one source well, or None """
+    if len(cycle) < 2 or cycle[0]['command'] != 'pickUpTip' \
+            or cycle[-1]['command'] != 'dropTip':
+        return None
+    body = cycle[1:-1]
+    transfers = []
+    i = 0
+    while i < len(body):
+        aspirate, dispense = body[i], body[i + 1] if i + 1 < len(body) \
+            else None
+        if aspirate['command'] != 'aspirate' or dispense is None \
+                or dispense['command'] != 'dispense':
+            return None
+        source, target = aspirate['params'], dispense['params']
+        if source['volume'] != target['volume'] or \
+                (source['labware'], source['well']) == \
+                (target['labware'], target['well']):
+            return None
+        i += 2
+        blowout = None
+        if i < len(body) and body[i]['command'] == 'blowout':
+            blowout = body[i]
+            i += 1
+        transfers.append((aspirate, dispense, blowout))
+    sources = {(t[0]['params']['labware'], t[0]['params']['well'])
+               for t in transfers}
+    return transfers if len(sources) == 1 else None
+
+
+def _source(transfers) -> Tuple[str, str]:
+    params = transfers[0][0]['params']
+    return params['labware'], params['well']
+
+
+def _can_join(liquids, group, cycle, transfers) -> bool:
+    """ Whether [cycle] can run on the tip of the cycles in [group] """
+    first_cycle, first_transfers = group[0]
+    pipette = first_cycle[0]['params']['pipette']
+    if cycle[0]['params']['pipette'] != pipette or \
+            _source(transfers) != _source(first_transfers):
+        return False
+    liquid = liquids.source(pipette, *_source(first_transfers))
+    return all(liquids.holds_only(pipette, d['params']['labware'],
+                                  d['params']['well'], liquid)
+               for _, d, _ in transfers)
+
+
+def _trash_blowout(protocol, template) -> dict:
+    trash = next(labware for labware in protocol.labware
+                 if protocol.is_trash(labware))
+    params = OrderedDict(template['params'])
+    params['labware'] = trash
+    params['well'] = 'A1'
+    params['offsetFromBottomMm'] = \
+        protocol.definition(trash)['wells']['A1']['depth']
+    return OrderedDict((('command', 'blowout'), ('params', params)))
+
+
+def first_fit(volumes, capacity, disposal) -> List[List[int]]:
+    """ Indices of [volumes] grouped into aspirates of at most [capacity]:
+    each takes the first volume left and every later one that still fits,
+    keeping [disposal] spare when it dispenses more than once. Without a
+    disposal volume every aspirate dispenses once """
+    remaining = list(range(len(volumes)))
+    batches = []
+    while remaining:
+        batch = [remaining.pop(0)]
+        total = volumes[batch[0]]
+        if total > capacity:
+            raise ValueError('{} ul does not fit a {} ul tip'.format(
+                total, capacity))
+        if disposal <= 0:
+            batches.append(batch)
+            continue
+        for i in list(remaining):
+            if total + volumes[i] + disposal <= capacity:
+                batch.append(i)
+                remaining.remove(i)
+                total += volumes[i]
+        batches.append(batch)
+    return batches
+
+
+def _pack(protocol, group, disposal, counts) -> List[dict]:
+    """ The commands of the tip cycles in [group] on a single tip """
+    first_cycle = group[0][0]
+    pipette = first_cycle[0]['params']['pipette']
+    capacity = protocol.capacity(pipette)
+    if disposal is None:
+        disposal = protocol.min_volume(pipette)
+    items = [transfer for _, transfers in group for transfer in transfers]
+    counts['merged tip cycles'] += len(group) - 1
+
+    out = [first_cycle[0]]
+    volumes = [dispense['params']['volume'] for _, dispense, _ in items]
+    for indices in first_fit(volumes, capacity, disposal):
+        batch = [items[i] for i in indices]
+        total = sum(volumes[i] for i in indices)
+        aspirate = deepcopy(batch[0][0])
+        if len(batch) > 1:
+            total += disposal
+        aspirate['params']['volume'] = total
+        out.append(aspirate)
+        out.extend(dispense for _, dispense, _ in batch)
+        blowout = batch[-1][2]
+        if len(batch) > 1:
+            out.append(_trash_blowout(
+                protocol, blowout or batch[-1][1]))
+        elif blowout is not None:
+            out.append(blowout)
+    counts['aspirates saved'] += len(items) - sum(
+        1 for command in out if command['command'] == 'aspirate')
+    out.append(first_cycle[-1])
+    return out
+
+
+def _merge_cycles(protocol, commands, disposal, counts) -> List[dict]:
+    liquids = _Liquids(protocol)
+    out = []
+    group = []
+
+    def flush():
+        if len(group) > 1:
+            out.extend(_pack(protocol, group, disposal, counts))
+        elif group:
+            out.extend(group[0][0])
+        group.clear()
+
+    for block in _split(commands):
+        transfers = _transfers(block)
+        if transfers is None:
+            flush()
+            out.extend(block)
+        elif group and _can_join(liquids, group, block, transfers):
+            group.append((block, transfers))
+        else:
+            flush()
+            group.append((block, transfers))
+        for command in block:
+            liquids.apply(command)
+    flush()
+    return out
+
+
+def _drop_redundant_blowouts(protocol, commands, counts) -> List[dict]:
+    out = []
+    emptied = {}   # pipette -> nothing aspirated since the last blowout
+    for i, command in enumerate(commands):
+        name, params = command['command'], command.get('params', {})
+        pipette = params.get('pipette')
+        if name == 'blowout':
+            following = commands[i + 1] if i + 1 < len(commands) else None
+            before_drop = (following is not None
+                           and following['command'] == 'dropTip'
+                           and following['params']['pipette'] == pipette
+                           and protocol.is_trash(params['labware'])
+                           and protocol.is_trash(
+                               following['params']['labware']))
+            if emptied.get(pipette) or before_drop:
+                counts['blowouts removed'] += 1
+                continue
+            emptied[pipette] = True
+        elif name in ('pickUpTip', 'dropTip'):
+            emptied[pipette] = True
+        elif name == 'aspirate':
+            emptied[pipette] = False
+        out.append(command)
+    return out
+
+
+def delivered(protocol: Protocol, commands) -> Counter:
+    """ Volume dispensed into each well outside the trash """
+    volumes = Counter()
+    for command in commands:
+        params = command.get('params', {})
+        if command['command'] == 'dispense' and \
+                not protocol.is_trash(params['labware']):
+            volumes[params['labware'], params['well']] += params['volume']
+    return volumes
+
+
+def optimize(protocol: Protocol, disposal=None) -> Tuple[List[dict], Counter]:
+    """ The optimised commands of [protocol] and how often each rule applied;
+    [disposal] ul is added to multi-dispense aspirates, None takes each
+    pipette's minimum volume and 0 does not multi-dispense """
+    counts = Counter({rule: 0 for rule in RULES})
+    commands = protocol.data['commands']
+    optimized = _merge_cycles(protocol, commands, disposal, counts)
+    optimized = _drop_redundant_blowouts(protocol, optimized, counts)
+    if delivered(protocol, optimized) != delivered(protocol, commands):
+        raise ValueError('Optimised commands deliver different volumes')
+    return optimized, counts
+
+
+def write(protocol: Protocol, commands, path):
+    data = OrderedDict(protocol.data)
+    data['commands'] = commands
+    # compact and unescaped, as Protocol Designer writes it
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'), ensure_ascii=False)
+
+
+def report(protocol: Protocol, commands, optimized, model=None):
+    """ Rows comparing the original and optimised [commands] """
+    rows = []
+    for label, stream in (('original', commands), ('optimised', optimized)):
+        kinds = Counter(command['command'] for command in stream)
+        rows.append(OrderedDict((
+            ('commands', label),
+            ('count', len(stream)),
+            ('tips', tips_used(stream)),
+            ('aspirates', kinds['aspirate']),
+            ('blowouts', kinds['blowout']),
+            ('time', estimate(protocol, stream, model)),
+        )))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol')
+    parser.add_argument('-o', '--output',
+                        help='where to write the optimised protocol, by '
+                             'default next to it as <name>_optimised.json')
+    parser.add_argument('--disposal-volume', type=float,
+                        help='extra ul aspirated for each multi-dispense and '
+                        'blown out in the trash, by default the minimum '
+                        'volume of the pipette; 0 does not multi-dispense')
+    parser.add_argument('--model', help='JSON file of cost model overrides')
+    args = parser.parse_args(argv)
+
+    protocol = Protocol.load(args.protocol)
+    model = CostModel.from_json(args.model) if args.model else None
+    optimized, counts = optimize(protocol, args.disposal_volume)
+    output = args.output or str(Path(args.protocol).with_name(
+        Path(args.protocol).stem + '_optimised.json'))
+    write(protocol, optimized, output)
+
+    rows = report(protocol, protocol.data['commands'], optimized, model)
+    headers = list(rows[0])
+    widths = [max(len(h), 9) for h in headers]
+    out = sys.stdout
+    out.write('  '.join(h.rjust(w) for h, w in zip(headers, widths)) + '\n')
+    for row in rows:
+        cells = [format_seconds(row[key]) if key == 'time' else str(row[key])
+                 for key in headers]
+        out.write('  '.join(c.rjust(w) for c, w in zip(cells, widths)) + '\n')
+    out.write('\n' + ', '.join('{} {}'.format(rule, n)
+                               for rule, n in counts.items()) + '\n')
+    out.write('saved {}, written to {}\n'.format(
+        format_seconds(rows[0]['time'] - rows[1]['time']), output))
+
+
+if __name__ == '__main__':
+    main()
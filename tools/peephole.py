@@ -0,0 +1,292 @@
+"""
+Peephole optimisation of a recorded command stream.
+
+    python -m tools.peephole "RNA Extraction (BOMB) V10.py"
+    python -m tools.peephole "RNA Extraction (BOMB) V10.py" --columns 12 \\
+        --by-function
+
+The pass removes work that cannot change the outcome of a run:
+
+- dominated moves: a move straight followed by another move of the same
+  pipette; the second one is kept, as an arc if either of them was
+- zero-length moves to where the pipette already is
+- settings changes (flow rates, head speeds) overridden before anything
+  uses them, or that set what is already in effect
+- air aspirates: aspirating air from above a well while the tip is already
+  in the air, so the move there becomes dominated
+- zero-effect commands: delays of 0 s and aspirates or dispenses of 0 ul
+
+The report gives the time saved per column count and, with --by-function,
+per protocol function, which is where the redundancy should be fixed in the
+protocol. Work that runs for a set time by the protocol's run clock keeps
+its length on the robot: what is cut from the blow_air loop becomes more
+iterations, and what is cut from the tasks of a settle_beads window becomes
+a longer wait. That time is left out of 'saved' and reported as
+'time-bound' instead.
+
+Nothing here changes a run: the robot executes what the protocol issues,
+so a saving only materialises once the protocol is edited.
+``estimate_runtime --optimize`` times the optimised stream, with the
+time-bound cuts added back, to show what such an edit is worth.
+"""
+
+import argparse
+import sys
+from collections import Counter, OrderedDict
+from dataclasses import replace
+from typing import List, Tuple
+
+from .cache import simulate
+from .timing import CostModel, format_seconds, replay
+
+RULES = ('dominated move', 'zero-length move', 'settings change',
+         'air aspirate', 'zero-effect')
+
+# commands that use the flow rates set before them
+FLOW_COMMANDS = ('aspirate', 'dispense', 'mix', 'blow_out')
+# commands that neither move the pipette nor depend on where it is
+TRANSPARENT = ('comment', 'set_flow_rate')
+# commands that end the settling of the beads, as in estimate_runtime
+LIQUID_COMMANDS = ('aspirate', 'dispense', 'mix', 'blow_out')
+# protocol functions looping until a set time has passed on the run clock
+TIME_BOUND_LOOPS = ('blow_air',)
+
+
+def time_bound(commands) -> List[str]:
+    """ For each of [commands], the category ('blow_air' or 'magdeck
+    settling') of the set time it was issued in, or '' if none: the blow_air
+    loop, or a settle_beads window from engaging the magnet to the wait for
+    the rest of the settling time (or the next liquid handled) """
+    bound = []
+    settling = False
+    for command in commands:
+        if command.name == 'magdeck_engage' \
+                and command.function == 'settle_beads':
+            settling = True
+        elif command.name in LIQUID_COMMANDS \
+                and command.function not in TIME_BOUND_LOOPS:
+            settling = False
+        if command.function in TIME_BOUND_LOOPS:
+            bound.append('blow_air')
+        elif settling:
+            bound.append('magdeck settling')
+        else:
+            bound.append('')
+        if command.name == 'delay' and command.function == 'settle_beads':
+            settling = False
+    return bound
+
+
+def time_bound_cut(commands, optimized) -> Counter:
+    """ Seconds the optimisation cut from time-bound work, per category,
+    from two replayed streams; on the robot that time is spent anyway """
+    cut = Counter()
+    for command, category in zip(commands, time_bound(commands)):
+        if category:
+            cut[category] += command.duration
+    for command, category in zip(optimized, time_bound(optimized)):
+        if category:
+            cut[category] -= command.duration
+    return cut
+
+
+def _is_air_move(command) -> bool:
+    return command.above_top is not None and command.above_top >= 0
+
+
+def _hoist_air_aspirates(commands, counts):
+    """ [move over a well, aspirate, move] with the tip already in the air
+    becomes [aspirate, move, move]: air is the same wherever it is drawn """
+    out = []
+    in_air = {}
+    i = 0
+    while i < len(commands):
+        command = commands[i]
+        if (command.name == 'move_to' and i + 2 < len(commands)
+                and in_air.get(command.pipette) and _is_air_move(command)):
+            aspirate, following = commands[i + 1], commands[i + 2]
+            if (aspirate.name == 'aspirate'
+                    and following.name == 'move_to'
+                    and aspirate.pipette == following.pipette
+                    == command.pipette):
+                out.extend((aspirate, command))
+                counts['air aspirate'] += 1
+                i += 2
+                continue
+        if command.name == 'move_to':
+            in_air[command.pipette] = _is_air_move(command)
+        elif command.name in ('home', 'home_z'):
+            in_air[command.pipette] = True
+        out.append(command)
+        i += 1
+    return out
+
+
+def _drop_dominated_moves(commands, counts):
+    out = []
+    pending = {}   # pipette -> index in out of its last unused move
+    for command in commands:
+        if command.name == 'move_to':
+            previous = pending.get(command.pipette)
+            if previous is not None:
+                dropped = out[previous]
+                out[previous] = None
+                if dropped.strategy == 'arc':
+                    command = replace(command, strategy='arc')
+                counts['dominated move'] += 1
+            pending[command.pipette] = len(out)
+        elif command.name not in TRANSPARENT:
+            pending.clear()
+        out.append(command)
+    return [command for command in out if command is not None]
+
+
+def _drop_zero_length_moves(commands, counts):
+    out = []
+    position = {}
+    for command in commands:
+        if command.name == 'move_to':
+            if position.get(command.pipette) == command.point:
+                counts['zero-length move'] += 1
+                continue
+            position[command.pipette] = command.point
+        elif command.name in ('home', 'home_z'):
+            position.pop(command.pipette, None)
+        out.append(command)
+    return out
+
+
+def _merge_settings(commands, counts):
+    """ Drop flow rate and head speed changes that are overridden before
+    anything uses them, or that change nothing """
+    out = []
+    # setting -> [value in effect, index in out of a change not used yet]
+    state = {}
+    for command in commands:
+        if command.name in ('set_flow_rate', 'head_speed'):
+            key = (command.name, command.pipette)
+            applied, pending = state.setdefault(key, [None, None])
+            if command.name == 'set_flow_rate':
+                value = command.text
+            else:
+                value = dict(applied or {}, **command.speeds)
+                command = replace(command, speeds=value)
+            if pending is not None:
+                out[pending] = None
+                counts['settings change'] += 1
+            if value == applied:
+                state[key][1] = None
+                counts['settings change'] += 1
+                continue
+            state[key][1] = len(out)
+        else:
+            if command.name in FLOW_COMMANDS:
+                used = ('set_flow_rate', command.pipette)
+            elif command.name in ('move_to', 'home_z', 'home'):
+                used = ('head_speed', '')
+            else:
+                used = None
+            if used in state and state[used][1] is not None:
+                state[used] = [out[state[used][1]].speeds
+                               if used[0] == 'head_speed'
+                               else out[state[used][1]].text, None]
+        out.append(command)
+    return [command for command in out if command is not None]
+
+
+def _drop_zero_effect(commands, counts):
+    out = []
+    for command in commands:
+        if ((command.name == 'delay' and command.seconds <= 0)
+                or (command.name in ('aspirate', 'dispense')
+                    and command.volume <= 0)):
+            counts['zero-effect'] += 1
+            continue
+        out.append(command)
+    return out
+
+
+PASSES = (_hoist_air_aspirates, _drop_zero_length_moves,
+          _drop_dominated_moves, _merge_settings, _drop_zero_effect)
+
+
+def optimize(commands) -> Tuple[List, Counter]:
+    """ The optimised copy of [commands] and how often each rule applied """
+    counts = Counter({rule: 0 for rule in RULES})
+    commands = [replace(command) for command in commands]
+    while True:
+        before = len(commands)
+        for optimization_pass in PASSES:
+            commands = optimization_pass(commands, counts)
+        if len(commands) == before:
+            return commands, counts
+
+
+def report(protocol, columns=range(1, 13), test_mode=False, model=None):
+    """ Rows of rule counts and seconds saved for each column count """
+    model = model or CostModel()
+    rows = []
+    for n in columns:
+        run = simulate(protocol, {'number_of_sample_columns': n,
+                                  'test_mode': test_mode}, model)
+        optimized, counts = optimize(run.commands)
+        row = OrderedDict(columns=n)
+        row['commands'] = len(run.commands)
+        row['optimised'] = len(optimized)
+        row.update(counts)
+        row['total'] = run.duration
+        saved = run.duration - replay(optimized, model)
+        cut = sum(time_bound_cut(run.commands, optimized).values())
+        row['saved'] = saved - cut
+        row['time-bound'] = cut
+        rows.append((row, run.commands, optimized))
+    return rows
+
+
+def saved_by_function(commands, optimized) -> Counter:
+    """ Seconds saved per protocol function, from two replayed streams """
+    saved = Counter()
+    for command in commands:
+        saved[command.function] += command.duration
+    for command in optimized:
+        saved[command.function] -= command.duration
+    return saved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol')
+    parser.add_argument('--columns', type=int, nargs='+',
+                        default=list(range(1, 13)))
+    parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('--model', help='JSON file of cost model overrides')
+    parser.add_argument('--by-function', action='store_true',
+                        help='break the savings down per protocol function')
+    args = parser.parse_args(argv)
+
+    model = CostModel.from_json(args.model) if args.model else None
+    rows = report(args.protocol, args.columns, args.test_mode, model)
+    headers = list(rows[0][0])
+    widths = [max(len(h), 8) for h in headers]
+    out = sys.stdout
+    out.write('  '.join(h.rjust(w) for h, w in zip(headers, widths)) + '\n')
+    for row, commands, optimized in rows:
+        cells = []
+        for key, width in zip(headers, widths):
+            value = row[key]
+            if key in ('total', 'saved', 'time-bound'):
+                value = format_seconds(value)
+            cells.append(str(value).rjust(width))
+        out.write('  '.join(cells) + '\n')
+        if args.by_function:
+            for function, seconds in saved_by_function(
+                    commands, optimized).most_common():
+                if seconds >= 0.5:
+                    out.write('    {:>10}  {}{}\n'.format(
+                        format_seconds(seconds), function or '<module>',
+                        ' (time-bound)' if function in TIME_BOUND_LOOPS
+                        else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Recording stand-in for the opentrons protocol API v2.
+
+Protocol files that define ``run(protocol)`` and set an ``apiLevel`` in
+their metadata are executed and then handed a :class:`ProtocolContext`.
+The context is a thin layer over the v1 stand-in in tools.legacy_api: the
+instruments are its pipettes with the v2 names and flow rate attributes,
+and the modules block on set_temperature as v2 does.
+"""
+
+import types as _types
+
+from .legacy_api import LegacySession, MagDeck, Pipette, TempDeck
+
+# v2 module load names -> tools.legacy_api module names
+MODULE_NAMES = {
+    'tempdeck': 'tempdeck',
+    'temperature module': 'tempdeck',
+    'temperature module gen2': 'tempdeck',
+    'magdeck': 'magdeck',
+    'magnetic module': 'magdeck',
+    'magnetic module gen2': 'magdeck',
+}
+
+
+def legacy_model(name: str) -> str:
+    """ 'p20_single_gen2' -> 'P20_Single_GEN2' """
+    parts = name.split('_')
+    return '_'.join([parts[0].upper(), parts[1].capitalize()]
+                    + [part.upper() for part in parts[2:]])
+
+
+class FlowRates(dict):
+    """ The v1 flow rate dict, also settable as ``flow_rate.aspirate`` """
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+class InstrumentContext(Pipette):
+    """ v2 pipette """
+
+    def __init__(self, session, name, mount, tip_racks=()):
+        super().__init__(session, legacy_model(name), mount,
+                         tip_racks=tip_racks)
+        self.instrument_name = name
+        self.flow_rate = FlowRates(self.flow_rate)
+
+    def distribute(self, volume, source, dest, **kwargs):
+        if 'disposal_volume' in kwargs:
+            kwargs['disposal_vol'] = kwargs.pop('disposal_volume')
+        return super().distribute(volume, source, dest, **kwargs)
+
+
+class _ModuleContext:
+    def load_labware(self, name, label=None):
+        return self._session.labware.load(name, self.slot, label, share=True)
+
+
+class TemperatureModuleContext(_ModuleContext, TempDeck):
+    def __init__(self, session, slot):
+        TempDeck.__init__(self, session, slot)
+        self._session = session
+
+    def set_temperature(self, celsius):
+        # v2 blocks until the target is reached
+        TempDeck.set_temperature(self, celsius)
+        self.wait_for_temp()
+
+    def start_set_temperature(self, celsius):
+        TempDeck.set_temperature(self, celsius)
+
+    def await_temperature(self, celsius):
+        self.wait_for_temp()
+
+
+class MagneticModuleContext(_ModuleContext, MagDeck):
+    def __init__(self, session, slot):
+        MagDeck.__init__(self, session, slot)
+        self._session = session
+
+
+MODULE_CONTEXTS = {'tempdeck': TemperatureModuleContext,
+                   'magdeck': MagneticModuleContext}
+
+
+class ProtocolContext:
+    """ What a v2 protocol's ``run`` receives """
+
+    def __init__(self, session: LegacySession):
+        self._session = session
+        self._recorder = session.recorder
+        self.fixed_trash = session.fixed_trash
+        self.loaded_labwares = {}
+        self.loaded_instruments = {}
+        self.loaded_modules = {}
+        self.rail_lights_on = False
+
+    def load_labware(self, load_name, location, label=None, namespace=None,
+                     version=None):
+        labware = self._session.labware.load(load_name, location, label)
+        self.loaded_labwares[int(location)] = labware
+        return labware
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None,
+                        replace=False):
+        pipette = InstrumentContext(self._session, instrument_name, mount,
+                                    tip_racks or ())
+        self._session.pipettes.append(pipette)
+        self.loaded_instruments[mount] = pipette
+        return pipette
+
+    def load_module(self, module_name, location=None):
+        name = MODULE_NAMES.get(module_name.lower())
+        if name is None:
+            raise ValueError('Unknown module: {}'.format(module_name))
+        self._session.modules_by_slot[str(location)] = name
+        module = MODULE_CONTEXTS[name](self._session, location)
+        self.loaded_modules[int(location)] = module
+        return module
+
+    def comment(self, msg):
+        self._recorder.record('comment', text=str(msg))
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        total = minutes * 60 + seconds
+        self._recorder.record('delay', seconds=total, text=msg or
+                              'Delaying for {:g} seconds'.format(total))
+
+    def pause(self, msg=None):
+        self._recorder.record('pause', text=str(msg or ''))
+
+    def resume(self):
+        pass
+
+    def home(self):
+        self._recorder.record('home')
+
+    def set_rail_lights(self, on):
+        self.rail_lights_on = on
+
+    def is_simulating(self):
+        return True
+
+
+def as_module():
+    """ An ``opentrons.protocol_api`` module object """
+    module = _types.ModuleType('opentrons.protocol_api')
+    module.ProtocolContext = ProtocolContext
+    module.InstrumentContext = InstrumentContext
+    return module
@@ -0,0 +1,133 @@
+"""
+Run protocol files against the stand-in API with injected parameters.
+"""
+
+import ast
+import io
+import sys
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import protocol_api
+from .commands import Command, Recorder
+from .deck import Labware
+from .legacy_api import LegacySession
+from .timing import CostModel, replay
+
+
+@dataclass
+class Run:
+    """ The recorded outcome of one simulated protocol run """
+
+    protocol: str
+    params: Dict[str, object]
+    commands: List[Command] = field(default_factory=list)
+    labware: List[Labware] = field(default_factory=list)
+    tip_racks: List[Labware] = field(default_factory=list)   # fresh tips
+    output: str = ''
+    duration: float = 0.0
+    error: str = ''    # why the protocol stopped, if it raised
+
+
+def _parameter_nodes(tree):
+    """ (name, node holding its value) for each parameter a protocol sets,
+    as a top-level assignment, one in either branch of a top-level ``if``
+    like the test_mode defaults, or a key of a top-level ``f(**{...})``
+    call like the Protocol Library customisation """
+    for node in _top_level(tree.body):
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name)):
+            yield node.targets[0].id, node, 'value'
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+            for keyword in node.value.keywords:
+                if keyword.arg is None and isinstance(keyword.value, ast.Dict):
+                    entries = keyword.value
+                    for index, key in enumerate(entries.keys):
+                        if (isinstance(key, ast.Constant)
+                                and isinstance(key.value, str)):
+                            yield key.value, entries.values, index
+
+
+def _top_level(body):
+    for node in body:
+        if isinstance(node, ast.If):
+            yield from _top_level(node.body)
+            yield from _top_level(node.orelse)
+        else:
+            yield node
+
+
+def parameters(protocol) -> List[str]:
+    """ Names of the parameters that can be injected into [protocol] """
+    path = str(Path(protocol))
+    tree = ast.parse(Path(path).read_text(), path)
+    return list(OrderedDict.fromkeys(
+        name for name, _, _ in _parameter_nodes(tree)))
+
+
+def inject_parameters(source: str, params: Dict[str, object], filename: str):
+    """ Compile [source] with its parameters replaced by [params] """
+    tree = ast.parse(source, filename)
+    missing = set(params)
+    for name, parent, slot in list(_parameter_nodes(tree)):
+        if name not in params:
+            continue
+        value = ast.parse(repr(params[name]), mode='eval').body
+        if isinstance(slot, int):
+            parent[slot] = ast.copy_location(value, parent[slot])
+        else:
+            setattr(parent, slot,
+                    ast.copy_location(value, getattr(parent, slot)))
+        missing.discard(name)
+    if missing:
+        raise ValueError('{} has no parameter {}'.format(
+            filename, ', '.join(sorted(missing))))
+    return compile(tree, filename, 'exec')
+
+
+def simulate(protocol, params: Optional[Dict[str, object]] = None,
+             model: Optional[CostModel] = None,
+             extra_tip_racks: bool = False,
+             allow_failure: bool = False) -> Run:
+    """ Run [protocol] against the stand-in API and time its commands.
+    A v2 protocol's run() is called once the file has executed. With
+    [extra_tip_racks] a fresh rack is loaded instead of running out. With
+    [allow_failure] an exception raised by the protocol ends the run, as on
+    the robot, and the commands issued until then are kept """
+    path = str(Path(protocol))
+    params = dict(params or {})
+    code = inject_parameters(Path(path).read_text(), params, path)
+
+    recorder = Recorder(path)
+    session = LegacySession(recorder, extra_tip_racks, model)
+    saved = sys.modules.get('opentrons')
+    opentrons = session.as_module()
+    opentrons.protocol_api = protocol_api.as_module()
+    sys.modules['opentrons'] = opentrons
+    output = io.StringIO()
+    namespace = {'__name__': '__main__', '__file__': path}
+    error = ''
+    try:
+        with redirect_stdout(output):
+            exec(code, namespace)
+            if 'apiLevel' in namespace.get('metadata', {}) \
+                    and callable(namespace.get('run')):
+                namespace['run'](protocol_api.ProtocolContext(session))
+    except Exception as exc:
+        if not allow_failure:
+            raise
+        error = '{}: {}'.format(type(exc).__name__, exc)
+    finally:
+        if saved is None:
+            del sys.modules['opentrons']
+        else:
+            sys.modules['opentrons'] = saved
+
+    duration = replay(recorder.commands, model or CostModel())
+    tip_racks = [rack for pipette in session.pipettes
+                 for rack in pipette.tip_racks]
+    return Run(path, params, recorder.commands, session.loaded_labware,
+               tip_racks, output.getvalue(), duration, error)
@@ -0,0 +1,545 @@
+"""
+Generate a Station C qPCR set-up protocol for any number of samples.
+
+    python -m tools.station_c --samples 46 -o station_c.json
+    python -m tools.station_c --samples 22 --assays N1 Rp --replicates 2 \\
+        --control PTC=G3 --control NTC=H3
+
+Samples go into the sample block in column order around the control
+positions, which are left empty, so every PCR block (one per assay and
+replicate) takes whole sample-block columns: the p10 multichannel moves
+each column with one aspirate. A column holding a control is left to the
+p20 single channel, which moves its samples one by one and adds the
+controls, so no multichannel tip aspirates air from the empty control
+positions or mixes in a control well. Each assay's master mix is distributed from its column of the
+master mix plate on one tip, in multi-dispense aspirates. Controls default
+to the last wells of the last sample column; NTC is the nuclease-free water
+and PTC the positive plasmid of the block's assay.
+
+    python -m tools.station_c --manifest plate.csv --assays N1 Rp
+
+With a sample manifest (see tools.manifest) the samples and controls stay
+where the manifest puts them. Columns it leaves empty get no PCR columns,
+master mix or tips, and a column holding a single sample or a control is
+moved by the p20 single channel. The report then compares the
+run with the full columns up to the last occupied one.
+
+The deck, labware definitions and pipettes are copied from
+protocols/Station_C_46_v6_5_col.json. The result is a Protocol Designer
+JSON file for the Opentrons app, with the liquids filled in but no designer
+steps. Protocol Designer would open it with no steps.
+"""
+
+import argparse
+import math
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+from .deck import ROW_NAMES
+from .manifest import read as read_manifest, savings
+from .pd_optimize import Protocol, estimate, first_fit, tips_used, write
+from .timing import CostModel, format_seconds
+
+TEMPLATE = Path(__file__).resolve().parent.parent / 'protocols' / \
+    'Station_C_46_v6_5_col.json'
+
+PLATE_COLUMNS = 12
+DEFAULT_CONTROLS = ('PTC', 'NTC')
+
+# labware of the template by role, matched on the definition id
+ROLES = OrderedDict((
+    ('pcr', 'appliedbiosystems_96_wellplate_100ul'),
+    ('samples', 'axygen_96_aluminumblock_200ul'),
+    ('tubes', 'opentrons_24_tuberack'),
+    ('mastermix', 'axygenonadeepwell_96_wellplate_200ul'),
+    ('trash', 'opentrons_1_trash'),
+))
+
+# mm above the well bottom to aspirate from or dispense into
+OFFSETS = {'pcr': 2, 'samples': 3, 'tubes': 2, 'mastermix': 1}
+# pipette -> (aspirate, dispense) flow rates in ul/s
+FLOW_RATES = {'p10_multi': (5, 10), 'p20_single_gen2': (3.78, 10)}
+# extra volume put in every reagent and sample well
+DEAD_VOLUME = 10
+
+
+class Layout(NamedTuple):
+    """ Where the samples and controls of a run go """
+
+    samples: List[str]           # sample block wells in sample order
+    controls: Dict[str, str]     # control -> its well within each block
+    columns: int                 # PCR plate columns of a block
+    blocks: List[Tuple[str, int, int]]   # (assay, replicate, first column)
+    sources: List[int]           # sample block column of each block column
+    singles: List[str]           # samples moved by the single channel
+
+
+def _check_well(well):
+    if len(well) < 2 or well[0] not in ROW_NAMES or not well[1:].isdigit() \
+            or not 1 <= int(well[1:]) <= PLATE_COLUMNS:
+        raise ValueError('Not a 96 well plate well: {}'.format(well))
+
+
+def layout(samples, assays=('N1', 'Rp'), replicates=1,
+           controls=None) -> Layout:
+    """ Place [samples] and the [controls] (name -> well, by default the
+    last wells) in blocks of whole columns, one per assay and replicate """
+    if samples < 1 or replicates < 1 or not assays:
+        raise ValueError('Need at least one sample, assay and replicate')
+    if controls is None:
+        count = len(DEFAULT_CONTROLS)
+        columns = math.ceil((samples + count) / len(ROW_NAMES))
+        wells = ['{}{}'.format(row, columns)
+                 for row in ROW_NAMES[-count:]]
+        controls = OrderedDict(zip(DEFAULT_CONTROLS, wells))
+    for well in controls.values():
+        _check_well(well)
+    if len(set(controls.values())) < len(controls):
+        raise ValueError('Two controls share a well')
+    taken = set(controls.values())
+
+    columns = max([math.ceil((samples + len(controls)) / len(ROW_NAMES))]
+                  + [int(well[1:]) for well in taken])
+    sample_wells = [
+        '{}{}'.format(row, column) for column in range(1, columns + 1)
+        for row in ROW_NAMES if '{}{}'.format(row, column) not in taken
+    ][:samples]
+    return Layout(sample_wells, OrderedDict(controls), columns,
+                  _blocks(assays, replicates, columns),
+                  list(range(1, columns + 1)),
+                  _with_controls(sample_wells, controls))
+
+
+def _with_controls(samples, controls) -> List[str]:
+    """ The [samples] sharing a sample block column with one of [controls] """
+    columns = {int(well[1:]) for well in controls.values()}
+    return [well for well in samples if int(well[1:]) in columns]
+
+
+def _blocks(assays, replicates, columns):
+    needed = columns * len(assays) * replicates
+    if needed > PLATE_COLUMNS:
+        raise ValueError(
+            '{} assays and {} replicates of {} columns need {} PCR columns, '
+            'the plate has {}'.format(len(assays), replicates, columns,
+                                      needed, PLATE_COLUMNS))
+    return [(assay, replicate, (i * replicates + replicate) * columns)
+            for i, assay in enumerate(assays)
+            for replicate in range(replicates)]
+
+
+def manifest_layout(manifest, assays=('N1', 'Rp'), replicates=1,
+                    max_single=1) -> Layout:
+    """ The samples and controls where [manifest] (tools.manifest.read)
+    puts them. Only occupied sample block columns get a PCR column, and the
+    samples of columns holding a control or at most [max_single] samples go
+    by the single channel """
+    if replicates < 1 or not assays:
+        raise ValueError('Need at least one assay and replicate')
+    controls = OrderedDict()
+    for well, entry in manifest.items():
+        if entry.type != 'control':
+            continue
+        if entry.id not in DEFAULT_CONTROLS:
+            raise ValueError('Control {} in {}: controls are {}'.format(
+                entry.id, well, ' and '.join(DEFAULT_CONTROLS)))
+        if entry.id in controls:
+            raise ValueError('Control {} is in {} and {}'.format(
+                entry.id, controls[entry.id], well))
+        controls[entry.id] = well
+    samples = [well for well, entry in manifest.items()
+               if entry.type == 'sample']
+    if not samples:
+        raise ValueError('The manifest has no samples')
+    sources = sorted({int(well[1:]) for well in manifest})
+    singles = _with_controls(samples, controls)
+    for column in sources:
+        in_column = [well for well in samples if int(well[1:]) == column]
+        if len(in_column) <= max_single and not set(in_column) & set(singles):
+            singles.extend(in_column)
+    singles.sort(key=samples.index)
+    return Layout(samples, controls, len(sources),
+                  _blocks(assays, replicates, len(sources)), sources,
+                  singles)
+
+
+def _pcr_well(plan, first, well) -> str:
+    """ The PCR plate well of sample block [well] in the block at [first] """
+    return '{}{}'.format(well[0],
+                         first + plan.sources.index(int(well[1:])) + 1)
+
+
+class _Tips:
+    """ Hands out tips the way Protocol Designer does: single channels take
+    the first tip left, multichannels the first full column """
+
+    def __init__(self, racks, ordering):
+        self.racks = racks
+        self.ordering = ordering
+        self.used = set()
+
+    def single(self):
+        for rack in self.racks:
+            for column in self.ordering[rack]:
+                for well in column:
+                    if (rack, well) not in self.used:
+                        self.used.add((rack, well))
+                        return rack, well
+        raise ValueError('Out of tips')
+
+    def column(self):
+        for rack in self.racks:
+            for column in self.ordering[rack]:
+                if not any((rack, well) in self.used for well in column):
+                    self.used.update((rack, well) for well in column)
+                    return rack, column[0]
+        raise ValueError('Out of tip columns')
+
+
+def _command(name, **params) -> OrderedDict:
+    return OrderedDict((('command', name), ('params', OrderedDict(params))))
+
+
+class _Writer:
+    """ Appends the liquid handling commands of one pipette """
+
+    def __init__(self, protocol, pipette, tips, trash, commands):
+        self.protocol = protocol
+        self.pipette = pipette
+        self.name = protocol.pipettes[pipette]['name']
+        self.tips = tips
+        self.trash = trash
+        self.commands = commands
+
+    def pick_up_tip(self):
+        if 'multi' in self.name:
+            rack, well = self.tips.column()
+        else:
+            rack, well = self.tips.single()
+        self.commands.append(_command(
+            'pickUpTip', pipette=self.pipette, labware=rack, well=well))
+
+    def drop_tip(self):
+        self.commands.append(_command(
+            'dropTip', pipette=self.pipette, labware=self.trash, well='A1'))
+
+    def _liquid(self, name, volume, labware, well, offset, flow_rate):
+        self.commands.append(_command(
+            name, pipette=self.pipette, volume=volume, labware=labware,
+            well=well, offsetFromBottomMm=offset, flowRate=flow_rate))
+
+    def aspirate(self, volume, labware, well, offset):
+        self._liquid('aspirate', volume, labware, well, offset,
+                     FLOW_RATES[self.name][0])
+
+    def dispense(self, volume, labware, well, offset):
+        self._liquid('dispense', volume, labware, well, offset,
+                     FLOW_RATES[self.name][1])
+
+    def mix(self, repetitions, volume, labware, well, offset):
+        for _ in range(repetitions):
+            self.aspirate(volume, labware, well, offset)
+            self.dispense(volume, labware, well, offset)
+
+    def blowout(self, labware, well):
+        depth = self.protocol.definition(labware)['wells'][well]['depth']
+        self.commands.append(_command(
+            'blowout', pipette=self.pipette, labware=labware, well=well,
+            offsetFromBottomMm=depth, flowRate=FLOW_RATES[self.name][1]))
+
+
+def _find(labware, fragment):
+    return next(name for name, spec in labware.items()
+                if fragment in spec['definitionId'])
+
+
+def generate(samples, assays=('N1', 'Rp'), replicates=1, controls=None,
+             mastermix_volume=15, sample_volume=5, control_volume=5,
+             mix_repetitions=10, mix_volume=10, template=TEMPLATE,
+             manifest=None, max_single=1):
+    """ The Protocol Designer data of a Station C run and its [layout],
+    of [samples] samples or, when given, of the wells of [manifest] """
+    if manifest is not None:
+        plan = manifest_layout(manifest, assays, replicates, max_single)
+    else:
+        plan = layout(samples, assays, replicates, controls)
+    data = Protocol.load(template).data
+    protocol = Protocol(data)
+    labware = {role: _find(data['labware'], fragment)
+               for role, fragment in ROLES.items()}
+    racks = sorted((name for name in data['labware']
+                    if protocol.definition(name)['parameters']['isTiprack']),
+                   key=lambda name: int(data['labware'][name]['slot']))
+    tips = _Tips(racks, {rack: protocol.definition(rack)['ordering']
+                         for rack in racks})
+    multi = next(p for p, spec in data['pipettes'].items()
+                 if 'multi' in spec['name'])
+    single = next(p for p in data['pipettes'] if p != multi)
+    module = next(iter(data['modules']))
+    pcr = labware['pcr']
+
+    commands = [_command('temperatureModule/setTargetTemperature',
+                         module=module, temperature=4)]
+    multichannel = _Writer(protocol, multi, tips, labware['trash'], commands)
+    singlechannel = _Writer(protocol, single, tips, labware['trash'],
+                            commands)
+
+    # master mix, one tip per assay, dispensed column by column; each
+    # multi-dispense takes a disposal volume that is blown out in the trash
+    capacity = protocol.capacity(multi)
+    disposal = protocol.min_volume(multi)
+    for i, assay in enumerate(assays):
+        source = 'A{}'.format(i + 1)
+        portions = []
+        for block_assay, _, first in plan.blocks:
+            if block_assay != assay:
+                continue
+            for column in range(first + 1, first + plan.columns + 1):
+                left = mastermix_volume
+                while left > 0:
+                    portions.append(('A{}'.format(column),
+                                     min(left, capacity)))
+                    left -= portions[-1][1]
+        multichannel.pick_up_tip()
+        for batch in first_fit([v for _, v in portions], capacity,
+                               disposal):
+            spare = disposal if len(batch) > 1 else 0
+            multichannel.aspirate(sum(portions[j][1] for j in batch) + spare,
+                                  labware['mastermix'], source,
+                                  OFFSETS['mastermix'])
+            for j in batch:
+                multichannel.dispense(portions[j][1], pcr, portions[j][0],
+                                      OFFSETS['pcr'])
+            if spare:
+                multichannel.blowout(labware['trash'], 'A1')
+            else:
+                multichannel.blowout(pcr, portions[batch[-1]][0])
+        multichannel.drop_tip()
+
+    # samples, a whole sample block column per aspirate
+    multichannel_columns = sorted({int(well[1:]) for well in plan.samples
+                                   if well not in plan.singles})
+    for _, _, first in plan.blocks:
+        for column in multichannel_columns:
+            target = _pcr_well(plan, first, 'A{}'.format(column))
+            multichannel.pick_up_tip()
+            multichannel.aspirate(sample_volume, labware['samples'],
+                                  'A{}'.format(column), OFFSETS['samples'])
+            multichannel.dispense(sample_volume, pcr, target,
+                                  OFFSETS['pcr'])
+            multichannel.mix(mix_repetitions, mix_volume, pcr, target,
+                             OFFSETS['pcr'])
+            multichannel.blowout(pcr, target)
+            multichannel.drop_tip()
+
+    # samples alone in their column, one tip each rather than eight
+    for _, _, first in plan.blocks:
+        for well in plan.singles:
+            target = _pcr_well(plan, first, well)
+            singlechannel.pick_up_tip()
+            singlechannel.aspirate(sample_volume, labware['samples'], well,
+                                   OFFSETS['samples'])
+            singlechannel.dispense(sample_volume, pcr, target,
+                                   OFFSETS['pcr'])
+            singlechannel.mix(mix_repetitions, mix_volume, pcr, target,
+                              OFFSETS['pcr'])
+            singlechannel.blowout(pcr, target)
+            singlechannel.drop_tip()
+
+    # controls, from the tube rack
+    tubes = _tubes(assays)
+    for assay, _, first in plan.blocks:
+        for control, well in plan.controls.items():
+            source = tubes['water'] if control == 'NTC' else tubes[assay]
+            target = _pcr_well(plan, first, well)
+            singlechannel.pick_up_tip()
+            singlechannel.aspirate(control_volume, labware['tubes'], source,
+                                   OFFSETS['tubes'])
+            singlechannel.dispense(control_volume, pcr, target,
+                                   OFFSETS['pcr'])
+            singlechannel.mix(mix_repetitions, mix_volume, pcr, target,
+                              OFFSETS['pcr'])
+            singlechannel.blowout(pcr, target)
+            singlechannel.drop_tip()
+
+    data['commands'] = commands
+    _describe(data, plan, assays, replicates, labware, tubes,
+              mastermix_volume + disposal, sample_volume, control_volume)
+    return data, plan
+
+
+def _tubes(assays) -> Dict[str, str]:
+    """ Tube rack well of the water and of each assay's positive control """
+    tubes = {'water': 'A1'}
+    for i, assay in enumerate(assays):
+        tubes[assay] = 'A{}'.format(i + 2)
+    return tubes
+
+
+def _describe(data, plan, assays, replicates, labware, tubes,
+              mastermix_volume, sample_volume, control_volume):
+    """ Fill in the metadata and the designer's liquids for [plan] """
+    blocks = len(plan.blocks)
+    name = 'Station_C_{}_{}'.format(len(plan.samples), '_'.join(assays))
+    data['metadata'] = OrderedDict(data['metadata'],
+                                   protocolName=name, description=(
+        '{} samples, assays {}, {} replicate(s), controls {}'.format(
+            len(plan.samples), ', '.join(assays), replicates,
+            ', '.join('{} in {}'.format(*c) for c in plan.controls.items()))))
+
+    ingredients = OrderedDict()
+    locations = OrderedDict()
+
+    def liquid(ingredient, serialize=False):
+        key = str(len(ingredients))
+        ingredients[key] = OrderedDict((
+            ('name', ingredient), ('description', None),
+            ('serialize', serialize), ('liquidGroupId', key)))
+        return key
+
+    def put(role, well, key, volume):
+        locations.setdefault(labware[role], OrderedDict())[well] = {
+            key: {'volume': volume}}
+
+    per_assay = mastermix_volume * plan.columns * replicates + DEAD_VOLUME
+    for i, assay in enumerate(assays):
+        key = liquid('{}_master_mix'.format(assay))
+        for row in ROW_NAMES:
+            put('mastermix', '{}{}'.format(row, i + 1), key, per_assay)
+    key = liquid('Sample', serialize=True)
+    for well in plan.samples:
+        put('samples', well, key, sample_volume * blocks + DEAD_VOLUME)
+    controls = list(plan.controls)
+    per_block = control_volume * replicates
+    put('tubes', tubes['water'], liquid('Nuclease_free_water'),
+        per_block * len(assays) * controls.count('NTC') + DEAD_VOLUME)
+    for assay in assays:
+        put('tubes', tubes[assay],
+            liquid('{}_positive_plasmid'.format(assay)),
+            per_block * controls.count('PTC') + DEAD_VOLUME)
+
+    designer = data['designerApplication']['data']
+    designer['ingredients'] = ingredients
+    designer['ingredLocations'] = locations
+    designer['dismissedWarnings'] = {'form': {}, 'timeline': {}}
+    designer['savedStepForms'] = OrderedDict(
+        (key, form) for key, form in designer['savedStepForms'].items()
+        if key == '__INITIAL_DECK_SETUP_STEP__')
+    designer['orderedStepIds'] = []
+
+
+def plate_map(plan) -> str:
+    """ The PCR plate as text, one cell per well """
+    cells = {}
+    for assay, replicate, first in plan.blocks:
+        tag = assay if len(set(b[1] for b in plan.blocks)) == 1 else \
+            '{}.{}'.format(assay, replicate + 1)
+        for index, column in enumerate(plan.sources, first + 1):
+            for row in ROW_NAMES:
+                well = '{}{}'.format(row, column)
+                if well in plan.controls.values():
+                    name = next(c for c, w in plan.controls.items()
+                                if w == well)
+                elif well in plan.samples:
+                    name = 'S{}'.format(plan.samples.index(well) + 1)
+                else:
+                    continue
+                cells[row, index] = '{} {}'.format(tag, name)
+    width = max([len(cell) for cell in cells.values()] + [3])
+    lines = ['  ' + ' '.join(str(c).center(width)
+                             for c in range(1, PLATE_COLUMNS + 1))]
+    for row in ROW_NAMES:
+        lines.append(row + ' ' + ' '.join(
+            cells.get((row, c), '.').center(width)
+            for c in range(1, PLATE_COLUMNS + 1)))
+    return '\n'.join(lines)
+
+
+def tips_taken(protocol, commands) -> int:
+    """ Tips picked up by [commands], eight per multichannel pick up """
+    return sum(8 if 'multi' in protocol.pipettes[c['params']['pipette']]
+               ['name'] else 1
+               for c in commands if c['command'] == 'pickUpTip')
+
+
+def _control(text) -> Tuple[str, str]:
+    name, _, well = text.partition('=')
+    if name not in DEFAULT_CONTROLS or not well:
+        raise argparse.ArgumentTypeError(
+            'expected PTC=<well> or NTC=<well>, got {}'.format(text))
+    return name, well.upper()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--samples', type=int)
+    source.add_argument('--manifest', help='CSV sample manifest, see '
+                        'tools.manifest')
+    parser.add_argument('--max-single', type=int, default=1,
+                        help='with --manifest, move the samples of columns '
+                        'holding at most this many by the single channel')
+    parser.add_argument('--assays', nargs='+', default=['N1', 'Rp'])
+    parser.add_argument('--replicates', type=int, default=1)
+    parser.add_argument('--control', type=_control, action='append',
+                        help='control position in each block, e.g. NTC=H6')
+    parser.add_argument('-o', '--output', default='station_c.json')
+    parser.add_argument('--model', help='JSON file of cost model overrides')
+    args = parser.parse_args(argv)
+
+    model = CostModel.from_json(args.model) if args.model else None
+    controls = OrderedDict(args.control) if args.control else None
+    if args.manifest and controls:
+        parser.error('--control is taken from the manifest')
+    try:
+        manifest = read_manifest(args.manifest) if args.manifest else None
+        data, plan = generate(args.samples, args.assays, args.replicates,
+                              controls, manifest=manifest,
+                              max_single=args.max_single)
+    except ValueError as error:
+        parser.error(str(error))
+    full = None
+    if manifest is not None:
+        # what the plate costs without a manifest: every well of the
+        # columns up to the last occupied one
+        last = max(plan.sources)
+        try:
+            full, _ = generate(len(ROW_NAMES) * last - len(plan.controls),
+                               args.assays, args.replicates,
+                               plan.controls or None)
+        except ValueError as error:
+            full_error = error
+    protocol = Protocol(data)
+    write(protocol, data['commands'], args.output)
+
+    out = sys.stdout
+    out.write(plate_map(plan) + '\n\n')
+    columns = len({int(well[1:]) for well in plan.samples
+                   if well not in plan.singles})
+    transfers = len(plan.blocks) * (columns + len(plan.singles))
+    single = len(plan.samples) * len(plan.blocks)
+    out.write('sample transfers: {} aspirates instead of {} single channel '
+              'ones ({:.1f}x fewer)'.format(transfers, single,
+                                           single / transfers))
+    if plan.singles:
+        out.write(', {} of them single channel'.format(
+            len(plan.blocks) * len(plan.singles)))
+    out.write('\n')
+    seconds = estimate(protocol, data['commands'], model)
+    out.write('{} commands, {} tips, {} predicted, written to {}\n'.format(
+        len(data['commands']), tips_used(data['commands']),
+        format_seconds(seconds), args.output))
+    if full is not None:
+        out.write(savings(
+            seconds, tips_taken(protocol, data['commands']),
+            estimate(Protocol(full), full['commands'], model),
+            tips_taken(Protocol(full), full['commands'])) + '\n')
+    elif manifest is not None:
+        out.write('without the manifest the plate does not fit: {}\n'.format(
+            full_error))
+
+
+if __name__ == '__main__':
+    main()
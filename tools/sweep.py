@@ -0,0 +1,146 @@
+"""
+Simulate protocols over a grid of parameter values on all CPU cores.
+
+    python -m tools.sweep "RNA Extraction (BOMB) V10.py" \\
+        "Beckman Coulter RNAdvance Viral XP V1.py" > sweep.csv
+    python -m tools.sweep "RNA Extraction (BOMB) V10.py" --columns 12 \\
+        --param MIX_REPETITIONS=10,15 --param SETTLE_SECONDS=60,90,120
+
+Every combination of --columns, --test-mode and the --param values is
+simulated for every protocol, the parameters being injected as in
+tools.runner, so the USER DEFINED VALUES block and the constants set in it
+or in an ``if test_mode`` block stay untouched. The simulations run in a
+pool of --jobs processes and their results come back as one CSV table in
+the order of the grid: robot time, commands, tips, the reagent volume
+taken from the trough into the plate and the liquid moved by transfers. Fresh tip racks are loaded
+instead of running out, as in tools.tip_plan. A run the protocol stops with
+an exception keeps its row, with the error. Runs come from tools.cache when
+neither the protocol nor the simulator changed since they were stored.
+"""
+
+import argparse
+import ast
+import csv
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Dict, List
+
+from .cache import lookup
+from .runner import parameters
+from .trips import is_trip
+
+
+def grid(protocols, axes: Dict[str, list]) -> List[tuple]:
+    """ (protocol, params) for every protocol and combination of [axes] """
+    return [(protocol, OrderedDict(zip(axes, values)))
+            for protocol in protocols for values in product(*axes.values())]
+
+
+def trough_volume(commands) -> float:
+    """ Volume aspirated from the trough and then dispensed outside it: the
+    reagent the plate received, without the resuspend strokes, which go back
+    into the trough, or the air gaps """
+    drawn = held = 0.0
+    for command in commands:
+        if command.name == 'aspirate' and command.labware == 'trough' \
+                and 'air_gap' not in command.context:
+            held += command.volume
+        elif command.name == 'dispense':
+            if command.labware != 'trough':
+                drawn += held
+            held = 0.0
+    return drawn
+
+
+def run(job) -> OrderedDict:
+    """ Simulate one (protocol, params) [job] into a table row """
+    protocol, params = job
+    entry = lookup(protocol, params, extra_tip_racks=True,
+                   allow_failure=True)
+    result, tips = entry['run'], entry['tips']
+    row = OrderedDict(protocol=protocol)
+    row.update(params)
+    row.update((
+        ('robot seconds', round(result.duration, 1)),
+        ('commands', len(result.commands)),
+        ('new tips', tips['new tips']),
+        ('reused tips', tips['reused tips']),
+        ('racks used', tips['racks used']),
+        ('trough ul', round(trough_volume(result.commands), 1)),
+        ('transfer ul', round(sum(c.volume for i, c in enumerate(
+            result.commands) if is_trip(result.commands, i)), 1)),
+        ('error', result.error),
+    ))
+    return row
+
+
+def sweep(jobs, processes=None) -> List[OrderedDict]:
+    """ Rows for [jobs], simulated in [processes] worker processes (all
+    cores by default), in the order of [jobs] """
+    if processes == 1:
+        return [run(job) for job in jobs]
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(run, jobs))
+
+
+def _value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def parse_param(text):
+    """ 'NAME=1,2,3' -> ('NAME', [1, 2, 3]); 'NAME=1-12' is a range of
+    integers, and values that are not Python literals stay strings """
+    name, sep, values = text.partition('=')
+    if not sep or not name or not values:
+        raise argparse.ArgumentTypeError(
+            'expected NAME=VALUE[,VALUE...], got {!r}'.format(text))
+    first, dash, last = values.partition('-')
+    if dash and first.isdigit() and last.isdigit():
+        return name, list(range(int(first), int(last) + 1))
+    return name, [_value(value) for value in values.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('--columns', type=int, nargs='+',
+                        default=list(range(1, 13)))
+    parser.add_argument('--test-mode', type=_value, nargs='+',
+                        default=[False, True], choices=[False, True],
+                        help='test_mode values (default both)')
+    parser.add_argument('--param', type=parse_param, action='append',
+                        default=[], metavar='NAME=VALUES',
+                        help='another parameter to sweep, e.g. '
+                             'MIX_REPETITIONS=10,15; may be repeated')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='worker processes (default: all cores)')
+    args = parser.parse_args(argv)
+
+    axes = OrderedDict((('number_of_sample_columns', args.columns),
+                        ('test_mode', args.test_mode)))
+    axes.update(args.param)
+    for protocol in args.protocols:
+        missing = set(axes) - set(parameters(protocol))
+        if missing:
+            parser.error('{} has no parameter {}'.format(
+                protocol, ', '.join(sorted(missing))))
+
+    jobs = grid(args.protocols, axes)
+    start = time.perf_counter()
+    rows = sweep(jobs, args.jobs)
+    sys.stderr.write('{} simulations in {:.1f} s on {} processes\n'.format(
+        len(jobs), time.perf_counter() - start, args.jobs))
+    writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
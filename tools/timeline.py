@@ -0,0 +1,222 @@
+"""
+Timeline of a Station B run per step and per sample column.
+
+    python -m tools.timeline "RNA Extraction (BOMB) V10.py" --columns 6 12 \\
+        --html timeline.html > timeline.csv
+
+A run is split into steps at the ``Step: <name>`` comments the protocols
+issue through start_step(). Within a step, each command belongs to the
+sample column of the next plate well the pipette goes to, so the tip pick
+up and trough aspirate serving a column count towards it; magnet settling,
+incubations and robot actions belong to the step as a whole. The CSV gives
+the start, end and seconds per category of every (step, column); the HTML
+page draws one Gantt chart per column count on a shared time scale.
+"""
+
+import argparse
+import csv
+import html
+import sys
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+
+from .estimate_runtime import CATEGORIES, label_categories
+from .cache import simulate
+from .timing import format_seconds
+
+STEP_PREFIX = 'Step: '
+SETUP_STEP = 'setup'
+
+# labware whose wells are not tied to one sample column
+SHARED_LABWARE = ('trough', 'trash')
+# categories spent on the step as a whole rather than on one column
+STEP_WIDE = ('magdeck settling', 'delay', 'robot')
+
+COLOURS = OrderedDict((
+    ('tip handling', '#e6a23c'),
+    ('mixing', '#409eff'),
+    ('delay', '#909399'),
+    ('magdeck settling', '#8e44ad'),
+    ('blow_air', '#67c23a'),
+    ('liquid handling', '#1abc9c'),
+    ('robot', '#606266'),
+))
+
+CHART_WIDTH = 1100
+LANE_HEIGHT = 26
+LABEL_WIDTH = 130
+TICKS = (60, 300, 600, 1200, 1800, 3600)
+
+
+class Span(NamedTuple):
+    """ Consecutive commands of one step, column and category """
+
+    step: str
+    column: Optional[int]
+    category: str
+    start: float
+    end: float
+
+
+def _column_of(command, tip_racks) -> Optional[int]:
+    if (command.name != 'move_to' or command.labware in SHARED_LABWARE
+            or command.labware in tip_racks):
+        return None
+    return int(command.well[1:])
+
+
+def label(commands) -> List[tuple]:
+    """ (command, step, column, category) for each of the timed [commands] """
+    tip_racks = {c.labware for c in commands
+                 if c.name in ('pick_up_tip', 'drop_tip', 'return_tip')}
+    labelled = []
+    step = SETUP_STEP
+    for command, category in label_categories(commands):
+        if command.name == 'comment' and command.text.startswith(STEP_PREFIX):
+            step = command.text[len(STEP_PREFIX):]
+        labelled.append([command, step, _column_of(command, tip_racks),
+                         category])
+
+    # a command serves the column of the next plate well in its step, or
+    # of the last one when no other follows
+    following = None
+    for i in range(len(labelled) - 1, -1, -1):
+        if i + 1 < len(labelled) and labelled[i + 1][1] != labelled[i][1]:
+            following = None
+        if labelled[i][2] is not None:
+            following = labelled[i][2]
+        labelled[i][2] = following
+    step = last = None
+    for entry in labelled:
+        if entry[1] != step:
+            step, last = entry[1], None
+        if entry[2] is None:
+            entry[2] = last
+        last = entry[2]
+        if entry[3] in STEP_WIDE:
+            entry[2] = None
+    return [tuple(entry) for entry in labelled]
+
+
+def spans(commands) -> List[Span]:
+    """ The labelled [commands] merged into spans for the chart """
+    merged = []
+    for command, step, column, category in label(commands):
+        if command.duration <= 0:
+            continue
+        if merged and merged[-1][:3] == (step, column, category) \
+                and abs(merged[-1].end - command.start) < 1e-6:
+            merged[-1] = merged[-1]._replace(end=command.end)
+        else:
+            merged.append(Span(step, column, category, command.start,
+                               command.end))
+    return merged
+
+
+def summary(commands, columns=None) -> List[OrderedDict]:
+    """ CSV rows: start, end and seconds per category of each step/column """
+    rows = OrderedDict()
+    for command, step, column, category in label(commands):
+        key = (step, '' if column is None else column)
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = OrderedDict((
+                ('columns', columns), ('step', step), ('column', key[1]),
+                ('start', command.start), ('end', command.end),
+                ('seconds', 0.0)))
+            row.update((c, 0.0) for c in CATEGORIES)
+        row['end'] = max(row['end'], command.end)
+        row['seconds'] += command.duration
+        row[category] += command.duration
+    for row in rows.values():
+        for key in ('start', 'end', 'seconds') + CATEGORIES:
+            row[key] = round(row[key], 1)
+    return list(rows.values())
+
+
+def _svg(run_spans, total, scale) -> str:
+    steps = list(OrderedDict.fromkeys(span.step for span in run_spans))
+    height = (len(steps) + 1) * LANE_HEIGHT
+    width = LABEL_WIDTH + CHART_WIDTH
+    parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" '
+             'font-family="sans-serif" font-size="11">'.format(width, height)]
+
+    tick = next((t for t in TICKS if total / t <= 20), TICKS[-1])
+    for seconds in range(0, int(total) + 1, tick):
+        x = LABEL_WIDTH + seconds * scale
+        parts.append('<line x1="{0:.1f}" y1="0" x2="{0:.1f}" y2="{1}" '
+                     'stroke="#ddd"/>'.format(x, height - LANE_HEIGHT))
+        parts.append('<text x="{:.1f}" y="{}" text-anchor="middle">{}</text>'
+                     .format(x, height - 8, format_seconds(seconds)[:-3]))
+
+    for lane, step in enumerate(steps):
+        y = lane * LANE_HEIGHT
+        parts.append('<text x="4" y="{}">{}</text>'.format(
+            y + 17, html.escape(step)))
+        for span in run_spans:
+            if span.step != step:
+                continue
+            x = LABEL_WIDTH + span.start * scale
+            w = max((span.end - span.start) * scale, 0.5)
+            odd = span.column is not None and span.column % 2
+            title = '{}, column {}: {} {} to {}'.format(
+                step, '-' if span.column is None else span.column,
+                span.category, format_seconds(span.start),
+                format_seconds(span.end))
+            parts.append(
+                '<rect x="{:.2f}" y="{}" width="{:.2f}" height="{}" fill="{}" '
+                'fill-opacity="{}"><title>{}</title></rect>'.format(
+                    x, y + 4, w, LANE_HEIGHT - 8, COLOURS[span.category],
+                    0.7 if odd else 1.0, html.escape(title)))
+            if span.column is not None and w > 14:
+                parts.append('<text x="{:.1f}" y="{}" fill="#fff" '
+                             'text-anchor="middle">{}</text>'.format(
+                                 x + w / 2, y + 17, span.column))
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+def write_html(protocol, runs, out):
+    """ Gantt charts of [runs], (column count, commands, total) tuples """
+    longest = max(total for _, _, total in runs)
+    scale = CHART_WIDTH / longest if longest else 1.0
+    out.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+              '<title>{0}</title></head><body style="font-family:sans-serif">'
+              '\n<h1>{0}</h1>\n<p>'.format(html.escape(str(protocol))))
+    out.write(' '.join(
+        '<span style="background:{};color:#fff;padding:2px 6px">{}</span>'
+        .format(colour, category) for category, colour in COLOURS.items()))
+    out.write('</p>\n')
+    for columns, commands, total in runs:
+        out.write('<h2>{} columns: {}</h2>\n'.format(
+            columns, format_seconds(total)))
+        out.write(_svg(spans(commands), total, scale) + '\n')
+    out.write('</body></html>\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol')
+    parser.add_argument('--columns', type=int, nargs='+', default=[6, 12])
+    parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('--html', type=argparse.FileType('w'),
+                        help='write the Gantt charts to this HTML file')
+    args = parser.parse_args(argv)
+
+    runs = []
+    writer = None
+    for n in args.columns:
+        run = simulate(args.protocol, {'number_of_sample_columns': n,
+                                       'test_mode': args.test_mode})
+        runs.append((n, run.commands, run.duration))
+        rows = summary(run.commands, n)
+        if writer is None:
+            writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+            writer.writeheader()
+        writer.writerows(rows)
+    if args.html:
+        write_html(args.protocol, runs, args.html)
+
+
+if __name__ == '__main__':
+    main()
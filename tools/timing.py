@@ -0,0 +1,184 @@
+"""
+Per-command cost model and virtual-time replay of a command stream.
+
+The defaults describe an OT-2 with a gen1 multichannel and are meant to be
+calibrated against a timed run: save a JSON file with the fields to change
+and load it with :meth:`CostModel.from_json`.
+"""
+
+import json
+import math
+from dataclasses import asdict, dataclass, fields
+from typing import Iterable
+
+HOME_POSITION = (418.0, 353.0)
+
+
+@dataclass
+class CostModel:
+    """ Seconds (or mm/s) charged for each kind of robot action """
+
+    xy_speed: float = 400.0          # gantry travel, mm/s
+    x_speed: float = 600.0           # per-axis limits of the gantry, mm/s
+    y_speed: float = 400.0
+    z_speed: float = 125.0           # mount travel, mm/s
+    move_overhead: float = 0.08      # acceleration/settling per move segment
+    arc_z: float = 130.0             # travel height of arc moves
+    home_z: float = 170.0            # mount height after a z home
+    plunger_overhead: float = 0.15   # per aspirate/dispense
+    blow_out: float = 0.8
+    pick_up_tip: float = 3.5         # presses, shake-off and z home
+    drop_tip: float = 2.5
+    home: float = 12.0
+    magdeck: float = 3.0             # engage or disengage travel
+    tempdeck_heating: float = 0.2    # degC/s
+    tempdeck_cooling: float = 0.05   # degC/s
+    ambient: float = 22.0            # tempdeck start temperature, degC
+    pause: float = 0.0               # operator time is not modelled
+
+    @classmethod
+    def from_json(cls, path) -> 'CostModel':
+        with open(path) as f:
+            values = json.load(f)
+        known = {f.name for f in fields(cls)}
+        unknown = set(values) - known
+        if unknown:
+            raise ValueError('Unknown cost model fields: {}'.format(
+                ', '.join(sorted(unknown))))
+        return cls(**values)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def head_speeds(self) -> dict:
+        """ Default speeds in the keys of ``robot.head_speed``; z and a are
+        the left and right mounts """
+        return {'combined_speed': self.xy_speed, 'x': self.x_speed,
+                'y': self.y_speed, 'z': self.z_speed, 'a': self.z_speed}
+
+    def move(self, start, end, strategy, speeds=None, mount='a') -> float:
+        """ Travel time from [start] to [end] under the head [speeds] """
+        speeds = speeds or self.head_speeds()
+        dx, dy = end[0] - start[0], end[1] - start[1]
+        xy = math.hypot(dx, dy)
+        xy_time = max(xy / speeds['combined_speed'], abs(dx) / speeds['x'],
+                      abs(dy) / speeds['y'])
+        z_speed = speeds[mount]
+        if strategy == 'arc' and xy > 0:
+            top = max(self.arc_z, start[2], end[2])
+            return ((top - start[2]) / z_speed + xy_time
+                    + (top - end[2]) / z_speed + 3 * self.move_overhead)
+        dz = abs(end[2] - start[2])
+        if xy == 0 and dz == 0:
+            return 0.0
+        return max(xy_time, dz / z_speed) + self.move_overhead
+
+    def ramp(self, start, end) -> float:
+        """ Seconds for the tempdeck to go from [start] to [end] degC """
+        rate = self.tempdeck_heating if end > start else self.tempdeck_cooling
+        return abs(end - start) / rate
+
+    def plunger(self, volume, flow_rate) -> float:
+        if volume <= 0:
+            return 0.0
+        return volume / flow_rate + self.plunger_overhead
+
+
+def _mount_axis(command) -> str:
+    """ The head_speed key of the mount moving for [command] """
+    return 'z' if command.pipette.endswith('(left)') else 'a'
+
+
+class Replay:
+    """ Virtual-time replay that can be fed a command stream as it grows,
+    so a simulated protocol can read the time its commands so far take """
+
+    def __init__(self, model: CostModel):
+        self.model = model
+        self.position = HOME_POSITION + (model.home_z,)
+        self.clock = 0.0
+        self.speeds = model.head_speeds()
+        # slot -> (temperature when the target was set, time it was set, target)
+        self.tempdecks = {}
+
+    def _temperature(self, slot):
+        model = self.model
+        start, since, target = self.tempdecks.get(
+            slot, (model.ambient, 0.0, model.ambient))
+        ramp = model.ramp(start, target)
+        if ramp <= self.clock - since:
+            return target
+        return start + (target - start) * (self.clock - since) / ramp
+
+    def feed(self, commands: Iterable) -> float:
+        """ Stamp [commands] with virtual start times and durations following
+        the ones fed before, return the total so far """
+        model = self.model
+        position = self.position
+        speeds = self.speeds
+        for command in commands:
+            name = command.name
+            if name == 'move_to':
+                duration = model.move(position, command.point,
+                                      command.strategy, speeds,
+                                      _mount_axis(command))
+                position = command.point
+            elif name == 'head_speed':
+                duration = 0.0
+                speeds = dict(speeds, **command.speeds)
+            elif name in ('aspirate', 'dispense'):
+                duration = model.plunger(command.volume, command.flow_rate)
+            elif name == 'mix':
+                duration = command.repetitions * (
+                    model.plunger(command.volume, command.flow_rate)
+                    + model.plunger(command.volume,
+                                    command.dispense_flow_rate))
+            elif name == 'blow_out':
+                duration = model.blow_out
+            elif name == 'pick_up_tip':
+                duration = model.pick_up_tip
+            elif name in ('drop_tip', 'return_tip'):
+                duration = model.drop_tip
+            elif name == 'home_z':
+                duration = (model.home_z - position[2]) / speeds[
+                    _mount_axis(command)]
+                position = position[:2] + (model.home_z,)
+            elif name == 'home':
+                duration = model.home
+                position = HOME_POSITION + (model.home_z,)
+            elif name in ('delay', 'touch_tip'):
+                duration = command.seconds
+            elif name in ('magdeck_engage', 'magdeck_disengage'):
+                duration = model.magdeck
+            elif name in ('tempdeck_set', 'tempdeck_deactivate'):
+                duration = 0.0
+                target = command.temperature
+                self.tempdecks[command.slot] = (
+                    self._temperature(command.slot), self.clock,
+                    model.ambient if target is None else target)
+            elif name == 'tempdeck_wait':
+                target = self.tempdecks.get(
+                    command.slot, (0, 0, model.ambient))[2]
+                duration = model.ramp(self._temperature(command.slot),
+                                      target)
+            elif name == 'pause':
+                duration = model.pause
+            else:
+                duration = 0.0
+            command.start = self.clock
+            command.duration = duration
+            self.clock += duration
+        self.position = position
+        self.speeds = speeds
+        return self.clock
+
+
+def replay(commands: Iterable, model: CostModel) -> float:
+    """ Stamp [commands] with virtual start times and durations, return the total """
+    return Replay(model).feed(commands)
+
+
+def format_seconds(seconds: float) -> str:
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, secs)
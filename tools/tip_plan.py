@@ -0,0 +1,121 @@
+"""
+Report the tips and tip racks a protocol needs for a range of column counts.
+
+    python -m tools.tip_plan "RNA Extraction (BOMB) V10.py"
+    python -m tools.tip_plan "RNA Extraction (BOMB) V10.py" \\
+        --rules '{"reagent": "until_sample", "sample": null}'
+
+The protocol's own TIP_RULES decide which tips are reused; --rules replaces
+them for the run. A fresh rack is loaded whenever the protocol would run out,
+so rule sets needing more racks than the deck holds are still counted.
+
+'racks needed' counts the pipette's racks that fresh tips were taken from;
+the Station B protocols load that many, read from their TIP_RACKS_NEEDED
+table. --table prints the table for the protocol's rules:
+
+    python -m tools.tip_plan "RNA Extraction (BOMB) V10.py" --table
+"""
+
+import argparse
+import csv
+import json
+import sys
+from collections import OrderedDict
+from typing import Iterable
+
+from .estimate_runtime import categorize
+from .cache import simulate
+from .timing import format_seconds
+
+TIME_COLUMNS = ('tip handling', 'total')
+
+
+def count_tips(commands: Iterable) -> OrderedDict:
+    """ New tips, reused tips and tip racks used by a command stream """
+    seen = set()
+    racks = set()
+    counts = OrderedDict((('new tips', 0), ('reused tips', 0)))
+    for command in commands:
+        if command.name != 'pick_up_tip':
+            continue
+        tip = (command.slot, command.labware, command.well)
+        if tip in seen:
+            counts['reused tips'] += 1
+        else:
+            seen.add(tip)
+            racks.add(tip[:2])
+            counts['new tips'] += 1
+    counts['racks used'] = len(racks)
+    return counts
+
+
+def racks_needed(run) -> int:
+    """ The pipette tip racks [run] took fresh tips from """
+    picked = set((command.slot, command.labware) for command in run.commands
+                 if command.name == 'pick_up_tip')
+    return sum(1 for rack in run.tip_racks
+               if (rack.slot, rack.label) in picked)
+
+
+def plan(protocol, columns=range(1, 13), test_mode=False, rules=None):
+    """ Rows of tip counts and tip handling time for each column count """
+    rows = []
+    for n in columns:
+        params = {'number_of_sample_columns': n, 'test_mode': test_mode}
+        if rules is not None:
+            params['TIP_RULES'] = rules
+        run = simulate(protocol, params, extra_tip_racks=True)
+        row = OrderedDict(columns=n)
+        row.update(count_tips(run.commands))
+        row['racks needed'] = racks_needed(run)
+        row['racks loaded'] = sum(1 for labware in run.labware
+                                  if labware.is_tiprack)
+        row['tip handling'] = categorize(run.commands)['tip handling']
+        row['total'] = run.duration
+        rows.append(row)
+    return rows
+
+
+def print_table(rows, out=sys.stdout):
+    headers = list(rows[0])
+    widths = [max(len(h), 8) for h in headers]
+    out.write('  '.join(h.rjust(w) for h, w in zip(headers, widths)) + '\n')
+    for row in rows:
+        cells = []
+        for key, width in zip(headers, widths):
+            value = row[key]
+            if key in TIME_COLUMNS:
+                value = format_seconds(value)
+            cells.append(str(value).rjust(width))
+        out.write('  '.join(cells) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol')
+    parser.add_argument('--columns', type=int, nargs='+',
+                        default=list(range(1, 13)))
+    parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('--rules', type=json.loads,
+                        help='JSON object replacing the TIP_RULES of the '
+                        'protocol')
+    parser.add_argument('--csv', action='store_true',
+                        help='write seconds as CSV instead of a table')
+    parser.add_argument('--table', action='store_true',
+                        help='print the TIP_RACKS_NEEDED line of the protocol')
+    args = parser.parse_args(argv)
+
+    rows = plan(args.protocol, args.columns, args.test_mode, args.rules)
+    if args.table:
+        print('TIP_RACKS_NEEDED = {}'.format(
+            [row['racks needed'] for row in rows]))
+    elif args.csv:
+        writer = csv.DictWriter(sys.stdout, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Trips per step of a Station B run, and what another tip type would save.
+
+    python -m tools.trips "RNA Extraction (BOMB) V10.py" --columns 12
+    python -m tools.trips "Beckman Coulter RNAdvance Viral XP V1.py" \\
+        --tips opentrons_96_tiprack_300ul
+
+The protocols move every transfer larger than a tip in the fewest even trips
+(see TripPlan), so the tips' volume decides how many trips a step takes.
+This simulates the run with the protocol's tip_rack_type and again with
+each of --tips loaded in the same slots, and prints per step the transfer
+trips and the time of each. A tip type is only compared if the run fits
+the deck with it, i.e. needs no more racks than the protocol loads.
+"""
+
+import argparse
+import sys
+from collections import OrderedDict
+from typing import Dict
+
+from .deck import LABWARE_DEFINITIONS
+from .cache import simulate
+from .timeline import label
+from .timing import format_seconds
+
+DEFAULT_ALTERNATIVE = 'opentrons_96_tiprack_300ul'
+
+
+def is_trip(commands, i) -> bool:
+    """ True if [commands][i] aspirates the liquid of a trip: a transfer's
+    aspirate, or one the protocol follows with an air gap itself, as
+    TripPlan.remove does (not an air gap, mix or resuspend stroke) """
+    command = commands[i]
+    if command.name != 'aspirate' or 'air_gap' in command.context:
+        return False
+    if command.context == 'transfer':
+        return True
+    for j in range(i + 1, len(commands)):
+        later = commands[j]
+        if later.name in ('aspirate', 'dispense'):
+            return later.name == 'aspirate' and 'air_gap' in later.context
+    return False
+
+
+def trips(commands) -> Dict[str, int]:
+    """ Liquid aspirates of trips (see is_trip) per step """
+    commands = list(commands)
+    counts = OrderedDict()
+    for i, (command, step, _, _) in enumerate(label(commands)):
+        counts.setdefault(step, 0)
+        if is_trip(commands, i):
+            counts[step] += 1
+    return counts
+
+
+def seconds(commands) -> Dict[str, float]:
+    """ Seconds per step """
+    totals = OrderedDict()
+    for command, step, _, _ in label(commands):
+        totals[step] = totals.get(step, 0.0) + command.duration
+    return totals
+
+
+def tip_label(rack) -> str:
+    """ 'opentrons_96_tiprack_300ul' -> '300 ul tips' """
+    volume = LABWARE_DEFINITIONS.get(rack, {}).get('tip_volume')
+    return '{} ul tips'.format(volume) if volume else rack
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('protocol')
+    parser.add_argument('--columns', type=int, default=12)
+    parser.add_argument('--test-mode', action='store_true')
+    parser.add_argument('--tips', nargs='+', default=[DEFAULT_ALTERNATIVE],
+                        help='tip rack load names to compare')
+    args = parser.parse_args(argv)
+
+    params = {'number_of_sample_columns': args.columns,
+              'test_mode': args.test_mode}
+    base = simulate(args.protocol, params)
+    base_rack = next(labware.name for labware in base.labware
+                     if labware.is_tiprack)
+    runs = [(tip_label(base_rack), base)]
+    out = sys.stdout
+    for rack in args.tips:
+        if rack not in LABWARE_DEFINITIONS:
+            parser.error('unknown tip rack {}'.format(rack))
+        run = simulate(args.protocol, dict(params, tip_rack_type=rack),
+                       allow_failure=True)
+        if run.error:
+            out.write('{} do not fit: {}\n'.format(tip_label(rack), run.error))
+        else:
+            runs.append((tip_label(rack), run))
+
+    counts = [trips(run.commands) for _, run in runs]
+    times = [seconds(run.commands) for _, run in runs]
+    headers = ['step'] + ['{} trips, time'.format(name) for name, _ in runs] \
+        + ['saves with {}'.format(name) for name, _ in runs[1:]]
+    rows = []
+    for step in times[0]:
+        row = [step] + ['{:>4}  {}'.format(count.get(step, 0), format_seconds(
+            time.get(step, 0.0))) for count, time in zip(counts, times)]
+        row += [format_seconds(times[0][step] - time.get(step, 0.0))
+                for time in times[1:]]
+        rows.append(row)
+    rows.append(['total'] + ['{:>4}  {}'.format(sum(count.values()),
+                                               format_seconds(run.duration))
+                             for count, (_, run) in zip(counts, runs)]
+                + [format_seconds(base.duration - run.duration)
+                   for _, run in runs[1:]])
+
+    widths = [max(len(str(row[i])) for row in [headers] + rows)
+              for i in range(len(headers))]
+    for row in [headers] + rows:
+        out.write('  '.join(str(cell).ljust(width) if i == 0 else
+                            str(cell).rjust(width)
+                            for i, (cell, width) in enumerate(zip(row, widths)))
+                  + '\n')
+
+
+if __name__ == '__main__':
+    main()